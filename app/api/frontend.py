@@ -0,0 +1,165 @@
+"""Serving of the built frontend: cached index, precompressed and cacheable assets.
+
+Run ``python -m app.api.frontend static`` after a frontend build to write
+the ``.gz``/``.br`` variants ahead of time; the app also does it on startup
+when ``ZKTECO_PRECOMPRESS_STATIC`` is set.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+from fastapi.responses import Response
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip variants are always written
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.html', '.js', '.css', '.svg', '.json', '.map', '.txt')
+MIN_COMPRESS_SIZE = 1024
+
+# Vite names built assets <name>-<8 character content hash>.<ext>
+HASHED_ASSET = re.compile(r'(^|/)assets/.+-[A-Za-z0-9_-]{8}\.\w+$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+
+def accepted_encodings(headers: Headers) -> list:
+    """Return the precompressed encodings the client accepts, best first."""
+    accept = headers.get('accept-encoding', '')
+    tokens = {token.split(';')[0].strip() for token in accept.split(',')}
+    return [encoding for encoding in ('br', 'gzip')
+            if encoding in tokens and (encoding != 'br' or brotli is not None)]
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(directory: str) -> int:
+    """Write missing or stale ``.gz``/``.br`` variants of compressible files.
+
+    Returns the number of variants written.
+    """
+    suffixes = {'gzip': '.gz', 'br': '.br'}
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS) or \
+                    os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+            mtime = os.path.getmtime(path)
+            data = None
+            for encoding in encodings:
+                variant = path + suffixes[encoding]
+                if os.path.exists(variant) and os.path.getmtime(variant) >= mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                with open(variant + '.tmp', 'wb') as f:
+                    f.write(compress(data, encoding))
+                os.replace(variant + '.tmp', variant)
+                written += 1
+    return written
+
+
+class FrontendStaticFiles(StaticFiles):
+    """StaticFiles serving precompressed variants with cache headers.
+
+    Content-hashed assets are cacheable forever; everything else must be
+    revalidated, which ETag/If-None-Match turns into a 304.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        path = str(full_path)
+        headers = {'Cache-Control': IMMUTABLE_CACHE if HASHED_ASSET.search(path.replace(os.sep, '/'))
+                   else REVALIDATE_CACHE}
+
+        response = None
+        if path.endswith(COMPRESSIBLE_EXTENSIONS):
+            headers['Vary'] = 'Accept-Encoding'
+            media_type = mimetypes.guess_type(path)[0] or 'text/plain'
+            suffixes = {'br': '.br', 'gzip': '.gz'}
+            for encoding in accepted_encodings(request_headers):
+                try:
+                    variant_stat = os.stat(path + suffixes[encoding])
+                except FileNotFoundError:
+                    continue
+                if variant_stat.st_mtime < stat_result.st_mtime:
+                    continue  # Stale variant of a rebuilt file
+                response = FileResponse(
+                    path + suffixes[encoding], status_code=status_code,
+                    stat_result=variant_stat, media_type=media_type,
+                    headers={**headers, 'Content-Encoding': encoding})
+                break
+
+        if response is None:
+            response = FileResponse(path, status_code=status_code,
+                                    stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class CachedIndex:
+    """``index.html`` kept in memory, reloaded when the file's mtime changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = None
+        self._bodies = {}
+        self._etag = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        """Reload the index if it changed on disk."""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, 'rb') as f:
+                body = f.read()
+            bodies = {None: body, 'gzip': compress(body, 'gzip')}
+            if brotli is not None:
+                bodies['br'] = compress(body, 'br')
+            self._bodies = bodies
+            self._etag = f'"{hashlib.md5(body).hexdigest()}"'
+            self._mtime = mtime
+
+    def response(self, request_headers: Headers) -> Response:
+        """Return the index, a compressed variant of it, or a 304."""
+        self._load()
+        headers = {'ETag': self._etag, 'Cache-Control': REVALIDATE_CACHE,
+                   'Vary': 'Accept-Encoding'}
+        if_none_match = request_headers.get('if-none-match')
+        if if_none_match and self._etag in [tag.strip().removeprefix('W/')
+                                            for tag in if_none_match.split(',')]:
+            return Response(status_code=304, headers=headers)
+        for encoding in accepted_encodings(request_headers):
+            if encoding in self._bodies:
+                return Response(self._bodies[encoding], media_type='text/html',
+                                headers={**headers, 'Content-Encoding': encoding})
+        return Response(self._bodies[None], media_type='text/html', headers=headers)
+
+
+frontend_index = CachedIndex(os.path.join("static", "index.html"))
+
+
+if __name__ == '__main__':
+    for directory in sys.argv[1:] or ['static']:
+        print(f"{directory}: wrote {precompress(directory)} compressed variants")
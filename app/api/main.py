@@ -3,6 +3,9 @@ from app.api.routes.welcome.main import router as welcome
 from app.api.routes.attendance.main import router as attendance
 from app.api.routes.users.main import router as users
 from app.api.routes.test.main import router as test
+from app.api.routes.poll.main import router as poll
+from app.api.routes.reports.main import router as reports
+from app.api.routes.metrics.main import router as metrics
 from app.api.routes.serve_frontend.main import router as serve_frontend
 
 
@@ -11,5 +14,8 @@ api_router.include_router(welcome, tags=["welcome"])
 api_router.include_router(attendance, tags=["attendance"])
 api_router.include_router(users, tags=["users"])
 api_router.include_router(test, tags=["test"])
+api_router.include_router(poll, tags=["poll"])
+api_router.include_router(reports, tags=["reports"])
+api_router.include_router(metrics, tags=["metrics"])
 api_router.include_router(serve_frontend, tags=["serve-frontend"])
 prefix_v1 = "/api/v1"
@@ -0,0 +1,14 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, for large trusted payloads.
+
+    Returning a response object bypasses the route's response_model
+    validation, while the model still documents the schema in OpenAPI.
+    Only use it for data the backend built itself in that shape.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
@@ -1,25 +1,247 @@
-from fastapi import APIRouter
+import asyncio
+import json
+import tempfile
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from app.models.device import DeviceSettings
-from app.models.attendance import AttendanceSettings, AttendanceResponse
+from typing import List, Literal
+from app.models.attendance import (AttendanceSettings, AttendanceResponse, ArchiveSettings,
+                                   ArchivedPunch)
 from app.zkteko.attendance.attendance_manager import AttendanceManager
+from app.models.batch import BatchSettings, BatchAttendanceResponse
+from app.zkteko.executor import device_executor
+from app.zkteko.fleet import resolve_devices, run_on_devices, merge_attendance
+from app.zkteko.attendance.live_capture import live_capture_manager
+from app.zkteko.attendance.punch_archive import punch_archive
+from app.zkteko.attendance.file_manager import FileManager
+from app.api.responses import FastJSONResponse
 
 router = APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_KEEPALIVE_SECONDS = 15
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
-@router.post("/get_attendance", response_model=AttendanceResponse)
+
+@router.post(
+    "/get_attendance",
+    response_model=AttendanceResponse,
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}},
+                     "description": "Send `Accept: application/x-ndjson` to stream rows"}}
+)
 async def get_attendance(
+    request: Request,
     device_settings: DeviceSettings,
     attendance_settings: AttendanceSettings = AttendanceSettings()
 ):
+    try:
+        attendance_manager = AttendanceManager(
+            ip=device_settings.ip,
+            port=device_settings.port,
+            password=device_settings.password,
+            force_udp=device_settings.force_udp,
+            ommit_ping=device_settings.ommit_ping,
+            timeout=device_settings.timeout,
+            office_start=attendance_settings.office_start,
+            office_end=attendance_settings.office_end,
+            grace_period=attendance_settings.grace_period,
+            start_date=attendance_settings.start_date,
+            end_date=attendance_settings.end_date,
+            user_ids=attendance_settings.user_ids,
+            limit=attendance_settings.limit,
+            cursor=attendance_settings.cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        # Device I/O happens up front; the stream itself only reads the punch store
+        await device_executor.run(
+            attendance_manager.device_key, attendance_manager.processor.load_device_state)
+        return StreamingResponse(
+            attendance_manager.iter_attendance_as_ndjson(), media_type=NDJSON_MEDIA_TYPE)
+
+    # The rows are built by the processor in the documented shape, so skip re-validation
+    return FastJSONResponse(await device_executor.run(
+        attendance_manager.device_key, attendance_manager.get_attendance_as_json))
+
+
+@router.post("/get_attendance_batch", response_model=BatchAttendanceResponse)
+async def get_attendance_batch(
+    batch_settings: BatchSettings,
+    attendance_settings: AttendanceSettings = AttendanceSettings()
+):
+    """
+    Fetch attendance from several devices concurrently and merge it.
+    Date and user filters apply to every device; limit/cursor paging does not.
+    """
+    try:
+        devices = resolve_devices(batch_settings)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not devices:
+        raise HTTPException(status_code=400, detail="No devices given")
+
+    async def fetch(device_settings: DeviceSettings):
+        attendance_manager = AttendanceManager(
+            ip=device_settings.ip,
+            port=device_settings.port,
+            password=device_settings.password,
+            force_udp=device_settings.force_udp,
+            ommit_ping=device_settings.ommit_ping,
+            timeout=device_settings.timeout,
+            office_start=attendance_settings.office_start,
+            office_end=attendance_settings.office_end,
+            grace_period=attendance_settings.grace_period,
+            start_date=attendance_settings.start_date,
+            end_date=attendance_settings.end_date,
+            user_ids=attendance_settings.user_ids
+        )
+        return await device_executor.run(
+            attendance_manager.device_key, attendance_manager.get_attendance_as_json)
+
+    results = await run_on_devices(
+        devices, fetch, batch_settings.max_parallel, batch_settings.device_timeout)
+    return FastJSONResponse(merge_attendance(results))
+
+
+@router.post("/export_attendance", response_class=StreamingResponse,
+             responses={200: {"content": {"text/csv": {}, XLSX_MEDIA_TYPE: {}}}})
+async def export_attendance(
+    device_settings: DeviceSettings,
+    attendance_settings: AttendanceSettings = AttendanceSettings(),
+    export_format: Literal["csv", "xlsx"] = Query("csv", alias="format"),
+    report: Literal["summary", "detailed"] = "summary"
+):
+    """
+    Download the attendance summary or detailed report as CSV or XLSX (one sheet per month).
+    Days are separated by a blank row; limit/cursor paging does not apply.
+    """
+    try:
+        attendance_manager = AttendanceManager(
+            ip=device_settings.ip,
+            port=device_settings.port,
+            password=device_settings.password,
+            force_udp=device_settings.force_udp,
+            ommit_ping=device_settings.ommit_ping,
+            timeout=device_settings.timeout,
+            office_start=attendance_settings.office_start,
+            office_end=attendance_settings.office_end,
+            grace_period=attendance_settings.grace_period,
+            start_date=attendance_settings.start_date,
+            end_date=attendance_settings.end_date,
+            user_ids=attendance_settings.user_ids
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    processor = attendance_manager.processor
+    await device_executor.run(processor.device_key, processor.load_device_state)
+    headers = {"Content-Disposition": f'attachment; filename="attendance_{report}.{export_format}"'}
+
+    if export_format == "csv":
+        return StreamingResponse(
+            FileManager.iter_csv(processor.iter_days(), report),
+            media_type="text/csv", headers=headers)
+
+    # XLSX is a zip archive, so it is assembled in a spooled file before sending
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    await asyncio.to_thread(FileManager.write_xlsx, processor.iter_days(), spool, report)
+    spool.seek(0)
+
+    def iter_file():
+        with spool:
+            while chunk := spool.read(64 * 1024):
+                yield chunk
+
+    return StreamingResponse(iter_file(), media_type=XLSX_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/live_attendance", response_class=StreamingResponse,
+            responses={200: {"content": {"text/event-stream": {}}}})
+async def live_attendance(
+    request: Request,
+    device_settings: DeviceSettings = Depends()
+):
+    """
+    Stream punches as they happen as Server-Sent Events.
+    `punch` events carry the same fields as detailed attendance rows; `status`
+    events report the capture connecting, failing or waiting for another
+    worker's capture of the device. Punches are also added to the local punch store.
+    """
+    worker, queue = live_capture_manager.subscribe(device_settings)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            live_capture_manager.unsubscribe(worker, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.post("/archive_attendance")
+async def archive_attendance(
+    device_settings: DeviceSettings
+):
+    """
+    Sync the device and append punches not yet archived to the Parquet archive
+    """
+    attendance_manager = AttendanceManager(
+        ip=device_settings.ip,
+        port=device_settings.port,
+        password=device_settings.password,
+        force_udp=device_settings.force_udp,
+        ommit_ping=device_settings.ommit_ping,
+        timeout=device_settings.timeout)
+    processor = attendance_manager.processor
+
+    def archive():
+        processor.sync_punches()
+        return punch_archive.archive_device(processor.device_key)
+
+    archived = await device_executor.run(processor.device_key, archive)
+    return {"device": processor.device_key, "archived": archived}
+
+
+@router.post("/archive_and_clear")
+async def archive_and_clear(
+    device_settings: DeviceSettings
+):
+    """
+    Store the device's whole log locally, verify it, then clear the log on the device.
+    Nothing is cleared if the punches cannot be verified in local storage.
+    """
     attendance_manager = AttendanceManager(
         ip=device_settings.ip,
         port=device_settings.port,
         password=device_settings.password,
         force_udp=device_settings.force_udp,
         ommit_ping=device_settings.ommit_ping,
-        timeout=device_settings.timeout,
-        office_start=attendance_settings.office_start,
-        office_end=attendance_settings.office_end,
-        grace_period=attendance_settings.grace_period
-    )
-    return await attendance_manager.get_attendance_as_json()
+        timeout=device_settings.timeout)
+    processor = attendance_manager.processor
+    try:
+        return await device_executor.run(processor.device_key, processor.archive_and_clear)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/get_archived_punches", response_model=List[ArchivedPunch])
+async def get_archived_punches(
+    archive_settings: ArchiveSettings
+):
+    """
+    Read punches from the Parquet archive; only matching device/month partitions are read
+    """
+    table = await asyncio.to_thread(
+        punch_archive.read, device=archive_settings.device,
+        start_date=archive_settings.start_date, end_date=archive_settings.end_date,
+        user_ids=archive_settings.user_ids)
+    return table.to_pylist()
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=Response)
+def metrics():
+    """
+    Prometheus metrics: device I/O, pool usage, cache hit rates, stage timings and responses
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
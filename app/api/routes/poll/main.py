@@ -0,0 +1,14 @@
+from typing import List
+from fastapi import APIRouter
+from app.models.poll import PollStatus
+from app.zkteko.poller import device_poller
+
+router = APIRouter()
+
+
+@router.get("/poll_status", response_model=List[PollStatus])
+def poll_status():
+    """
+    Background poll health of each configured device (last success, lag, errors)
+    """
+    return device_poller.get_status()
@@ -0,0 +1,78 @@
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException
+from app.models.device import DeviceSettings
+from app.models.report import ReportSettings, DailyReportRow, MonthlyReportRow
+from app.models.roster import Roster, ShiftReportRow
+from app.zkteko.attendance.attendance_processor import AttendanceProcessor
+from app.zkteko.attendance.roster import CompiledRoster, roster_file
+from app.zkteko.executor import device_executor
+from app.api.responses import FastJSONResponse
+
+router = APIRouter()
+
+
+def report_processor(device_settings: DeviceSettings,
+                     report_settings: ReportSettings) -> AttendanceProcessor:
+    return AttendanceProcessor(
+        ip=device_settings.ip,
+        port=device_settings.port,
+        password=device_settings.password,
+        force_udp=device_settings.force_udp,
+        ommit_ping=device_settings.ommit_ping,
+        timeout=device_settings.timeout,
+        office_start=report_settings.office_start,
+        office_end=report_settings.office_end,
+        grace_period=report_settings.grace_period,
+        start_date=report_settings.start_date,
+        end_date=report_settings.end_date,
+        user_ids=report_settings.user_ids)
+
+
+@router.post("/reports/daily", response_model=List[DailyReportRow])
+async def daily_report(
+    device_settings: DeviceSettings,
+    report_settings: ReportSettings = ReportSettings()
+):
+    """
+    First/last punch, late/early flags and hours per employee per day, from the day rollups
+    """
+    processor = report_processor(device_settings, report_settings)
+    return FastJSONResponse(await device_executor.run(
+        processor.device_key, processor.get_daily_report))
+
+
+@router.post("/reports/monthly", response_model=List[MonthlyReportRow])
+async def monthly_report(
+    device_settings: DeviceSettings,
+    report_settings: ReportSettings = ReportSettings()
+):
+    """
+    Days present, late arrivals, early departures and hours per employee per month.
+    Served from the month rollups when the office settings match ZKTECO_ROLLUP_*,
+    otherwise aggregated from the day rollups.
+    """
+    processor = report_processor(device_settings, report_settings)
+    return FastJSONResponse(await device_executor.run(
+        processor.device_key, processor.get_monthly_report))
+
+
+@router.post("/reports/shifts", response_model=List[ShiftReportRow])
+async def shift_report(
+    device_settings: DeviceSettings,
+    report_settings: ReportSettings = ReportSettings(),
+    roster: Optional[Roster] = None
+):
+    """
+    Per-employee shift attendance (late, early, absent) against a roster of shifts,
+    schedules and holidays. Uses the inline roster, else ZKTECO_ROSTER_FILE.
+    Office start/end settings are ignored; without dates the current month is reported.
+    """
+    try:
+        compiled = CompiledRoster(roster) if roster is not None else roster_file.get()
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    processor = report_processor(device_settings, report_settings)
+    return FastJSONResponse(await device_executor.run(
+        processor.device_key, processor.get_shift_report, compiled))
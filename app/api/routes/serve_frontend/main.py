@@ -1,18 +1,14 @@
-import os
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from app.models.message import Message
+from app.api.frontend import frontend_index
 
 
 router = APIRouter()
 
 
-@router.get("/")
-def serve_frontend() -> HTMLResponse:
+@router.get("/", response_class=HTMLResponse)
+def serve_frontend(request: Request):
     """
     Serve the Frontend
     """
-    index_path = os.path.join("static", "index.html")
-    with open(index_path) as f:
-        return HTMLResponse(content=f.read())
-
+    return frontend_index.response(request.headers)
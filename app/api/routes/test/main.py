@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from app.models.device import DeviceSettings
 from app.zkteko.base import ZktekoBase
+from app.zkteko.executor import device_executor
 from app.models.message import Message
 
 
@@ -20,8 +21,7 @@ async def test(
         timeout=device_settings.timeout,
     )
     try:
-        zk.connect()
-        zk.disconnect()
+        await device_executor.run(zk.device_key, zk.test_connection)
         return Message(message="Connected to device")
     except Exception as e:
         raise HTTPException(
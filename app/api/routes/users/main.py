@@ -1,9 +1,25 @@
-from fastapi import APIRouter
+import asyncio
+import json
+import time
+from typing import List, Literal
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from app.zkteko.user.user_manager import UserManager
-from app.models.user import UserSettings
+from app.zkteko.user.mutation_queue import user_mutations
+from app.zkteko.user.user_io import parse_users_csv, iter_users_csv, iter_users_json
+from app.models.user import UserSettings, BulkUserSettings, BulkUserResult
 from app.models.device import DeviceSettings
+from app.models.batch import BatchSettings, DeviceUsers
+from app.models.template import (UserTemplates, TemplateImportSettings,
+                                 TemplateReplicationSettings, DeviceTemplateResult)
+from app.zkteko.executor import device_executor
+from app.zkteko.fleet import resolve_devices, run_on_devices
+from app.zkteko.user import template_sync
+from app.api.responses import FastJSONResponse
 router = APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
 
 @router.post("/get_users")
 async def get_users(
@@ -16,7 +32,65 @@ async def get_users(
         force_udp=device_settings.force_udp,
         ommit_ping=device_settings.ommit_ping,
         timeout=device_settings.timeout)
-    return user_manager.get_all_users()
+    return await device_executor.run(
+        user_manager.device_key, user_manager.get_all_users)
+
+
+@router.post("/refresh_users")
+async def refresh_users(
+    device_settings: DeviceSettings,
+):
+    """
+    Re-download the user table from the device, replacing the cached copy
+    """
+    user_manager = UserManager(
+        ip=device_settings.ip,
+        port=device_settings.port,
+        password=device_settings.password,
+        force_udp=device_settings.force_udp,
+        ommit_ping=device_settings.ommit_ping,
+        timeout=device_settings.timeout)
+    return await device_executor.run(
+        user_manager.device_key, user_manager.get_all_users, refresh=True)
+
+
+@router.post("/get_users_batch", response_model=List[DeviceUsers])
+async def get_users_batch(
+    batch_settings: BatchSettings,
+):
+    """
+    Fetch users from several devices concurrently
+    """
+    try:
+        devices = resolve_devices(batch_settings)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not devices:
+        raise HTTPException(status_code=400, detail="No devices given")
+
+    async def fetch(device_settings: DeviceSettings):
+        user_manager = UserManager(
+            ip=device_settings.ip,
+            port=device_settings.port,
+            password=device_settings.password,
+            force_udp=device_settings.force_udp,
+            ommit_ping=device_settings.ommit_ping,
+            timeout=device_settings.timeout)
+        users = await device_executor.run(
+            user_manager.device_key, user_manager.get_all_users)
+        return [vars(user) for user in users]
+
+    results = await run_on_devices(
+        devices, fetch, batch_settings.max_parallel, batch_settings.device_timeout)
+    return [DeviceUsers(device=result['device'], ok=result['ok'],
+                        users=result['result'] or [], error=result['error'],
+                        elapsed=result['elapsed'])
+            for result in results]
+
+
+def user_fields(user_settings: UserSettings) -> dict:
+    """Fields passed to ``set_user``, besides the uid."""
+    return user_settings.model_dump(exclude={'uid'})
 
 
 @router.post("/update_user")
@@ -24,6 +98,9 @@ async def update_user(
     device_settings: DeviceSettings,
     user_settings: UserSettings,
 ):
+    """
+    Update a user in place (fingerprints are kept); concurrent edits share one device session
+    """
     user_manager = UserManager(
         ip=device_settings.ip,
         port=device_settings.port,
@@ -32,21 +109,8 @@ async def update_user(
         ommit_ping=device_settings.ommit_ping,
         timeout=device_settings.timeout
     )
-    try:
-        user_manager.delete_user(uid=user_settings.uid)
-    except Exception as e:
-        print(f"Error deleting user inorder to update: {e}")
-        return False
-
-    return user_manager.add_user(
-        uid=user_settings.uid,
-        name=user_settings.name,
-        privilege=user_settings.privilege,
-        password=user_settings.password,
-        group_id=user_settings.group_id,
-        user_id=user_settings.user_id,
-        card=user_settings.card
-    )
+    return await user_mutations.submit(
+        user_manager, 'set', user_settings.uid, user_fields(user_settings))
 
 
 @router.post("/delete_user")
@@ -62,7 +126,7 @@ async def delete_user(
         ommit_ping=device_settings.ommit_ping,
         timeout=device_settings.timeout
     )
-    return user_manager.delete_user(uid=user_settings.uid)
+    return await user_mutations.submit(user_manager, 'delete', user_settings.uid)
 
 
 @router.post("/add_user")
@@ -78,12 +142,203 @@ async def add_user(
         ommit_ping=device_settings.ommit_ping,
         timeout=device_settings.timeout
     )
-    return user_manager.add_user(
-        uid=user_settings.uid,
-        name=user_settings.name,
-        privilege=user_settings.privilege,
-        password=user_settings.password,
-        group_id=user_settings.group_id,
-        user_id=user_settings.user_id,
-        card=user_settings.card
+    return await user_mutations.submit(
+        user_manager, 'set', user_settings.uid, user_fields(user_settings))
+
+
+@router.post("/bulk_users", response_model=List[BulkUserResult])
+async def bulk_users(
+    device_settings: DeviceSettings,
+    bulk_settings: BulkUserSettings,
+):
+    """
+    Create, update and delete many users in one device session
+    """
+    results = []
+    upserts = [(row, user.model_dump())
+               for row, user in enumerate(bulk_settings.users, start=1)]
+    row = len(upserts)
+    if bulk_settings.csv_data:
+        try:
+            for line, user, error in parse_users_csv(bulk_settings.csv_data):
+                row += 1
+                if error is not None:
+                    results.append(BulkUserResult(
+                        row=row, action="invalid", ok=False, error=f"Line {line}: {error}"))
+                else:
+                    upserts.append((row, user))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    deletes = [(row + i, uid)
+               for i, uid in enumerate(bulk_settings.delete_uids, start=1)]
+
+    user_manager = UserManager(
+        ip=device_settings.ip,
+        port=device_settings.port,
+        password=device_settings.password,
+        force_udp=device_settings.force_udp,
+        ommit_ping=device_settings.ommit_ping,
+        timeout=device_settings.timeout
     )
+    try:
+        applied = await device_executor.run(
+            user_manager.device_key, user_manager.bulk_apply,
+            upserts, deletes, dry_run=bulk_settings.dry_run)
+    except ConnectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    results.extend(BulkUserResult(**result) for result in applied)
+    return sorted(results, key=lambda result: result.row)
+
+
+@router.post("/export_users")
+async def export_users(
+    device_settings: DeviceSettings,
+    export_format: Literal["csv", "json"] = Query("csv", alias="format"),
+):
+    """
+    Download the device's users as CSV or JSON
+    """
+    user_manager = UserManager(
+        ip=device_settings.ip,
+        port=device_settings.port,
+        password=device_settings.password,
+        force_udp=device_settings.force_udp,
+        ommit_ping=device_settings.ommit_ping,
+        timeout=device_settings.timeout)
+    users = await device_executor.run(
+        user_manager.device_key, user_manager.get_all_users)
+    if export_format == "csv":
+        content, media_type = iter_users_csv(users), "text/csv"
+    else:
+        content, media_type = iter_users_json(users), "application/json"
+    return StreamingResponse(
+        content, media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{export_format}"'})
+
+
+@router.post("/export_templates", response_model=List[UserTemplates])
+async def export_templates(
+    device_settings: DeviceSettings,
+):
+    """
+    Download every user's fingerprint templates, in the shape /import_templates accepts
+    """
+    user_manager = UserManager(
+        ip=device_settings.ip,
+        port=device_settings.port,
+        password=device_settings.password,
+        force_udp=device_settings.force_udp,
+        ommit_ping=device_settings.ommit_ping,
+        timeout=device_settings.timeout)
+    try:
+        users, fingers = await device_executor.run(
+            user_manager.device_key, user_manager.export_templates)
+    except ConnectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    image = template_sync.build_image(users, fingers)
+    return FastJSONResponse(template_sync.image_to_dicts(image))
+
+
+@router.post("/import_templates", response_model=DeviceTemplateResult)
+async def import_templates(
+    device_settings: DeviceSettings,
+    import_settings: TemplateImportSettings,
+):
+    """
+    Save fingerprint templates on a device, sending only those it does not hold yet
+    """
+    try:
+        image = template_sync.image_from_models(import_settings.users)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    user_manager = UserManager(
+        ip=device_settings.ip,
+        port=device_settings.port,
+        password=device_settings.password,
+        force_udp=device_settings.force_udp,
+        ommit_ping=device_settings.ommit_ping,
+        timeout=device_settings.timeout)
+    start = time.perf_counter()
+    try:
+        result = await device_executor.run(
+            user_manager.device_key, user_manager.import_templates,
+            image, prune=import_settings.prune, refresh=import_settings.refresh)
+    except ConnectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return DeviceTemplateResult(device=device_settings.label, ok=True,
+                                elapsed=time.perf_counter() - start, **result)
+
+
+@router.post(
+    "/replicate_templates",
+    response_model=List[DeviceTemplateResult],
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}},
+                     "description": "Send `Accept: application/x-ndjson` to stream progress"}}
+)
+async def replicate_templates(
+    request: Request,
+    batch_settings: BatchSettings,
+    replication_settings: TemplateReplicationSettings,
+):
+    """
+    Copy fingerprint templates from a source device to many devices concurrently.
+    Each device only receives templates it does not hold yet. A push still
+    running at device_timeout stops between users, re-enables the device and
+    reports what it applied (`stopped`). Streamed progress has `planned`, `progress`
+    and `done` events per device, then a `summary` event.
+    """
+    try:
+        targets = resolve_devices(batch_settings)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not targets:
+        raise HTTPException(status_code=400, detail="No devices given")
+
+    source = replication_settings.source
+    targets = [device for device in targets
+               if (device.ip, device.port) != (source.ip, source.port)]
+    if not targets:
+        raise HTTPException(status_code=400, detail="No target devices besides the source")
+
+    user_manager = UserManager(
+        ip=source.ip,
+        port=source.port,
+        password=source.password,
+        force_udp=source.force_udp,
+        ommit_ping=source.ommit_ping,
+        timeout=source.timeout)
+    try:
+        users, fingers = await device_executor.run(
+            user_manager.device_key, user_manager.export_templates)
+    except ConnectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    image = template_sync.build_image(users, fingers, replication_settings.user_ids)
+
+    def replicate(progress=None):
+        return template_sync.replicate_templates(
+            image, targets, batch_settings.max_parallel, batch_settings.device_timeout,
+            prune=replication_settings.prune, refresh=replication_settings.refresh,
+            progress=progress)
+
+    if NDJSON_MEDIA_TYPE not in request.headers.get("accept", ""):
+        return await replicate()
+
+    # The replication keeps running if the client disconnects
+    queue = asyncio.Queue()
+    task = asyncio.ensure_future(replicate(queue.put_nowait))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    async def events():
+        start = time.perf_counter()
+        while (event := await queue.get()) is not None:
+            yield json.dumps(event) + "\n"
+        results = task.result()
+        yield json.dumps({
+            'event': 'summary',
+            'devices': len(results),
+            'ok': sum(result['ok'] for result in results),
+            'templates': sum(result.get('templates', 0) for result in results),
+            'elapsed': time.perf_counter() - start
+        }) + "\n"
+
+    return StreamingResponse(events(), media_type=NDJSON_MEDIA_TYPE)
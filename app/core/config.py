@@ -0,0 +1,71 @@
+from datetime import time
+from typing import Optional
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Backend settings, read from ``ZKTECO_*`` environment variables."""
+    model_config = SettingsConfigDict(
+        env_prefix="ZKTECO_", env_file=".env", extra="ignore")
+
+    device_io_workers: int = Field(
+        default=8, description="Threads available for blocking device I/O")
+    device_concurrency: int = Field(
+        default=1, description="Concurrent operations allowed per device")
+    data_dir: str = Field(
+        default="data", description="Directory for local device state (punch store)")
+    device_groups_file: Optional[str] = Field(
+        default=None, description="JSON file mapping group names to lists of device settings")
+    user_cache_ttl: float = Field(
+        default=300, description="Seconds a cached device user table stays valid (0 disables)")
+    user_cache_max_devices: int = Field(
+        default=256, description="Devices kept in the user cache before LRU eviction")
+    result_cache_size: int = Field(
+        default=64, description="Computed attendance results kept in memory (0 disables)")
+    user_mutation_window: float = Field(
+        default=0.05, description="Seconds user add/update/delete calls are collected into one device session")
+    user_mutation_max_batch: int = Field(
+        default=500, description="User changes applied in one session at most")
+    archive_enabled: bool = Field(
+        default=False, description="Append synced punches to the Parquet archive")
+    archive_dir: Optional[str] = Field(
+        default=None, description="Directory of the Parquet punch archive (default: <data_dir>/archive)")
+    clear_log_threshold: int = Field(
+        default=0, description="Archive then clear a polled device's log once it holds this many punches (0 disables)")
+    rollup_office_start: time = Field(
+        default=time(9, 0), description="Office start the monthly attendance rollups are kept for")
+    rollup_office_end: time = Field(
+        default=time(17, 0), description="Office end the monthly attendance rollups are kept for")
+    rollup_grace_period: int = Field(
+        default=15, description="Grace period in minutes the monthly attendance rollups are kept for")
+    precompress_static: bool = Field(
+        default=False,
+        description="Write missing .gz/.br variants of static/ in the background at startup "
+                    "(the Docker image does this at build time)")
+    roster_file: Optional[str] = Field(
+        default=None, description="JSON roster of shifts, schedules and holidays for shift reports")
+    poll_devices_file: Optional[str] = Field(
+        default=None, description="JSON list of device settings to poll in the background")
+    poll_interval: float = Field(
+        default=60, description="Default seconds between background polls of a device")
+    poll_jitter: float = Field(
+        default=0.1, description="Random fraction added to or taken from each poll interval")
+    poll_max_backoff: float = Field(
+        default=900, description="Longest delay between polls of a failing device, in seconds")
+    coordinate_workers: bool = Field(
+        default=False,
+        description="Share device locks, cached users and polling between worker processes using data_dir")
+    device_lock_timeout: float = Field(
+        default=60, description="Seconds to wait in line for a device held by another worker")
+    device_lock_lease: float = Field(
+        default=60, description="Seconds without a heartbeat before a worker's device lock is dropped")
+    pool_idle_timeout: float = Field(
+        default=300, description="Seconds before an idle device session is closed (0 disables pooling)")
+    pool_health_check_interval: float = Field(
+        default=30, description="Seconds a session may sit unused before it is re-checked")
+    pool_keepalive_interval: float = Field(
+        default=60, description="Seconds between keepalive passes over idle sessions")
+
+
+settings = Settings()
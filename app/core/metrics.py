@@ -0,0 +1,131 @@
+"""Prometheus metrics for device I/O, caches, processing stages and HTTP routes.
+
+Stage timers label observations with the route being served, which is
+tracked in a context variable set by ``MetricsMiddleware``; the device
+executor copies the context into its worker threads.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+current_route: ContextVar[str] = ContextVar('current_route', default='background')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+DEVICE_CONNECT_SECONDS = Histogram(
+    'zk_device_connect_seconds', 'Time to open and authenticate a device session',
+    ['device'], buckets=DURATION_BUCKETS)
+DEVICE_CONNECT_FAILURES = Counter(
+    'zk_device_connect_failures_total', 'Failed attempts to open a device session', ['device'])
+DEVICE_BYTES = Counter(
+    'zk_device_bytes_received_total', 'Payload bytes read from devices by buffered reads',
+    ['device', 'route'])
+DEVICE_RECORDS = Counter(
+    'zk_device_records_received_total', 'Records downloaded from devices',
+    ['device', 'route', 'kind'])
+STAGE_SECONDS = Histogram(
+    'zk_stage_seconds', 'Time spent in each device and processing stage',
+    ['device', 'route', 'stage'], buckets=DURATION_BUCKETS)
+CACHE_REQUESTS = Counter(
+    'zk_cache_requests_total', 'Cache lookups by cache and result (hit, miss, coalesced)',
+    ['cache', 'result'])
+HTTP_REQUEST_SECONDS = Histogram(
+    'zk_http_request_seconds', 'Time to serve an HTTP request, including the response body',
+    ['route', 'method', 'status'], buckets=DURATION_BUCKETS)
+HTTP_RESPONSE_BYTES = Histogram(
+    'zk_http_response_bytes', 'Size of HTTP response bodies',
+    ['route', 'method'], buckets=SIZE_BUCKETS)
+
+
+@contextmanager
+def timed(stage: str, device: str = ''):
+    """Record the duration of a stage for ``device`` under the current route."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(device, current_route.get(), stage).observe(
+            time.perf_counter() - start)
+
+
+def record_download(device: str, kind: str, count: int) -> None:
+    """Count records downloaded from ``device``."""
+    DEVICE_RECORDS.labels(device, current_route.get(), kind).inc(count)
+
+
+def instrument_connection(conn, device: str):
+    """Count the payload bytes of every buffered read on a pyzk connection."""
+    read_with_buffer = conn.read_with_buffer
+
+    @wraps(read_with_buffer)
+    def counted(*args, **kwargs):
+        data, size = read_with_buffer(*args, **kwargs)
+        DEVICE_BYTES.labels(device, current_route.get()).inc(len(data))
+        return data, size
+
+    conn.read_with_buffer = counted
+    return conn
+
+
+class PoolCollector:
+    """Report connection pool usage when scraped, at no cost in between."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def collect(self):
+        sessions = GaugeMetricFamily(
+            'zk_pool_sessions', 'Open pooled device sessions', labels=['device'])
+        leased = GaugeMetricFamily(
+            'zk_pool_leased', 'Pooled device sessions currently leased', labels=['device'])
+        for device, leases in self.pool.stats():
+            sessions.add_metric([device], 1)
+            leased.add_metric([device], 1 if leases else 0)
+        yield sessions
+        yield leased
+
+
+def register_pool(pool) -> None:
+    """Expose the usage of ``pool`` on the metrics endpoint."""
+    REGISTRY.register(PoolCollector(pool))
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing requests and measuring response bodies per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+        token = current_route.set(scope['path'])
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_route.reset(token)
+            # Label by route template so unknown paths do not create new series
+            route = scope.get('route')
+            route = route.path if route is not None else 'unmatched'
+            HTTP_REQUEST_SECONDS.labels(route, scope['method'], str(status)).observe(
+                time.perf_counter() - start)
+            HTTP_RESPONSE_BYTES.labels(route, scope['method']).observe(size)
@@ -3,8 +3,16 @@ from starlette.middleware.cors import CORSMiddleware
 from fastapi.routing import APIRoute
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from fastapi.staticfiles import StaticFiles
+from app.core.config import settings
+from app.api.frontend import FrontendStaticFiles, precompress
+from app.zkteko.executor import device_executor
+from app.zkteko.connection_pool import connection_pool
+from app.zkteko.device_lock import device_locks
+from app.zkteko.poller import device_poller, load_polled_devices
+from app.zkteko.attendance.live_capture import live_capture_manager
+from app.core.metrics import MetricsMiddleware
 
+import asyncio
 import time
 
 
@@ -12,11 +20,29 @@ def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+async def precompress_in_background(directory: str) -> None:
+    """Precompress frontend assets in a worker thread, so startup is not delayed."""
+    try:
+        written = await asyncio.to_thread(precompress, directory)
+        print(f"{directory}: wrote {written} compressed variants")
+    except OSError as e:
+        print(f"Could not precompress frontend assets: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print(f"Starting app {time.asctime()}")
     # Run it without blocking the app startup
+    connection_pool.start()
+    if settings.precompress_static:
+        app.state.precompress_task = asyncio.create_task(precompress_in_background("static"))
+    device_poller.start(load_polled_devices())
     yield
+    await device_poller.stop()
+    live_capture_manager.stop_all()
+    device_executor.shutdown()
+    connection_pool.close_all()
+    device_locks.close()
     print(f"Stopping app {time.asctime()}")
 
 app = FastAPI(
@@ -28,7 +54,7 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", FrontendStaticFiles(directory="static"), name="static")
 
 
 app.add_middleware(
@@ -40,4 +66,7 @@ app.add_middleware(
 )
 
 
+app.add_middleware(MetricsMiddleware)
+
+
 app.include_router(api_router)
@@ -1,4 +1,4 @@
-from datetime import datetime, time
+from datetime import date, datetime, time
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
@@ -17,6 +17,8 @@ class AttendanceRecord(BaseModel):
                                      description="Whether this was an early departure")
     first_punch: str = Field(..., description="First punch time for the day")
     last_punch: str = Field(..., description="Last punch time for the day")
+    device: Optional[str] = Field(
+        default=None, description="Device the punch came from (batch requests only)")
 
 
 class AttendanceMetadata(BaseModel):
@@ -29,6 +31,8 @@ class AttendanceMetadata(BaseModel):
                              description="Start and end dates of the records")
     generated_at: datetime = Field(...,
                                    description="Timestamp when the data was generated")
+    next_cursor: Optional[str] = Field(
+        default=None, description="Cursor for the next page, if there is one")
 
 
 class AttendanceResponse(BaseModel):
@@ -49,3 +53,36 @@ class AttendanceSettings(BaseModel):
         17, 0), description="Office end time (default: 5:00 PM)")
     grace_period: int = Field(
         default=15, description="Grace period in minutes (default: 15)")
+    start_date: Optional[date] = Field(
+        default=None, description="Only include punches on or after this date")
+    end_date: Optional[date] = Field(
+        default=None, description="Only include punches on or before this date")
+    user_ids: Optional[List[str]] = Field(
+        default=None, description="Only include punches from these device user IDs")
+    limit: Optional[int] = Field(
+        default=None, ge=1,
+        description="Page size in punches; pages are extended to whole days")
+    cursor: Optional[str] = Field(
+        default=None, description="Cursor from a previous page's metadata.next_cursor")
+
+
+class ArchiveSettings(BaseModel):
+    """Filters for reading the punch archive."""
+    device: Optional[str] = Field(
+        default=None, description="Device address (ip:port); all devices if omitted")
+    start_date: Optional[date] = Field(
+        default=None, description="Only include punches on or after this date")
+    end_date: Optional[date] = Field(
+        default=None, description="Only include punches on or before this date")
+    user_ids: Optional[List[str]] = Field(
+        default=None, description="Only include punches from these device user IDs")
+
+
+class ArchivedPunch(BaseModel):
+    """A punch read from the archive."""
+    device: str = Field(..., description="Device address (ip:port)")
+    user_id: str = Field(..., description="User ID from the ZKTeco device")
+    uid: int = Field(..., description="Internal device user number")
+    timestamp: datetime = Field(..., description="Punch time")
+    status: int = Field(..., description="Verification status")
+    punch: int = Field(..., description="Punch state (in, out, ...)")
@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.models.attendance import AttendanceResponse
+from app.models.device import DeviceSettings
+
+
+class BatchSettings(BaseModel):
+    """Devices to query in one batch request and how to fan out."""
+    devices: Optional[List[DeviceSettings]] = Field(
+        default=None, description="Devices to query")
+    group: Optional[str] = Field(
+        default=None, description="Named device group from the device groups file")
+    max_parallel: int = Field(
+        default=8, ge=1, description="Maximum devices queried at the same time")
+    device_timeout: float = Field(
+        default=30, gt=0, description="Seconds to wait for each device")
+
+
+class DeviceResult(BaseModel):
+    """Outcome of a batch request for a single device."""
+    device: str = Field(..., description="Device label")
+    ok: bool = Field(..., description="Whether the device answered")
+    records: int = Field(default=0, description="Number of records returned")
+    error: Optional[str] = Field(default=None, description="Error message on failure")
+    elapsed: float = Field(..., description="Seconds spent on this device")
+
+
+class BatchAttendanceResponse(AttendanceResponse):
+    """Attendance merged from several devices plus the per-device outcome."""
+    devices: List[DeviceResult] = Field(..., description="Per-device results")
+
+
+class DeviceUsers(BaseModel):
+    """Users of one device in a batch request."""
+    device: str = Field(..., description="Device label")
+    ok: bool = Field(..., description="Whether the device answered")
+    users: List[dict] = Field(default=[], description="Users on the device")
+    error: Optional[str] = Field(default=None, description="Error message on failure")
+    elapsed: float = Field(..., description="Seconds spent on this device")
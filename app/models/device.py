@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import Optional
 
 
 class DeviceSettings(BaseModel):
@@ -12,3 +13,10 @@ class DeviceSettings(BaseModel):
         default=True, description="Whether to omit ping check")
     timeout: int = Field(
         default=5, description="Connection timeout in seconds")
+    name: Optional[str] = Field(
+        default=None, description="Friendly device name, used to label batch results")
+
+    @property
+    def label(self) -> str:
+        """Name used to tag results from this device."""
+        return self.name or f"{self.ip}:{self.port}"
@@ -0,0 +1,31 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Optional
+from app.models.device import DeviceSettings
+
+
+class PolledDevice(DeviceSettings):
+    """A device polled in the background, as listed in the poll devices file."""
+    poll_interval: Optional[float] = Field(
+        default=None, gt=0, description="Seconds between polls (default: ZKTECO_POLL_INTERVAL)")
+
+
+class PollStatus(BaseModel):
+    """Health of the background poll of one device."""
+    device: str = Field(..., description="Device label")
+    device_key: str = Field(..., description="Device address (ip:port)")
+    interval: float = Field(..., description="Configured seconds between polls")
+    last_attempt: Optional[datetime] = Field(
+        default=None, description="When the last poll started")
+    last_success: Optional[datetime] = Field(
+        default=None, description="When the last successful poll finished")
+    lag: Optional[float] = Field(
+        default=None, description="Seconds since the last successful poll")
+    error_count: int = Field(default=0, description="Consecutive failed polls")
+    total_errors: int = Field(default=0, description="Failed polls since startup")
+    last_error: Optional[str] = Field(default=None, description="Error of the last failed poll")
+    last_new_punches: int = Field(
+        default=0, description="Punches stored by the last successful poll")
+    next_poll: Optional[datetime] = Field(default=None, description="When the next poll is due")
+    stale: bool = Field(
+        ..., description="Whether the last success is older than twice the interval")
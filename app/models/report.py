@@ -0,0 +1,43 @@
+from datetime import date, time
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class ReportSettings(BaseModel):
+    """Settings for attendance reports built from the rollups."""
+    office_start: time = Field(default=time(
+        9, 0), description="Office start time (default: 9:00 AM)")
+    office_end: time = Field(default=time(
+        17, 0), description="Office end time (default: 5:00 PM)")
+    grace_period: int = Field(
+        default=15, description="Grace period in minutes (default: 15)")
+    start_date: Optional[date] = Field(
+        default=None, description="Only report on or after this date (monthly: its month)")
+    end_date: Optional[date] = Field(
+        default=None, description="Only report on or before this date (monthly: its month)")
+    user_ids: Optional[List[str]] = Field(
+        default=None, description="Only report these device user IDs")
+
+
+class DailyReportRow(BaseModel):
+    """Attendance of one employee on one day."""
+    user_id: str = Field(..., description="User ID from the ZKTeco device")
+    name: str = Field(..., description="Employee name")
+    date: str = Field(..., description="Day (YYYY-MM-DD)")
+    first_punch: str = Field(..., description="First punch time (e.g., '09:15 AM')")
+    last_punch: str = Field(..., description="Last punch time (e.g., '05:02 PM')")
+    punch_count: int = Field(..., description="Punches on the day")
+    is_late_arrival: bool = Field(..., description="Whether the first punch was late")
+    is_early_departure: bool = Field(..., description="Whether the last punch was early")
+    hours_worked: float = Field(..., description="Hours between first and last punch")
+
+
+class MonthlyReportRow(BaseModel):
+    """Attendance totals of one employee for one month."""
+    user_id: str = Field(..., description="User ID from the ZKTeco device")
+    name: str = Field(..., description="Employee name")
+    month: str = Field(..., description="Month (YYYY-MM)")
+    days_present: int = Field(..., description="Days with at least one punch")
+    late_arrivals: int = Field(..., description="Days with a late first punch")
+    early_departures: int = Field(..., description="Days with an early last punch")
+    hours_worked: float = Field(..., description="Sum of hours between first and last punch")
@@ -0,0 +1,59 @@
+from datetime import date, time
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+
+class Shift(BaseModel):
+    """A working window; an end at or before the start runs past midnight."""
+    start: time = Field(..., description="Shift start time")
+    end: time = Field(..., description="Shift end time (next day if not after start)")
+    grace_period: int = Field(
+        default=15, ge=0, description="Minutes after the start before an arrival is late")
+    checkout_window: int = Field(
+        default=240, ge=0,
+        description="Minutes after an overnight shift ends during which punches still count for it")
+
+
+class Schedule(BaseModel):
+    """A repeating pattern of shifts, one entry per day."""
+    pattern: List[Optional[str]] = Field(
+        ..., min_length=1, description="Shift name per day, or null for a day off")
+    anchor: date = Field(
+        default=date(2024, 1, 1),
+        description="Day the pattern's first entry falls on (default: a Monday, for weekly patterns)")
+
+
+class Assignment(BaseModel):
+    """Puts users on a schedule, optionally for a date range."""
+    schedule: str = Field(..., description="Schedule name")
+    user_ids: List[str] = Field(default=[], description="Device user IDs")
+    groups: List[str] = Field(default=[], description="Group names from the roster")
+    start_date: Optional[date] = Field(default=None, description="First day of the assignment")
+    end_date: Optional[date] = Field(default=None, description="Last day of the assignment")
+
+
+class Roster(BaseModel):
+    """Shifts, schedules and who works them. Later assignments override earlier ones."""
+    shifts: Dict[str, Shift] = Field(..., description="Shifts by name")
+    schedules: Dict[str, Schedule] = Field(..., description="Schedules by name")
+    groups: Dict[str, List[str]] = Field(default={}, description="Device user IDs by group name")
+    assignments: List[Assignment] = Field(default=[], description="Schedule assignments")
+    default_schedule: Optional[str] = Field(
+        default=None, description="Schedule of every device user without an assignment")
+    holidays: List[date] = Field(default=[], description="Days nobody is expected to work")
+
+
+class ShiftReportRow(BaseModel):
+    """Attendance of one employee on one shift day."""
+    user_id: str = Field(..., description="User ID from the ZKTeco device")
+    name: str = Field(..., description="Employee name")
+    date: str = Field(..., description="Day the shift starts (YYYY-MM-DD)")
+    shift: Optional[str] = Field(default=None, description="Scheduled shift, if any")
+    status: str = Field(..., description="'present', 'absent' or 'unscheduled'")
+    is_holiday: bool = Field(..., description="Whether the day is a holiday")
+    first_punch: Optional[str] = Field(default=None, description="First punch time (e.g., '09:15 AM')")
+    last_punch: Optional[str] = Field(default=None, description="Last punch time (e.g., '05:02 PM')")
+    punch_count: int = Field(..., description="Punches counted for the shift")
+    is_late_arrival: bool = Field(..., description="Whether the first punch was after start plus grace")
+    is_early_departure: bool = Field(..., description="Whether the last punch was before the shift end")
+    hours_worked: float = Field(..., description="Hours between first and last punch")
@@ -0,0 +1,58 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.models.device import DeviceSettings
+from app.models.user import UserSettings
+
+
+class FingerTemplate(BaseModel):
+    """One fingerprint template of a user."""
+    fid: int = Field(..., ge=0, le=9, description="Finger index (0-9)")
+    valid: int = Field(default=1, description="Template flag reported by the device")
+    template: str = Field(..., description="Template bytes, hex encoded")
+    hash: Optional[str] = Field(
+        default=None, description="SHA-256 of the template bytes (ignored on import)")
+
+
+class UserTemplates(BaseModel):
+    """A user and their fingerprint templates."""
+    user: UserSettings = Field(..., description="User record, created on devices that lack it")
+    fingers: List[FingerTemplate] = Field(..., description="Fingerprint templates")
+
+
+class TemplateImportSettings(BaseModel):
+    """Templates to push to a device; only those it does not hold yet are sent."""
+    users: List[UserTemplates] = Field(..., description="Users and templates, matched by user_id")
+    prune: bool = Field(
+        default=False, description="Delete templates of these users that are not listed")
+    refresh: bool = Field(
+        default=False,
+        description="Re-download the device's templates instead of trusting the template store")
+
+
+class TemplateReplicationSettings(BaseModel):
+    """Where to copy templates from and what to copy."""
+    source: DeviceSettings = Field(..., description="Device the templates are read from")
+    user_ids: List[str] = Field(
+        default=[], description="Only copy these user IDs (default: every user with templates)")
+    prune: bool = Field(
+        default=False, description="Delete templates of copied users that the source lacks")
+    refresh: bool = Field(
+        default=False,
+        description="Re-download each target's templates instead of trusting the template store")
+
+
+class DeviceTemplateResult(BaseModel):
+    """Outcome of pushing templates to one device."""
+    device: str = Field(..., description="Device label")
+    ok: bool = Field(..., description="Whether the device was reached")
+    users: int = Field(default=0, description="Users in the pushed set")
+    pushed: int = Field(default=0, description="Users whose templates were saved")
+    templates: int = Field(default=0, description="Templates saved")
+    unchanged: int = Field(default=0, description="Users the device already held up to date")
+    pruned: int = Field(default=0, description="Templates deleted")
+    failed: int = Field(default=0, description="Users or templates that could not be applied")
+    stopped: bool = Field(
+        default=False, description="Whether device_timeout stopped the push early; counts cover what was applied")
+    errors: List[str] = Field(default=[], description="Per-user error messages")
+    error: Optional[str] = Field(default=None, description="Error message on failure")
+    elapsed: float = Field(..., description="Seconds spent on this device")
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import List, Optional
 
 
 class UserSettings(BaseModel):
@@ -10,3 +11,27 @@ class UserSettings(BaseModel):
     group_id: str = Field(..., description="Group ID")
     user_id: str = Field(..., description="User ID in string")
     card: int = Field(..., description="Card Number")
+
+
+class BulkUserSettings(BaseModel):
+    """Users to create, update or delete in a single device session."""
+    users: List[UserSettings] = Field(
+        default=[], description="Users to create or update, matched by uid")
+    csv_data: Optional[str] = Field(
+        default=None, description="CSV with the UserSettings columns, applied after users")
+    delete_uids: List[int] = Field(
+        default=[], description="UIDs of users to delete")
+    dry_run: bool = Field(
+        default=False, description="Only report the changes against the device's current users")
+
+
+class BulkUserResult(BaseModel):
+    """Outcome of one row of a bulk user request."""
+    row: int = Field(..., description="Row number, counting users, then CSV rows, then deletes")
+    uid: Optional[int] = Field(default=None, description="User ID")
+    action: str = Field(...,
+                        description="create, update, unchanged, delete, missing or invalid")
+    ok: bool = Field(..., description="Whether the row was applied (or would be, on a dry run)")
+    changes: dict = Field(
+        default={}, description="Changed fields as [current, new] pairs")
+    error: Optional[str] = Field(default=None, description="Error message on failure")
@@ -1,7 +1,8 @@
-from datetime import time
+from datetime import date, time
 from app.zkteko.attendance.attendance_processor import AttendanceProcessor
 from app.zkteko.attendance.file_manager import FileManager
 import pandas as pd
+import orjson
 
 
 class AttendanceManager:
@@ -11,20 +12,39 @@ class AttendanceManager:
                  force_udp: bool = False, ommit_ping: bool = False, timeout: int = 5,
                  office_start: time = time(9, 0),
                  office_end: time = time(17, 0),
-                 grace_period: int = 30):
+                 grace_period: int = 30,
+                 start_date: date = None, end_date: date = None,
+                 user_ids: list = None, limit: int = None, cursor: str = None):
         """Initialize AttendanceManager with all necessary components."""
         self.processor = AttendanceProcessor(
             ip=ip, port=port, password=password,
             force_udp=force_udp, ommit_ping=ommit_ping, timeout=timeout,
             office_start=office_start, office_end=office_end,
-            grace_period=grace_period
+            grace_period=grace_period,
+            start_date=start_date, end_date=end_date,
+            user_ids=user_ids, limit=limit, cursor=cursor
         )
         self.file_manager = FileManager()
 
+    @property
+    def device_key(self) -> str:
+        """Identifier of the device this manager talks to."""
+        return self.processor.device_key
+
     def get_attendance_as_json(self):
         """Get attendance data in JSON format."""
         return self.processor.get_attendance_data()
 
+    def iter_attendance_as_ndjson(self):
+        """Yield attendance data as newline-delimited JSON, one row per line.
+
+        Each line carries a ``type`` of ``detailed``, ``summary`` or
+        ``metadata``; the metadata line comes last. Device state must be
+        loaded first with ``processor.load_device_state()``.
+        """
+        for kind, row in self.processor.iter_attendance_stream():
+            yield orjson.dumps({'type': kind, **row}) + b'\n'
+
     def process_and_save_attendance(self, output_dir: str = '.'):
         """Process attendance data and save to files."""
         try:
@@ -39,7 +59,8 @@ class AttendanceManager:
             self.file_manager.save_attendance_json(attendance_data, output_dir)
 
             # Test Voice: Say Thank You
-            self.processor.conn.test_voice()
+            with self.processor.session() as conn:
+                conn.test_voice()
 
             return True
         except Exception as e:
@@ -1,8 +1,50 @@
-from datetime import datetime, time
+import itertools
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from operator import itemgetter
+import numpy as np
 import pandas as pd
 from app.zkteko.base import ZktekoBase
 from app.zkteko.user.user_manager import UserManager
-import asyncio
+from app.zkteko.attendance.punch_store import punch_store, encode_cursor, decode_cursor
+from app.zkteko.attendance.result_cache import result_cache
+from app.zkteko.attendance.punch_archive import punch_archive
+from app.zkteko.attendance.rollups import rollup_rules
+from app.core.config import settings
+from app.core.metrics import timed, record_download
+from app.zkteko.user.user_cache import user_cache
+from app.zkteko.poller import device_poller
+
+
+PUNCH_COLUMNS = ['uid', 'timestamp', 'name', 'date', 'human_readable_date', 'time', 'seconds']
+RECORD_COLUMNS = ['uid', 'name', 'date', 'time', 'is_late_arrival', 'is_early_departure',
+                  'first_punch', 'last_punch']
+
+# 12-hour label of every minute of the day, indexed by minute
+TIME_LABELS = np.array([time(hour, minute).strftime('%I:%M %p')
+                        for hour in range(24) for minute in range(60)], dtype=object)
+
+
+def seconds_of_day(t: time) -> int:
+    """Seconds since midnight of a time of day."""
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def frame_to_records(df: pd.DataFrame) -> list:
+    """Convert a frame to row dicts, one column at a time.
+
+    Columns are unboxed with ``tolist()`` in bulk, which yields plain
+    Python values and is several times faster than ``to_dict('records')``.
+    """
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[column].tolist() for column in columns))]
+
+
+@lru_cache(maxsize=4096)
+def date_labels(day: date) -> tuple:
+    """Return the ``YYYY-MM-DD`` key and human readable label of a day."""
+    key = day.strftime('%Y-%m-%d')
+    return key, AttendanceProcessor.format_date_human_readable(key)
 
 
 class AttendanceProcessor(ZktekoBase):
@@ -12,8 +54,13 @@ class AttendanceProcessor(ZktekoBase):
                  force_udp: bool = False, ommit_ping: bool = False, timeout: int = 5,
                  office_start: time = time(9, 0),    # 9:00 AM
                  office_end: time = time(17, 0),     # 5:00 PM
-                 grace_period: int = 30):            # 30 minutes grace period
-        """Initialize AttendanceProcessor with device connection and timing parameters."""
+                 grace_period: int = 30,             # 30 minutes grace period
+                 start_date: date = None, end_date: date = None,
+                 user_ids: list = None, limit: int = None, cursor: str = None):
+        """Initialize AttendanceProcessor with device connection, timing and filter parameters.
+
+        Raises ValueError if ``cursor`` is malformed.
+        """
         super().__init__(ip=ip, port=port, password=password,
                          force_udp=force_udp, ommit_ping=ommit_ping, timeout=timeout)
 
@@ -32,6 +79,17 @@ class AttendanceProcessor(ZktekoBase):
         self.grace_end = (
             grace_minutes + pd.Timedelta(minutes=grace_period)).time()
 
+        # Filters pushed down to the punch store
+        self.start_date = start_date
+        self.end_date = end_date
+        self.user_ids = user_ids
+        self.limit = limit
+        if cursor is not None:
+            cursor_date = decode_cursor(cursor)
+            self.start_date = cursor_date if start_date is None else max(
+                start_date, cursor_date)
+        self.next_cursor = None
+
         # Initialize user manager
         self.user_manager = UserManager(ip=ip, port=port, password=password,
                                         force_udp=force_udp, ommit_ping=ommit_ping,
@@ -43,97 +101,255 @@ class AttendanceProcessor(ZktekoBase):
         date_obj = datetime.strptime(date_str, '%Y-%m-%d')
         return date_obj.strftime('%d %B %A %Y')  # e.g., "16 April Monday 2024"
 
+    def sync_punches(self) -> int:
+        """Pull the device log into the local punch store if it has changed.
+
+        The device record count is compared with the stored high-water mark
+        first, so an unchanged log costs one small command instead of a full
+        download. Returns the number of new punches stored.
+        """
+        with self.session() as conn:
+            conn.read_sizes()
+            state = punch_store.get_sync_state(self.device_key)
+            if state is not None and state['record_count'] == conn.records:
+                return 0
+
+            with timed('download_attendance', self.device_key), self.device_disabled():
+                attendances = conn.get_attendance()
+            record_download(self.device_key, 'punches', len(attendances))
+            # get_attendance re-reads the sizes, so this count matches the download
+            inserted = punch_store.add_punches(self.device_key, attendances, conn.records)
+        if settings.archive_enabled:
+            # Also picks up punches stored by live capture since the last sync
+            punch_archive.archive_device(self.device_key)
+        return inserted
+
     def get_raw_attendance(self):
-        """Get raw attendance records from device."""
-        try:
-            self.connect()
-            return self.conn.get_attendance()
-        finally:
-            self.disconnect()
-
-    def process_attendance_records(self):
-        """Process attendance records and return processed data."""
-        # Get user dictionary
-        self.user_manager.setup_user_dictionary()
-
-        # Get attendance records
-        attendances = self.get_raw_attendance()
-        allAttendances = []
-        daily_punches = {}
-
-        for attendance in attendances:
-            try:
-                user_id = int(attendance.user_id)
-                name = self.user_manager.get_user_name(user_id)
-
-                # Format the timestamp
-                date = attendance.timestamp.strftime('%Y-%m-%d')
-                human_readable_date = self.format_date_human_readable(date)
-                time_str = attendance.timestamp.strftime('%I:%M %p')
-                punch_time = attendance.timestamp.time()
-
-                # Create a unique key for each person-day combination
-                person_day_key = (name, date)
-
-                # Track first and last punch
-                if person_day_key not in daily_punches:
-                    daily_punches[person_day_key] = {
-                        'first_punch': punch_time,
-                        'last_punch': punch_time,
-                        'human_readable_date': human_readable_date
-                    }
-                else:
-                    if punch_time < daily_punches[person_day_key]['first_punch']:
-                        daily_punches[person_day_key]['first_punch'] = punch_time
-                    if punch_time > daily_punches[person_day_key]['last_punch']:
-                        daily_punches[person_day_key]['last_punch'] = punch_time
-
-                allAttendances.append({
-                    'uid': attendance.user_id,
-                    'name': name,
-                    'date': date,
-                    'human_readable_date': human_readable_date,
-                    'time': time_str,
-                    'punch_time': punch_time
-                })
-
-            except (ValueError, TypeError) as e:
-                print(f"Error processing attendance: {e}")
-                continue
-
-        return allAttendances, daily_punches
-
-    def create_attendance_records(self, allAttendances, daily_punches):
-        """Create processed attendance records."""
-        df = pd.DataFrame(allAttendances)
-        processed_records = []
-
-        for (name, date), punches in daily_punches.items():
-            first_punch = punches['first_punch']
-            last_punch = punches['last_punch']
-            human_readable_date = punches['human_readable_date']
-
-            # Check for late arrival and early departure
-            is_late = first_punch > self.grace_start
-            left_early = last_punch < self.grace_end
-
-            # Get all punches for this person-day
-            day_records = df[(df['name'] == name) & (
-                df['date'] == date)].sort_values('punch_time')
-
-            for _, record in day_records.iterrows():
-                processed_records.append({
-                    'uid': record['uid'],
-                    'name': name,
-                    'date': human_readable_date,
-                    'time': record['time'],
-                    'is_late_arrival': is_late,
-                    'is_early_departure': left_early,
-                    'first_punch': first_punch.strftime('%I:%M %p'),
-                    'last_punch': last_punch.strftime('%I:%M %p')
-                })
-
-        return pd.DataFrame(processed_records)
+        """Get raw attendance records, syncing new punches from the device first.
+
+        Only punches matching the date, user and page filters are returned.
+        """
+        if not device_poller.serves(self.device_key):
+            self.sync_punches()
+        return self.query_punches()
+
+    def query_punches(self):
+        """Get punches matching the filters from the punch store, without device I/O."""
+        with timed('query_punches', self.device_key):
+            punches, next_day = punch_store.get_punches(
+                self.device_key, start_date=self.start_date, end_date=self.end_date,
+                user_ids=self.user_ids, limit=self.limit)
+        self.next_cursor = encode_cursor(next_day) if next_day else None
+        return punches
+
+    def load_device_state(self):
+        """Refresh the user dictionary and sync new punches in one pooled session.
+
+        Devices kept current by the background poller are read from local
+        state only.
+        """
+        if device_poller.serves(self.device_key):
+            self.user_manager.setup_user_dictionary()
+            return
+
+        with self.session():
+            self.user_manager.setup_user_dictionary()
+            self.sync_punches()
+
+    def poll(self) -> int:
+        """Re-download the user table and sync new punches in one pooled session.
+
+        Used by the background poller; returns the number of new punches. The
+        device log is archived and cleared once it reaches
+        ``settings.clear_log_threshold`` punches.
+        """
+        with self.session() as conn:
+            self.user_manager.get_all_users(refresh=True)
+            inserted = self.sync_punches()
+            if settings.clear_log_threshold and conn.records >= settings.clear_log_threshold:
+                self.archive_and_clear()
+        return inserted
+
+    def archive_and_clear(self) -> dict:
+        """Store the device log locally, verify it, then clear it on the device.
+
+        The device stays disabled from the download to the clear, so no punch
+        can arrive in between. The punches are committed with a disk sync and
+        read back (and, with the archive enabled, archived and read back)
+        before ``clear_attendance`` is called. Raises RuntimeError, leaving the
+        device log untouched, if any check fails.
+        """
+        with self.session() as conn, self.device_disabled():
+            attendances = conn.get_attendance()
+            records = conn.records
+            inserted = punch_store.add_punches(
+                self.device_key, attendances, records, durable=True)
+            record_download(self.device_key, 'punches', len(attendances))
+
+            missing = punch_store.count_missing(self.device_key, attendances)
+            if missing:
+                raise RuntimeError(
+                    f"{missing} punches missing from the punch store; device log not cleared")
+            if settings.archive_enabled:
+                punch_archive.archive_device(self.device_key)
+                missing = len(punch_archive.missing_punches(self.device_key, attendances))
+                if missing:
+                    raise RuntimeError(
+                        f"{missing} punches missing from the archive; device log not cleared")
+
+            conn.read_sizes()
+            if conn.records != records:
+                raise RuntimeError("Device log changed during the download; not cleared")
+            if records:
+                conn.clear_attendance()
+                conn.read_sizes()
+            punch_store.set_record_count(self.device_key, conn.records)
+
+        return {
+            'device': self.device_key,
+            'downloaded': len(attendances),
+            'stored': inserted,
+            'cleared': records,
+            'remaining': conn.records
+        }
+
+    def collect_punches(self, attendances) -> pd.DataFrame:
+        """Build a typed punch frame with date keys and display labels.
+
+        Timestamps become one datetime column and every derived column is
+        computed column-wise; date labels are formatted once per distinct
+        day and time labels come from a per-minute table. Punches whose
+        user ID is not numeric are skipped.
+        """
+        frame = pd.DataFrame({
+            'uid': [attendance.user_id for attendance in attendances],
+            'timestamp': pd.to_datetime([attendance.timestamp for attendance in attendances])
+        }, columns=PUNCH_COLUMNS[:2])
+
+        user_ids = pd.to_numeric(frame['uid'], errors='coerce')
+        valid = user_ids.notna() & (user_ids % 1 == 0)
+        if not valid.all():
+            print(f"Error processing attendance: skipped {int((~valid).sum())} "
+                  f"punches with non-numeric user IDs")
+            frame = frame[valid]
+            user_ids = user_ids[valid]
+        if frame.empty:
+            return pd.DataFrame(columns=PUNCH_COLUMNS)
+
+        frame = frame.reset_index(drop=True)
+        frame['name'] = user_ids.astype('int64').map(
+            self.user_manager.user_dict).fillna('Unknown').to_numpy()
+
+        # Each distinct day is formatted once and broadcast back
+        day_codes, days = pd.factorize(frame['timestamp'].dt.normalize())
+        labels = [date_labels(day.date()) for day in days]
+        frame['date'] = np.array([label[0] for label in labels], dtype=object)[day_codes]
+        frame['human_readable_date'] = np.array(
+            [label[1] for label in labels], dtype=object)[day_codes]
+
+        timestamps = frame['timestamp'].dt
+        frame['seconds'] = (timestamps.hour * 3600 + timestamps.minute * 60 +
+                            timestamps.second).astype('int64')
+        frame['time'] = TIME_LABELS[frame['seconds'].to_numpy() // 60]
+        return frame[PUNCH_COLUMNS]
+
+    def create_attendance_records(self, punches: pd.DataFrame) -> pd.DataFrame:
+        """Create processed attendance records from a punch frame.
+
+        Records are grouped by person-day in order of first appearance and
+        sorted by punch time within a day; first/last punch and late/early
+        flags are computed per group with column operations.
+        """
+        if punches.empty:
+            return pd.DataFrame(columns=RECORD_COLUMNS)
+
+        person_day = punches.groupby(['name', 'date'], sort=False)
+        first = person_day['seconds'].transform('min').to_numpy()
+        last = person_day['seconds'].transform('max').to_numpy()
+
+        records = pd.DataFrame({
+            'group': person_day.ngroup().to_numpy(),
+            'seconds': punches['seconds'].to_numpy(),
+            'uid': punches['uid'].to_numpy(),
+            'name': punches['name'].to_numpy(),
+            'date': punches['human_readable_date'].to_numpy(),
+            'time': punches['time'].to_numpy(),
+            'is_late_arrival': first > seconds_of_day(self.grace_start),
+            'is_early_departure': last < seconds_of_day(self.grace_end),
+            'first_punch': TIME_LABELS[first // 60],
+            'last_punch': TIME_LABELS[last // 60]
+        })
+        records = records.sort_values(['group', 'seconds'], kind='stable')
+        return records[RECORD_COLUMNS].reset_index(drop=True)
+
+    def iter_person_days(self, df_processed: pd.DataFrame):
+        """Yield the summary row and detailed rows of each person-day.
+
+        Expects records from ``create_attendance_records``, where each
+        person-day's rows are contiguous.
+        """
+        rows = frame_to_records(df_processed)
+        for (name, date), group in itertools.groupby(rows, key=itemgetter('name', 'date')):
+            records = list(group)
+            summary = {
+                'date': date,
+                'name': name,
+                'punch_count': len(records),
+                'is_late_arrival': records[0]['is_late_arrival'],
+                'is_early_departure': records[0]['is_early_departure'],
+                'first_punch': records[0]['first_punch'],
+                'last_punch': records[0]['last_punch']
+            }
+            yield summary, records
+
+    def iter_days(self):
+        """Yield ``(day, person_days)`` for each calendar day in the punch store.
+
+        ``person_days`` is a list of ``(summary, records)`` pairs as from
+        ``iter_person_days``. Reads only the punch store, so
+        ``load_device_state`` must run first. Punches are processed one day at
+        a time, which keeps memory bounded by a single day. ``limit`` and
+        ``cursor`` paging do not apply.
+        """
+        day_punches = []
+        punches = punch_store.iter_punches(
+            self.device_key, start_date=self.start_date, end_date=self.end_date,
+            user_ids=self.user_ids)
+        for attendance in itertools.chain(punches, [None]):
+            if day_punches and (attendance is None or
+                                attendance.timestamp.date() != day_punches[-1].timestamp.date()):
+                frame = self.collect_punches(day_punches)
+                yield (day_punches[-1].timestamp.date(),
+                       list(self.iter_person_days(self.create_attendance_records(frame))))
+                day_punches = []
+            if attendance is not None:
+                day_punches.append(attendance)
+
+    def iter_attendance_stream(self):
+        """Yield ``(kind, row)`` pairs for detailed records, summaries and metadata.
+
+        Reads only the punch store, so ``load_device_state`` must run first.
+        """
+        total_records = 0
+        employees = set()
+        start = end = None
+
+        for _, person_days in self.iter_days():
+            for summary, records in person_days:
+                for record in records:
+                    yield 'detailed', record
+                yield 'summary', summary
+                total_records += len(records)
+                employees.add(summary['name'])
+                start = summary['date'] if start is None else min(start, summary['date'])
+                end = summary['date'] if end is None else max(end, summary['date'])
+
+        yield 'metadata', {
+            'total_records': total_records,
+            'total_employees': len(employees),
+            'date_range': {'start': start, 'end': end},
+            'generated_at': datetime.now().isoformat()
+        }
 
     def create_daily_summary(self, df_processed):
         """Create daily summary from processed records."""
@@ -150,23 +366,156 @@ class AttendanceProcessor(ZktekoBase):
 
         return daily_summary
 
-    async def get_attendance_data(self):
-        """Get complete attendance data in structured format."""
+    def _user_name(self, user_id: str) -> str:
+        """Name of a device user ID, looked up the way punches are."""
+        return self.user_manager.user_dict.get(int(user_id), 'Unknown') \
+            if user_id.isdigit() else 'Unknown'
+
+    def get_daily_report(self) -> list:
+        """Per-person-day first/last punch, flags and hours, read from the rollups.
+
+        The device is synced first; no raw punches are processed.
+        """
+        self.load_device_state()
+        rules = rollup_rules(self.office_start, self.office_end, self.grace_period)
+        with timed('query_rollups', self.device_key):
+            rows = punch_store.get_person_days(
+                self.device_key, rules, start_date=self.start_date,
+                end_date=self.end_date, user_ids=self.user_ids)
+        return [{
+            'user_id': row['user_id'],
+            'name': self._user_name(row['user_id']),
+            'date': row['day'],
+            'first_punch': TIME_LABELS[row['first_second'] // 60],
+            'last_punch': TIME_LABELS[row['last_second'] // 60],
+            'punch_count': row['punch_count'],
+            'is_late_arrival': bool(row['is_late_arrival']),
+            'is_early_departure': bool(row['is_early_departure']),
+            'hours_worked': round((row['last_second'] - row['first_second']) / 3600, 2)
+        } for row in rows]
+
+    def get_monthly_report(self) -> list:
+        """Per-person-month days present, late arrivals, early departures and hours.
+
+        Whole months overlapping the date filters are reported. The device is
+        synced first; no raw punches are processed.
+        """
+        self.load_device_state()
+        rules = rollup_rules(self.office_start, self.office_end, self.grace_period)
+        with timed('query_rollups', self.device_key):
+            rows = punch_store.get_person_months(
+                self.device_key, rules, start_date=self.start_date,
+                end_date=self.end_date, user_ids=self.user_ids)
+        return [{
+            'user_id': row['user_id'],
+            'name': self._user_name(row['user_id']),
+            'month': row['month'],
+            'days_present': row['days_present'],
+            'late_arrivals': row['late_arrivals'],
+            'early_departures': row['early_departures'],
+            'hours_worked': round(row['seconds_worked'] / 3600, 2)
+        } for row in rows]
+
+    def get_shift_report(self, roster) -> list:
+        """Per-person shift-day attendance evaluated against a compiled roster.
+
+        Punches are evaluated column-wise by ``roster.evaluate``; absences are
+        reported for every scheduled day without punches. Without date filters
+        the current month so far is reported. The device is synced first.
+        """
+        self.load_device_state()
+        end = self.end_date or date.today()
+        start = self.start_date or end.replace(day=1)
+        if start > end:
+            return []
+        with timed('query_punches', self.device_key):
+            # One extra day lets overnight shifts on the last day be closed
+            user_ids, timestamps = punch_store.get_punch_columns(
+                self.device_key, start_date=start, end_date=end + timedelta(days=1),
+                user_ids=self.user_ids)
+        # Punches and the roster carry user IDs, not the device-internal uids
+        names = {str(user.user_id): user.name for user in self.user_manager.get_all_users()}
+        with timed('evaluate_roster', self.device_key):
+            frame = roster.evaluate(user_ids, timestamps, start, end, users=list(names))
+            if self.user_ids:
+                frame = frame[frame['user_id'].isin([str(user_id) for user_id in self.user_ids])]
+
+        with timed('to_records', self.device_key):
+            present = frame['punch_count'].to_numpy() > 0
+            first = frame['first_second'].to_numpy()
+            last = frame['last_second'].to_numpy()
+            report = pd.DataFrame({
+                'user_id': frame['user_id'].to_numpy(),
+                'name': [names.get(user_id, 'Unknown') for user_id in frame['user_id'].tolist()],
+                'date': np.datetime_as_string(frame['day'].to_numpy(), unit='D').astype(object),
+                'shift': frame['shift'].to_numpy(),
+                'status': frame['status'].to_numpy(),
+                'is_holiday': frame['is_holiday'].to_numpy(),
+                'first_punch': np.where(present, TIME_LABELS[first % 86400 // 60], None),
+                'last_punch': np.where(present, TIME_LABELS[last % 86400 // 60], None),
+                'punch_count': frame['punch_count'].to_numpy(),
+                'is_late_arrival': frame['is_late_arrival'].to_numpy(),
+                'is_early_departure': frame['is_early_departure'].to_numpy(),
+                'hours_worked': np.round((last - first) / 3600, 2)
+            })
+            return frame_to_records(report)
+
+    def result_key(self) -> tuple:
+        """Key identifying this request's result for the current log and user table."""
+        state = punch_store.get_sync_state(self.device_key) or {}
+        return (self.device_key, self.office_start, self.office_end, self.grace_period,
+                self.start_date, self.end_date,
+                tuple(self.user_ids) if self.user_ids else None, self.limit,
+                state.get('record_count'), state.get('last_timestamp'),
+                user_cache.get_version(self.device_key))
+
+    def get_attendance_data(self):
+        """Get complete attendance data in structured format.
+
+        The device is synced first; the result is then served from the result
+        cache until the log, the user table or the request settings change.
+        The returned dict is shared and must not be mutated.
+        """
+        self.load_device_state()
+        return result_cache.get_or_compute(self.result_key(), self.build_attendance_data)
+
+    def build_attendance_data(self):
+        """Build attendance data from the punch store and the loaded user dictionary."""
         try:
             # Process attendance records
-            allAttendances, daily_punches = self.process_attendance_records()
+            attendances = self.query_punches()
+            with timed('collect_punches', self.device_key):
+                punches = self.collect_punches(attendances)
+
+            if punches.empty:
+                return {
+                    'summary': [],
+                    'detailed': [],
+                    'metadata': {
+                        'total_records': 0,
+                        'total_employees': 0,
+                        'date_range': {'start': None, 'end': None},
+                        'generated_at': datetime.now().isoformat(),
+                        'next_cursor': self.next_cursor
+                    }
+                }
 
             # Create processed records
-            df_processed = self.create_attendance_records(
-                allAttendances, daily_punches)
+            with timed('create_attendance_records', self.device_key):
+                df_processed = self.create_attendance_records(punches)
 
             # Create daily summary
-            daily_summary = self.create_daily_summary(df_processed)
+            with timed('create_daily_summary', self.device_key):
+                daily_summary = self.create_daily_summary(df_processed)
 
             # Create response data
+            with timed('to_records', self.device_key):
+                summary = frame_to_records(daily_summary)
+                # Detailed rows carry every AttendanceRecord field, as validation would add
+                detailed = frame_to_records(df_processed.assign(device=None))
             attendance_data = {
-                'summary': daily_summary.to_dict('records'),
-                'detailed': df_processed.to_dict('records'),
+                'summary': summary,
+                'detailed': detailed,
                 'metadata': {
                     'total_records': len(df_processed),
                     'total_employees': len(df_processed['name'].unique()),
@@ -174,7 +523,8 @@ class AttendanceProcessor(ZktekoBase):
                         'start': df_processed['date'].min(),
                         'end': df_processed['date'].max()
                     },
-                    'generated_at': datetime.now().isoformat()
+                    'generated_at': datetime.now().isoformat(),
+                    'next_cursor': self.next_cursor
                 }
             }
 
@@ -1,8 +1,19 @@
+import csv
+import io
 import json
 import pandas as pd
+from openpyxl import Workbook
 from pathlib import Path
 
 
+REPORT_COLUMNS = {
+    'summary': ['date', 'name', 'punch_count', 'is_late_arrival', 'is_early_departure',
+                'first_punch', 'last_punch'],
+    'detailed': ['uid', 'name', 'date', 'time', 'is_late_arrival', 'is_early_departure',
+                 'first_punch', 'last_punch']
+}
+
+
 class FileManager:
     """Class to handle file operations for attendance data."""
 
@@ -12,25 +23,78 @@ class FileManager:
         # Sort the dataframe by date and name
         df = df.sort_values(['date', 'name'])
 
-        # Get unique dates
-        unique_dates = df['date'].unique()
-
-        # Create a new list to store rows with spacing
+        # One pass over the sorted rows, adding an empty row whenever the date changes
+        empty_row = {col: '' for col in df.columns}
         rows_with_spacing = []
-
-        # Process each date
-        for date in unique_dates:
-            # Add all rows for current date
-            date_rows = df[df['date'] == date]
-            rows_with_spacing.extend(date_rows.to_dict('records'))
-
-            # Add an empty row after each date (except the last date)
-            if date != unique_dates[-1]:
-                empty_row = {col: '' for col in df.columns}
+        previous_date = None
+        for row in df.to_dict('records'):
+            if previous_date is not None and row['date'] != previous_date:
                 rows_with_spacing.append(empty_row)
+            rows_with_spacing.append(row)
+            previous_date = row['date']
 
         # Create new DataFrame with spacing
-        return pd.DataFrame(rows_with_spacing)
+        return pd.DataFrame(rows_with_spacing, columns=df.columns)
+
+    @staticmethod
+    def iter_report_rows(days, report: str = 'summary'):
+        """Yield ``(day, row)`` for a report, in date, name and punch time order.
+
+        ``days`` yields ``(day, person_days)`` in date order, as from
+        ``AttendanceProcessor.iter_days``. A ``None`` row separates days.
+        """
+        first = True
+        for day, person_days in days:
+            if not person_days:
+                continue
+            if not first:
+                yield day, None
+            first = False
+            # Stable sort keeps each person's punches in time order
+            for summary, records in sorted(person_days, key=lambda item: item[0]['name']):
+                if report == 'summary':
+                    yield day, summary
+                else:
+                    yield from ((day, record) for record in records)
+
+    @staticmethod
+    def iter_csv(days, report: str = 'summary', batch_size: int = 1000):
+        """Yield a summary or detailed CSV report in chunks, with a blank row between days."""
+        columns = REPORT_COLUMNS[report]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for count, (_, row) in enumerate(FileManager.iter_report_rows(days, report), 1):
+            writer.writerow([''] * len(columns) if row is None
+                            else [row[column] for column in columns])
+            if count % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    @staticmethod
+    def write_xlsx(days, fileobj, report: str = 'summary'):
+        """Write a report as XLSX with one sheet per month, row by row.
+
+        Uses openpyxl's write-only mode, so rows are not kept in memory.
+        """
+        columns = REPORT_COLUMNS[report]
+        workbook = Workbook(write_only=True)
+        sheet = None
+        month = None
+        for day, row in FileManager.iter_report_rows(days, report):
+            if day.strftime('%Y-%m') != month:
+                month = day.strftime('%Y-%m')
+                sheet = workbook.create_sheet(title=month)
+                sheet.append(columns)
+                if row is None:
+                    continue  # No separator at the top of a new sheet
+            sheet.append([None] * len(columns) if row is None
+                         else [row[column] for column in columns])
+        if sheet is None:
+            workbook.create_sheet(title='Attendance').append(columns)
+        workbook.save(fileobj)
 
     @staticmethod
     def save_attendance_files(df_processed, output_dir: str = '.'):
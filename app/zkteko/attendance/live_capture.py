@@ -0,0 +1,223 @@
+import asyncio
+import threading
+
+from app.zkteko.base import ZktekoBase
+from app.zkteko.device_lock import device_locks
+from app.zkteko.user.user_manager import UserManager
+from app.zkteko.user.user_cache import user_cache
+from app.zkteko.attendance.punch_store import punch_store
+
+
+class LiveCapture(ZktekoBase):
+    """Worker thread relaying a device's live punch events to subscribers.
+
+    Uses its own session rather than a pooled one, since a capturing
+    session is blocked waiting for events. Every punch is appended to the
+    punch store and published to each subscriber queue.
+
+    With worker coordination, the session holds the device's cross-process
+    lock like a pooled one. It steps aside while other operations wait for
+    the device and reconnects after them.
+    """
+
+    def __init__(self, ip: str, port: int = 4370, password: int = 0,
+                 force_udp: bool = False, ommit_ping: bool = False, timeout: int = 5,
+                 poll_timeout: int = 1, retry_delay: float = 5, queue_size: int = 1000):
+        """Initialize the worker; ``poll_timeout`` bounds how long stopping takes."""
+        super().__init__(ip=ip, port=port, password=password,
+                         force_udp=force_udp, ommit_ping=ommit_ping, timeout=timeout)
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self.queue_size = queue_size
+        self.user_manager = UserManager(ip=ip, port=port, password=password,
+                                        force_udp=force_udp, ommit_ping=ommit_ping,
+                                        timeout=timeout)
+        self.subscribers = set()
+        self._loop = None
+        self._stop = threading.Event()
+        self._give_way = threading.Event()
+        self._thread = None
+
+    def subscribe(self) -> asyncio.Queue:
+        """Return a new event queue; must be called on the event loop."""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def _publish(self, event: dict) -> None:
+        """Hand an event to every subscriber (runs on the event loop)."""
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                print(f"Dropping live event for a slow subscriber of {self.device_key}")
+
+    def _emit(self, event: dict) -> None:
+        """Publish an event from the worker thread."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._publish, event)
+
+    def _update_names(self, attendance) -> None:
+        """Reload names from the user cache when the punching user is not known yet.
+
+        Never downloads users, which would take a second session while the
+        capture holds one; an expired table is refreshed before reconnecting.
+        """
+        try:
+            if int(attendance.user_id) in self.user_manager.user_dict:
+                return
+        except (ValueError, TypeError):
+            return
+        names = user_cache.get_names(self.device_key)
+        if names is not None:
+            self.user_manager.user_dict = names
+
+    def to_event(self, attendance) -> dict:
+        """Describe a punch the way /get_attendance rows do."""
+        try:
+            name = self.user_manager.get_user_name(int(attendance.user_id))
+        except (ValueError, TypeError):
+            name = 'Unknown'
+        date = attendance.timestamp.strftime('%Y-%m-%d')
+        return {
+            'type': 'punch',
+            'device': self.device_key,
+            'uid': attendance.user_id,
+            'name': name,
+            'date': date,
+            'human_readable_date': attendance.timestamp.strftime('%d %B %A %Y'),
+            'time': attendance.timestamp.strftime('%I:%M %p'),
+            'timestamp': attendance.timestamp.isoformat(),
+            'status': attendance.status,
+            'punch': attendance.punch
+        }
+
+    def _wait_for_device(self):
+        """Queue for the device's cross-process lock; returns the ticket (None once stopped).
+
+        Waits without a ticket while another worker's capture holds the
+        device, so two captures do not keep handing it to each other.
+        """
+        waiting = False
+        while not self._stop.is_set():
+            if device_locks.is_captured(self.device_key):
+                if not waiting:
+                    self._emit({'type': 'status', 'device': self.device_key, 'state': 'waiting'})
+                    waiting = True
+                self._stop.wait(self.poll_timeout)
+                continue
+            try:
+                return device_locks.acquire(self.device_key, timeout=self.poll_timeout,
+                                            capture=True)
+            except ConnectionError:
+                pass  # Still queued behind others; check for stop and retry
+        return None
+
+    def give_way(self) -> None:
+        """Close the session at the next poll so a waiting operation can use the device."""
+        self._give_way.set()
+
+    def _capture(self) -> None:
+        """Capture events on one session until stopped, asked to give way or failed."""
+        ticket = self._wait_for_device()
+        try:
+            if self._stop.is_set():
+                return
+            self._give_way.clear()
+            conn = self._open_connection()
+            try:
+                self._emit({'type': 'status', 'device': self.device_key, 'state': 'connected'})
+                for attendance in conn.live_capture(new_timeout=self.poll_timeout):
+                    if self._stop.is_set() or self._give_way.is_set():
+                        # Let the generator unregister events before it returns
+                        conn.end_live_capture = True
+                        continue
+                    if attendance is None:
+                        continue
+                    punch_store.append_punches(self.device_key, [attendance])
+                    self._update_names(attendance)
+                    self._emit(self.to_event(attendance))
+            finally:
+                conn.disconnect()
+        finally:
+            device_locks.release(ticket)
+
+    def run(self) -> None:
+        """Capture events, reconnecting after failures, until ``stop`` is called."""
+        while not self._stop.is_set():
+            try:
+                self.user_manager.setup_user_dictionary()
+                self._capture()
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                print(f"Error capturing live events from {self.device_key}: {error}")
+                self._emit({'type': 'status', 'device': self.device_key,
+                            'state': 'error', 'error': error})
+                self._stop.wait(self.retry_delay)
+
+    def start(self) -> None:
+        """Start the worker thread."""
+        self._thread = threading.Thread(
+            target=self.run, name=f"zk-live-{self.device_key}", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = False) -> None:
+        """Ask the worker to stop; it exits within ``poll_timeout`` seconds."""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+
+class LiveCaptureManager:
+    """One live-capture worker per device, shared by all its subscribers."""
+
+    def __init__(self):
+        self._workers = {}
+
+    def subscribe(self, device_settings):
+        """Return the device's worker and a new event queue, starting the worker if needed."""
+        key = (device_settings.ip, device_settings.port)
+        worker = self._workers.get(key)
+        if worker is None:
+            worker = LiveCapture(
+                ip=device_settings.ip,
+                port=device_settings.port,
+                password=device_settings.password,
+                force_udp=device_settings.force_udp,
+                ommit_ping=device_settings.ommit_ping,
+                timeout=device_settings.timeout)
+            self._workers[key] = worker
+            queue = worker.subscribe()
+            worker.start()
+        else:
+            queue = worker.subscribe()
+        return worker, queue
+
+    def give_way(self, device: str) -> None:
+        """Have the capture of ``device`` step aside for an operation waiting for it."""
+        for worker in list(self._workers.values()):
+            if worker.device_key == device:
+                worker.give_way()
+
+    def unsubscribe(self, worker: LiveCapture, queue: asyncio.Queue) -> None:
+        """Drop a subscriber, stopping the worker when it was the last one."""
+        worker.subscribers.discard(queue)
+        if not worker.subscribers:
+            worker.stop()
+            key = (worker.ip, worker.port)
+            if self._workers.get(key) is worker:
+                del self._workers[key]
+
+    def stop_all(self) -> None:
+        """Stop every worker and wait for them to exit."""
+        workers = list(self._workers.values())
+        self._workers = {}
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.stop(wait=True)
+
+
+live_capture_manager = LiveCaptureManager()
+device_locks.on_contended(live_capture_manager.give_way)
@@ -0,0 +1,171 @@
+import os
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from app.core.config import settings
+from app.zkteko.attendance.punch_store import punch_store
+
+
+SCHEMA = pa.schema([
+    ('user_id', pa.string()),
+    ('uid', pa.int32()),
+    ('timestamp', pa.timestamp('s')),
+    ('status', pa.int16()),
+    ('punch', pa.int16()),
+])
+
+PARTITION_SCHEMA = pa.schema([('device', pa.string()), ('month', pa.string())])
+
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+
+DATASET_SCHEMA = pa.unify_schemas([SCHEMA, PARTITION_SCHEMA])
+
+WATERMARK_FILE = '_watermark'
+
+
+class PunchArchive:
+    """Append-only Parquet archive of punches, partitioned by device and month.
+
+    Files live under ``device=<ip:port>/month=<YYYY-MM>/``. Parts are only
+    ever added, except that months before the one being appended to are
+    compacted into a single file once they are closed. Reads prune
+    partitions by device and month and push timestamp and user filters
+    down to the Parquet row groups.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def _device_dir(self, device: str) -> Path:
+        return self.root / f"device={quote(device, safe='')}"
+
+    def get_watermark(self, device: str):
+        """Return the timestamp of the newest archived punch of ``device``, or None."""
+        path = self._device_dir(device) / WATERMARK_FILE
+        if not path.exists():
+            return None
+        return datetime.fromisoformat(path.read_text().strip())
+
+    def _compact(self, month_dir: Path) -> None:
+        """Merge the parts of a closed month into one file."""
+        parts = sorted(month_dir.glob('*.parquet'))
+        if len(parts) < 2:
+            return
+        table = pq.read_table(parts, schema=SCHEMA).sort_by([('timestamp', 'ascending')])
+        tmp = month_dir / f".compact-{uuid.uuid4().hex}.parquet"
+        pq.write_table(table, tmp)
+        tmp.rename(month_dir / f"part-{uuid.uuid4().hex}.parquet")
+        for part in parts:
+            part.unlink()
+
+    def append(self, device: str, attendances) -> int:
+        """Append the punches of ``device`` that are not archived yet; returns how many.
+
+        Punches are matched with the archive by timestamp and user ID, so late
+        punches older than the newest archived one are still added and
+        repeated calls never duplicate rows.
+        """
+        with self._lock:
+            months = {}
+            for a in self.missing_punches(device, list(attendances)):
+                months.setdefault(a.timestamp.strftime('%Y-%m'), []).append(a)
+            if not months:
+                return 0
+
+            device_dir = self._device_dir(device)
+            for month, rows in months.items():
+                rows.sort(key=lambda a: a.timestamp)
+                table = pa.table({
+                    'user_id': [str(a.user_id) for a in rows],
+                    'uid': [int(a.uid or 0) for a in rows],
+                    'timestamp': [a.timestamp for a in rows],
+                    'status': [a.status for a in rows],
+                    'punch': [a.punch for a in rows],
+                }, schema=SCHEMA)
+                month_dir = device_dir / f"month={month}"
+                month_dir.mkdir(parents=True, exist_ok=True)
+                pq.write_table(table, month_dir / f"part-{uuid.uuid4().hex}.parquet")
+
+            newest = max(months)
+            for month_dir in device_dir.glob('month=*'):
+                if month_dir.name < f"month={newest}":
+                    self._compact(month_dir)
+
+            last = max(rows[-1].timestamp for rows in months.values())
+            watermark = self.get_watermark(device)
+            if watermark is not None:
+                last = max(last, watermark)
+            tmp = device_dir / f".{WATERMARK_FILE}-{uuid.uuid4().hex}"
+            tmp.write_text(last.isoformat())
+            os.replace(tmp, device_dir / WATERMARK_FILE)
+            return sum(len(rows) for rows in months.values())
+
+    def archive_device(self, device: str) -> int:
+        """Append the punches of ``device`` that the punch store has not marked archived.
+
+        They are marked only after being written, so a crash in between just
+        repeats the (deduplicated) append.
+        """
+        pending = punch_store.get_unarchived(device)
+        if not pending:
+            return 0
+        appended = self.append(device, pending)
+        punch_store.mark_archived(device, pending)
+        return appended
+
+    def missing_punches(self, device: str, attendances) -> list:
+        """Return those of ``attendances`` that are not in the archive."""
+        if not attendances:
+            return []
+        timestamps = [a.timestamp for a in attendances]
+        table = self.read(device, start_date=min(timestamps).date(),
+                          end_date=max(timestamps).date(), columns=['timestamp', 'user_id'])
+        archived = set(zip(table.column('timestamp').to_pylist(),
+                           table.column('user_id').to_pylist()))
+        return [a for a in attendances
+                if (a.timestamp.replace(microsecond=0), str(a.user_id)) not in archived]
+
+    def read(self, device: str = None, start_date: date = None, end_date: date = None,
+             user_ids: list = None, columns: list = None) -> pa.Table:
+        """Read archived punches matching the filters, touching only matching partitions."""
+        if not self.root.exists():
+            return SCHEMA.empty_table()
+        source = self._device_dir(device) if device else self.root
+        if not source.exists():
+            return SCHEMA.empty_table()
+        dataset = ds.dataset(source, schema=DATASET_SCHEMA, format='parquet', partitioning=PARTITIONING,
+                             partition_base_dir=str(self.root))
+
+        conditions = []
+        if start_date is not None:
+            conditions.append(ds.field('month') >= start_date.strftime('%Y-%m'))
+            conditions.append(ds.field('timestamp') >= pa.scalar(
+                datetime.combine(start_date, datetime.min.time()), pa.timestamp('s')))
+        if end_date is not None:
+            conditions.append(ds.field('month') <= end_date.strftime('%Y-%m'))
+            conditions.append(ds.field('timestamp') < pa.scalar(
+                datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+                pa.timestamp('s')))
+        if user_ids:
+            conditions.append(ds.field('user_id').isin([str(user_id) for user_id in user_ids]))
+
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        table = dataset.to_table(
+            columns=columns or ['device', 'user_id', 'uid', 'timestamp', 'status', 'punch'],
+            filter=expression)
+        if 'timestamp' in table.column_names:
+            table = table.sort_by([('timestamp', 'ascending'), ('user_id', 'ascending')])
+        return table
+
+
+punch_archive = PunchArchive(settings.archive_dir or str(Path(settings.data_dir) / 'archive'))
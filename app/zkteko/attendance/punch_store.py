@@ -0,0 +1,314 @@
+import base64
+import sqlite3
+import threading
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from zk.attendance import Attendance
+
+from app.core.config import settings
+from app.zkteko.attendance import rollups
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punches (
+    device TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    uid INTEGER,
+    status INTEGER,
+    punch INTEGER,
+    archived INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (device, timestamp, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    device TEXT PRIMARY KEY,
+    record_count INTEGER NOT NULL,
+    last_timestamp TEXT,
+    synced_at TEXT NOT NULL
+);
+"""
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def encode_cursor(day: date) -> str:
+    """Encode the first day of the next page as an opaque cursor."""
+    return base64.urlsafe_b64encode(day.isoformat().encode()).decode()
+
+
+def decode_cursor(cursor: str) -> date:
+    """Decode a cursor from ``encode_cursor``; raises ValueError if malformed."""
+    try:
+        return date.fromisoformat(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class PunchStore:
+    """Local SQLite copy of device punch logs with a per-device high-water mark.
+
+    Per-person-day and per-person-month rollups are kept alongside the
+    punches and refreshed in the same transaction that stores new ones.
+    """
+
+    def __init__(self, path: str, rules: dict = None):
+        """Initialize the store; the database is created on first use.
+
+        ``rules`` are the late/early thresholds the month rollups are
+        materialized with (see ``rollups.rollup_rules``).
+        """
+        self.path = path
+        self.rules = rules or rollups.rollup_rules(time(9, 0), time(17, 0), 15)
+        self._local = threading.local()
+
+    def _open(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        """Open a new connection in WAL mode, creating the schema if needed."""
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30,
+                               check_same_thread=check_same_thread)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA + rollups.ROLLUP_SCHEMA)
+        self._migrate(conn)
+        rollups.ensure_built(conn, self.rules)
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """Add the archived marker to stores created before it existed."""
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(punches)')}
+        if 'archived' not in columns:
+            try:
+                conn.execute('ALTER TABLE punches ADD COLUMN archived INTEGER NOT NULL DEFAULT 0')
+            except sqlite3.OperationalError as e:
+                if 'duplicate column' not in str(e):
+                    raise  # Otherwise another worker added it first
+        conn.execute('CREATE INDEX IF NOT EXISTS punches_unarchived '
+                     'ON punches (device, timestamp) WHERE archived = 0')
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    @staticmethod
+    def _filters(device: str, start_date: date = None, end_date: date = None,
+                 user_ids: list = None):
+        """Build the WHERE clause and parameters shared by punch queries."""
+        where = ['device = ?']
+        params = [device]
+        if start_date is not None:
+            where.append('timestamp >= ?')
+            params.append(start_date.isoformat())
+        if end_date is not None:
+            where.append('timestamp < ?')
+            params.append((end_date + timedelta(days=1)).isoformat())
+        if user_ids:
+            where.append(f"user_id IN ({', '.join('?' * len(user_ids))})")
+            params.extend(str(user_id) for user_id in user_ids)
+        return ' AND '.join(where), params
+
+    @staticmethod
+    def _to_attendance(row) -> Attendance:
+        return Attendance(row['user_id'], datetime.fromisoformat(row['timestamp']),
+                          row['status'], row['punch'], row['uid'])
+
+    def get_sync_state(self, device: str):
+        """Return the high-water mark recorded for ``device``, or None."""
+        row = self._connect().execute(
+            'SELECT record_count, last_timestamp, synced_at FROM sync_state WHERE device = ?',
+            (device,)).fetchone()
+        return dict(row) if row else None
+
+    def add_punches(self, device: str, attendances, record_count: int,
+                    durable: bool = False) -> int:
+        """Store downloaded punches and move the high-water mark.
+
+        Punches already in the store are ignored, so a full log can be passed
+        in safely. With ``durable`` the commit is synced to disk before
+        returning, as required before the device log is cleared. Returns the
+        number of new punches.
+        """
+        rows = [(device, str(a.user_id), a.timestamp.strftime(TIMESTAMP_FORMAT),
+                 a.uid, a.status, a.punch) for a in attendances]
+        conn = self._connect()
+        if durable:
+            conn.execute('PRAGMA synchronous=FULL')
+        try:
+            return self._insert(conn, device, rows, record_count)
+        finally:
+            if durable:
+                conn.execute('PRAGMA synchronous=NORMAL')
+
+    def _store_rows(self, conn: sqlite3.Connection, device: str, rows: list) -> int:
+        """Insert punch rows and refresh the rollups of the person-days they add to.
+
+        Must run inside a transaction; returns the number of new punches.
+        """
+        # rowcount leaves out the rows the rollup trigger writes, unlike total_changes
+        inserted = conn.executemany(
+            'INSERT OR IGNORE INTO punches (device, user_id, timestamp, uid, status, punch) '
+            'VALUES (?, ?, ?, ?, ?, ?)', rows).rowcount
+        if inserted:
+            rollups.refresh(conn, device, self.rules)
+        return inserted
+
+    def _insert(self, conn: sqlite3.Connection, device: str, rows: list, record_count: int) -> int:
+        """Insert punch rows and upsert the high-water mark in one transaction."""
+        with conn:
+            inserted = self._store_rows(conn, device, rows)
+            conn.execute(
+                'INSERT INTO sync_state (device, record_count, last_timestamp, synced_at) '
+                'VALUES (?, ?, (SELECT MAX(timestamp) FROM punches WHERE device = ?), ?) '
+                'ON CONFLICT(device) DO UPDATE SET record_count = excluded.record_count, '
+                'last_timestamp = excluded.last_timestamp, synced_at = excluded.synced_at',
+                (device, record_count, device, datetime.now().isoformat()))
+        return inserted
+
+    def count_missing(self, device: str, attendances) -> int:
+        """Return how many of ``attendances`` are not in the store."""
+        keys = {(a.timestamp.strftime(TIMESTAMP_FORMAT), str(a.user_id)) for a in attendances}
+        if not keys:
+            return 0
+        timestamps = [key[0] for key in keys]
+        rows = self._connect().execute(
+            'SELECT timestamp, user_id FROM punches '
+            'WHERE device = ? AND timestamp >= ? AND timestamp <= ?',
+            (device, min(timestamps), max(timestamps)))
+        return len(keys - {(row['timestamp'], row['user_id']) for row in rows})
+
+    def set_record_count(self, device: str, record_count: int) -> None:
+        """Record the device's log size after it was cleared."""
+        conn = self._connect()
+        with conn:
+            conn.execute('UPDATE sync_state SET record_count = ?, synced_at = ? WHERE device = ?',
+                         (record_count, datetime.now().isoformat(), device))
+
+    def append_punches(self, device: str, attendances) -> int:
+        """Store punches received outside a full download, such as live events.
+
+        The record count of the high-water mark is left alone, so the next
+        sync still compares against the device; only the last timestamp
+        moves. Returns the number of new punches.
+        """
+        rows = [(device, str(a.user_id), a.timestamp.strftime(TIMESTAMP_FORMAT),
+                 a.uid, a.status, a.punch) for a in attendances]
+        conn = self._connect()
+        with conn:
+            inserted = self._store_rows(conn, device, rows)
+            if inserted:
+                conn.execute(
+                    'UPDATE sync_state SET last_timestamp = '
+                    '(SELECT MAX(timestamp) FROM punches WHERE device = ?) WHERE device = ?',
+                    (device, device))
+        return inserted
+
+    def get_punches(self, device: str, start_date: date = None, end_date: date = None,
+                    user_ids: list = None, limit: int = None):
+        """Return stored punches for ``device`` in timestamp order.
+
+        Filters are applied in SQL. With ``limit``, the page is extended to the
+        end of the last day it touches so no person-day is split across pages.
+        Returns the punches and the first day of the next page, or None.
+        """
+        where, params = self._filters(device, start_date, end_date, user_ids)
+        conn = self._connect()
+        query = f'SELECT user_id, timestamp, uid, status, punch FROM punches WHERE {where} '
+        order = 'ORDER BY timestamp, user_id'
+        next_day = None
+
+        if limit is None:
+            rows = conn.execute(query + order, params).fetchall()
+        else:
+            rows = conn.execute(query + order + ' LIMIT ?', params + [limit]).fetchall()
+            if len(rows) == limit:
+                # Finish the last day, then check whether anything follows it
+                last = rows[-1]
+                next_day = date.fromisoformat(last['timestamp'][:10]) + timedelta(days=1)
+                rows += conn.execute(
+                    query + 'AND (timestamp, user_id) > (?, ?) AND timestamp < ? ' + order,
+                    params + [last['timestamp'], last['user_id'], next_day.isoformat()]).fetchall()
+                more = conn.execute(
+                    query + 'AND timestamp >= ? LIMIT 1',
+                    params + [next_day.isoformat()]).fetchone()
+                if more is None:
+                    next_day = None
+
+        return [self._to_attendance(row) for row in rows], next_day
+
+    def get_punch_columns(self, device: str, start_date: date = None, end_date: date = None,
+                          user_ids: list = None):
+        """Return the user IDs and timestamps of matching punches as numpy arrays.
+
+        Skips building Attendance objects, for column-wise evaluation of
+        large ranges.
+        """
+        where, params = self._filters(device, start_date, end_date, user_ids)
+        rows = self._connect().execute(
+            f'SELECT user_id, timestamp FROM punches WHERE {where}', params).fetchall()
+        return (np.array([row[0] for row in rows], dtype=object),
+                np.array([row[1] for row in rows], dtype='datetime64[s]'))
+
+    def iter_punches(self, device: str, start_date: date = None, end_date: date = None,
+                     user_ids: list = None, batch_size: int = 1000):
+        """Yield stored punches in timestamp order without loading them all.
+
+        Uses a dedicated connection, so the generator may be resumed from
+        different threads (as streaming responses do).
+        """
+        where, params = self._filters(device, start_date, end_date, user_ids)
+        conn = self._open(check_same_thread=False)
+        try:
+            rows = conn.execute(
+                'SELECT user_id, timestamp, uid, status, punch FROM punches '
+                f'WHERE {where} ORDER BY timestamp, user_id', params)
+            while True:
+                batch = rows.fetchmany(batch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    yield self._to_attendance(row)
+        finally:
+            conn.close()
+
+    def get_unarchived(self, device: str) -> list:
+        """Return the punches of ``device`` not yet marked archived, in timestamp order."""
+        rows = self._connect().execute(
+            'SELECT user_id, timestamp, uid, status, punch FROM punches '
+            'WHERE device = ? AND archived = 0 ORDER BY timestamp, user_id', (device,))
+        return [self._to_attendance(row) for row in rows]
+
+    def mark_archived(self, device: str, attendances) -> None:
+        """Mark punches as written to the Parquet archive."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'UPDATE punches SET archived = 1 '
+                'WHERE device = ? AND timestamp = ? AND user_id = ?',
+                [(device, a.timestamp.strftime(TIMESTAMP_FORMAT), str(a.user_id))
+                 for a in attendances])
+
+    def get_person_days(self, device: str, rules: dict, start_date: date = None,
+                        end_date: date = None, user_ids: list = None):
+        """Return the day rollups of ``device``, flagged late/early with ``rules``."""
+        return rollups.query_days(self._connect(), device, rules,
+                                  start_date, end_date, user_ids)
+
+    def get_person_months(self, device: str, rules: dict, start_date: date = None,
+                          end_date: date = None, user_ids: list = None):
+        """Return the month rollups of ``device`` for the months overlapping the range."""
+        return rollups.query_months(self._connect(), device, rules,
+                                    start_date, end_date, user_ids)
+
+
+punch_store = PunchStore(
+    str(Path(settings.data_dir) / 'punches.sqlite3'),
+    rules=rollups.rollup_rules(settings.rollup_office_start, settings.rollup_office_end,
+                               settings.rollup_grace_period))
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+
+
+class ResultCache:
+    """LRU cache of computed attendance results with single-flight computation.
+
+    Keys must include everything the result depends on (device, settings,
+    filters and log version), so entries never need explicit invalidation;
+    stale versions simply age out.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        """Initialize the cache; ``max_entries <= 0`` only coalesces in-flight calls."""
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached result for ``key``, computing it at most once.
+
+        Concurrent callers with the same key wait for the first caller's
+        computation instead of starting their own. Results are shared, so
+        callers must not mutate them.
+        """
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                CACHE_REQUESTS.labels('results', 'hit').inc()
+                return self._results[key]
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._in_flight[key] = Future()
+
+        if not is_owner:
+            CACHE_REQUESTS.labels('results', 'coalesced').inc()
+            return future.result()
+        CACHE_REQUESTS.labels('results', 'miss').inc()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if self.max_entries > 0:
+                self._results[key] = result
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def clear(self) -> None:
+        """Drop every cached result."""
+        with self._lock:
+            self._results.clear()
+
+
+result_cache = ResultCache(max_entries=settings.result_cache_size)
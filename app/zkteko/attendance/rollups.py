@@ -0,0 +1,182 @@
+import sqlite3
+from datetime import date, time
+
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS person_days (
+    device TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    first_second INTEGER NOT NULL,
+    last_second INTEGER NOT NULL,
+    punch_count INTEGER NOT NULL,
+    PRIMARY KEY (device, user_id, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS person_months (
+    device TEXT NOT NULL,
+    month TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    days_present INTEGER NOT NULL,
+    late_arrivals INTEGER NOT NULL,
+    early_departures INTEGER NOT NULL,
+    seconds_worked INTEGER NOT NULL,
+    PRIMARY KEY (device, month, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TEMP TABLE IF NOT EXISTS touched (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+
+-- Records the person-days that stored punches add to; ignored duplicates do not fire
+CREATE TEMP TRIGGER IF NOT EXISTS touch_person_day AFTER INSERT ON main.punches
+BEGIN
+    INSERT OR IGNORE INTO touched (user_id, day)
+    VALUES (NEW.user_id, substr(NEW.timestamp, 1, 10));
+END;
+"""
+
+# Seconds since midnight of a stored 'YYYY-MM-DD HH:MM:SS' timestamp
+SECONDS = "(strftime('%s', {0}) - strftime('%s', substr({0}, 1, 10)))"
+
+DAYS_SELECT = f"""
+SELECT device, user_id, day, {SECONDS.format('first')}, {SECONDS.format('last')}, punch_count
+FROM (
+    SELECT p.device, p.user_id, substr(p.timestamp, 1, 10) AS day,
+           MIN(p.timestamp) AS first, MAX(p.timestamp) AS last, COUNT(*) AS punch_count
+    FROM {{source}}
+    GROUP BY p.device, p.user_id, day
+)
+"""
+
+MONTHS_SELECT = """
+SELECT d.device, substr(d.day, 1, 7) AS month, d.user_id, COUNT(*),
+       SUM(d.first_second > :late_after), SUM(d.last_second < :early_before),
+       SUM(d.last_second - d.first_second)
+FROM {source}
+GROUP BY d.device, month, d.user_id
+"""
+
+INSERT_DAYS = ('INSERT OR REPLACE INTO person_days (device, user_id, day, first_second, '
+               'last_second, punch_count) ')
+INSERT_MONTHS = ('INSERT OR REPLACE INTO person_months (device, month, user_id, days_present, '
+                 'late_arrivals, early_departures, seconds_worked) ')
+
+
+def rollup_rules(office_start: time, office_end: time, grace_period: int) -> dict:
+    """Late/early thresholds in seconds of the day, as the attendance processor applies them.
+
+    A first punch after ``late_after`` is a late arrival and a last punch
+    before ``early_before`` an early departure.
+    """
+    grace = grace_period * 60
+    return {
+        'late_after': (office_start.hour * 3600 + office_start.minute * 60 + grace) % 86400,
+        'early_before': (office_end.hour * 3600 + office_end.minute * 60 + grace) % 86400,
+    }
+
+
+def encode_rules(rules: dict) -> str:
+    """Serialize thresholds for comparison with the ones the month rollups were built with."""
+    return f"{rules['late_after']}:{rules['early_before']}"
+
+
+def rebuild(conn: sqlite3.Connection, rules: dict, days: bool = True) -> None:
+    """Recompute the rollups of every device from scratch.
+
+    Used once for punches stored before the rollups existed, and for the
+    month rollups when the configured office rules change.
+    """
+    if days:
+        conn.execute('DELETE FROM person_days')
+        conn.execute(INSERT_DAYS + DAYS_SELECT.format(source='punches p'))
+    conn.execute('DELETE FROM person_months')
+    conn.execute(INSERT_MONTHS + MONTHS_SELECT.format(source='person_days d'), rules)
+    conn.executemany('INSERT OR REPLACE INTO rollup_state (key, value) VALUES (?, ?)',
+                     [('days', 'built'), ('month_rules', encode_rules(rules))])
+
+
+def ensure_built(conn: sqlite3.Connection, rules: dict) -> None:
+    """Build missing rollups, or rebuild the month rollups for changed rules."""
+    state = dict(conn.execute('SELECT key, value FROM rollup_state').fetchall())
+    if state.get('days') == 'built' and state.get('month_rules') == encode_rules(rules):
+        return
+    with conn:
+        rebuild(conn, rules, days=state.get('days') != 'built')
+
+
+def refresh(conn: sqlite3.Connection, device: str, rules: dict) -> None:
+    """Recompute the rollups of the person-days listed in the ``touched`` temp table.
+
+    Each touched day is re-aggregated from its punches, then each touched
+    person-month from its days, so the cost follows the new punches rather
+    than the size of the log. Must run inside the inserting transaction.
+    """
+    conn.execute(INSERT_DAYS + DAYS_SELECT.format(
+        source='(SELECT DISTINCT day FROM temp.touched) t CROSS JOIN punches p '
+               'ON p.device = :device AND p.timestamp >= t.day '
+               "AND p.timestamp < date(t.day, '+1 day')"),
+        {'device': device})
+    conn.execute(INSERT_MONTHS + MONTHS_SELECT.format(
+        source='(SELECT DISTINCT user_id, substr(day, 1, 7) AS month FROM temp.touched) t '
+               'CROSS JOIN person_days d ON d.device = :device AND d.user_id = t.user_id '
+               "AND d.day >= t.month || '-01' AND d.day <= t.month || '-31'"),
+        {'device': device, **rules})
+    conn.execute('DELETE FROM temp.touched')
+
+
+def _user_filter(column: str, user_ids: list, params: list) -> str:
+    if not user_ids:
+        return ''
+    params.extend(str(user_id) for user_id in user_ids)
+    return f" AND {column} IN ({', '.join('?' * len(user_ids))})"
+
+
+def query_days(conn: sqlite3.Connection, device: str, rules: dict,
+               start_date: date = None, end_date: date = None, user_ids: list = None):
+    """Return person-day rows ordered by day and user, flagged with ``rules``."""
+    params = [rules['late_after'], rules['early_before'], device,
+              (start_date or date.min).isoformat(), (end_date or date.max).isoformat()]
+    return conn.execute(
+        'SELECT user_id, day, first_second, last_second, punch_count, '
+        'first_second > ? AS is_late_arrival, last_second < ? AS is_early_departure '
+        'FROM person_days WHERE device = ? AND day >= ? AND day <= ?'
+        + _user_filter('user_id', user_ids, params) + ' ORDER BY day, user_id',
+        params).fetchall()
+
+
+def query_months(conn: sqlite3.Connection, device: str, rules: dict,
+                 start_date: date = None, end_date: date = None, user_ids: list = None):
+    """Return person-month rows ordered by month and user.
+
+    Whole months overlapping the date range are returned. The materialized
+    month rollups are read when ``rules`` match the ones they were built
+    with; otherwise the months are aggregated from the day rollups.
+    """
+    start_month = (start_date or date.min).isoformat()[:7]
+    end_month = (end_date or date.max).isoformat()[:7]
+    built = conn.execute("SELECT value FROM rollup_state WHERE key = 'month_rules'").fetchone()
+    if built is not None and built[0] == encode_rules(rules):
+        params = [device, start_month, end_month]
+        return conn.execute(
+            'SELECT user_id, month, days_present, late_arrivals, early_departures, '
+            'seconds_worked FROM person_months WHERE device = ? AND month >= ? AND month <= ?'
+            + _user_filter('user_id', user_ids, params) + ' ORDER BY month, user_id',
+            params).fetchall()
+
+    params = [rules['late_after'], rules['early_before'], device,
+              f'{start_month}-01', f'{end_month}-31']
+    return conn.execute(
+        'SELECT user_id, substr(day, 1, 7) AS month, COUNT(*) AS days_present, '
+        'SUM(first_second > ?) AS late_arrivals, SUM(last_second < ?) AS early_departures, '
+        'SUM(last_second - first_second) AS seconds_worked '
+        'FROM person_days WHERE device = ? AND day >= ? AND day <= ?'
+        + _user_filter('user_id', user_ids, params) +
+        ' GROUP BY month, user_id ORDER BY month, user_id', params).fetchall()
@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.models.roster import Roster
+
+DAY = 86400
+EPOCH = date(1970, 1, 1).toordinal()
+# Assignment bounds standing in for open-ended ranges, in days since the epoch
+OPEN_START = -(1 << 40)
+OPEN_END = 1 << 40
+
+SHIFT_COLUMNS = ['user_id', 'day', 'shift', 'status', 'is_holiday', 'first_second',
+                 'last_second', 'punch_count', 'is_late_arrival', 'is_early_departure']
+
+
+def day_number(day: date) -> int:
+    """Days since 1970-01-01, the unit of ``datetime64[D]``."""
+    return day.toordinal() - EPOCH
+
+
+class CompiledRoster:
+    """A roster compiled into numpy lookup tables.
+
+    Shifts become start/end/grace arrays indexed by shift code, schedules
+    one flat array of shift codes with per-schedule offsets, lengths and
+    anchors, and assignments parallel arrays of user, range and schedule.
+    Code -1 everywhere means "nothing": it indexes an appended sentinel
+    entry, so lookups need no branching.
+
+    Raises ValueError if the roster refers to an unknown shift, schedule
+    or group.
+    """
+
+    def __init__(self, roster: Roster):
+        shift_names = list(roster.shifts)
+        shift_codes = {name: code for code, name in enumerate(shift_names)}
+        shifts = list(roster.shifts.values())
+        starts = [s.start.hour * 3600 + s.start.minute * 60 + s.start.second for s in shifts]
+        ends = [s.end.hour * 3600 + s.end.minute * 60 + s.end.second for s in shifts]
+        # Ends at or before the start are on the next day
+        ends = [end + DAY if end <= start else end for start, end in zip(starts, ends)]
+        self.shift_names = np.array(shift_names + [None], dtype=object)
+        self.shift_start = np.array(starts + [0], dtype=np.int64)
+        self.shift_end = np.array(ends + [0], dtype=np.int64)
+        self.shift_grace = np.array([s.grace_period * 60 for s in shifts] + [0], dtype=np.int64)
+        self.shift_window = np.array([s.checkout_window * 60 for s in shifts] + [0], dtype=np.int64)
+
+        schedule_codes = {name: code for code, name in enumerate(roster.schedules)}
+        patterns, offsets, lengths, anchors = [], [], [], []
+        for name, schedule in roster.schedules.items():
+            offsets.append(len(patterns))
+            lengths.append(len(schedule.pattern))
+            anchors.append(day_number(schedule.anchor))
+            for shift in schedule.pattern:
+                if shift is not None and shift not in shift_codes:
+                    raise ValueError(f"Schedule {name} uses unknown shift: {shift}")
+                patterns.append(-1 if shift is None else shift_codes[shift])
+        # Sentinel schedule -1: always off
+        self.pattern = np.array(patterns + [-1], dtype=np.int64)
+        self.schedule_offset = np.array(offsets + [len(patterns)], dtype=np.int64)
+        self.schedule_length = np.array(lengths + [1], dtype=np.int64)
+        self.schedule_anchor = np.array(anchors + [0], dtype=np.int64)
+
+        def schedule_code(name: str) -> int:
+            if name not in schedule_codes:
+                raise ValueError(f"Unknown schedule: {name}")
+            return schedule_codes[name]
+
+        self.default_schedule = -1 if roster.default_schedule is None \
+            else schedule_code(roster.default_schedule)
+
+        users, starts, ends, codes = [], [], [], []
+        for assignment in roster.assignments:
+            code = schedule_code(assignment.schedule)
+            members = list(assignment.user_ids)
+            for group in assignment.groups:
+                if group not in roster.groups:
+                    raise ValueError(f"Unknown group: {group}")
+                members.extend(roster.groups[group])
+            start = OPEN_START if assignment.start_date is None else day_number(assignment.start_date)
+            end = OPEN_END if assignment.end_date is None else day_number(assignment.end_date) + 1
+            for user_id in members:
+                users.append(str(user_id))
+                starts.append(start)
+                ends.append(end)
+                codes.append(code)
+        self.assignment_user = np.array(users, dtype=object)
+        self.assignment_start = np.array(starts, dtype=np.int64)
+        self.assignment_end = np.array(ends, dtype=np.int64)
+        self.assignment_schedule = np.array(codes, dtype=np.int64)
+        self.users = pd.unique(self.assignment_user)
+
+        self.holidays = np.array(sorted({day_number(day) for day in roster.holidays}),
+                                 dtype=np.int64)
+
+    def shift_table(self, users: pd.Index, first_day: int, days: int):
+        """Return the shift code of every user on every day, and a holiday mask of the days.
+
+        Rows follow ``users``, columns the ``days`` days from ``first_day``.
+        Assignments are painted over the default schedule in roster order,
+        then every cell is resolved through its schedule's pattern at once.
+        """
+        schedules = np.full((len(users), days), self.default_schedule, dtype=np.int64)
+        rows = users.get_indexer(self.assignment_user)
+        lows = np.clip(self.assignment_start - first_day, 0, days)
+        highs = np.clip(self.assignment_end - first_day, 0, days)
+        for row, low, high, code in zip(rows, lows, highs, self.assignment_schedule):
+            if row >= 0 and low < high:
+                schedules[row, low:high] = code
+
+        day_numbers = first_day + np.arange(days, dtype=np.int64)
+        position = (day_numbers - self.schedule_anchor[schedules]) % self.schedule_length[schedules]
+        codes = self.pattern[self.schedule_offset[schedules] + position]
+        return codes, np.isin(day_numbers, self.holidays)
+
+    def evaluate(self, user_ids: np.ndarray, timestamps: np.ndarray,
+                 start: date, end: date, users: list = ()) -> pd.DataFrame:
+        """Evaluate punches against the roster for the days ``start`` to ``end``.
+
+        ``user_ids`` and ``timestamps`` are parallel arrays; punches may extend
+        one day past ``end`` so overnight shifts can be closed. Punches are
+        attributed to a shift day, the previous day when they fall within the
+        checkout window of its overnight shift, and grouped per user and day.
+        ``users`` lists extra users who are expected to work under the default
+        schedule even without punches. Returns one row per user and shift day
+        with punches or a scheduled, non-holiday shift (``SHIFT_COLUMNS``);
+        first/last seconds count from midnight of the shift day.
+        """
+        punch_users, distinct = pd.factorize(np.asarray(user_ids, dtype=object))
+        everyone = pd.Index(pd.unique(np.concatenate([
+            self.users, np.asarray(users, dtype=object), distinct.astype(object)])))
+        # One day before the range for overnight carry-over, one after for checkouts
+        first_day = day_number(start) - 1
+        days = day_number(end) - first_day + 2
+        codes, holidays = self.shift_table(everyone, first_day, days)
+
+        seconds = np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+        rows = everyone.get_indexer(distinct)[punch_users]
+        columns = seconds // DAY - first_day
+        in_table = (columns >= 1) & (columns < days)
+        rows, columns, seconds = rows[in_table], columns[in_table], seconds[in_table]
+
+        previous = codes[rows, columns - 1]
+        time_of_day = seconds % DAY
+        carried = (self.shift_end[previous] > DAY) & \
+            (time_of_day <= self.shift_end[previous] - DAY + self.shift_window[previous])
+        columns = columns - carried
+        in_range = (columns >= 1) & (columns < days - 1)
+        keys = rows[in_range] * days + columns[in_range]
+        relative = seconds[in_range] - (first_day + columns[in_range]) * DAY
+
+        grouped = pd.Series(relative).groupby(keys).agg(['min', 'max', 'size'])
+        punched = grouped.index.to_numpy(dtype=np.int64)
+        # Scheduled, non-holiday cells without punches are absences
+        scheduled = np.flatnonzero((codes >= 0) & ~holidays)
+        scheduled = scheduled[(scheduled % days >= 1) & (scheduled % days < days - 1)]
+        absent = np.setdiff1d(scheduled, punched, assume_unique=True)
+
+        keys = np.concatenate([punched, absent])
+        first = np.concatenate([grouped['min'].to_numpy(), np.full(len(absent), -1)])
+        last = np.concatenate([grouped['max'].to_numpy(), np.full(len(absent), -1)])
+        count = np.concatenate([grouped['size'].to_numpy(), np.zeros(len(absent), dtype=np.int64)])
+        rows, columns = keys // days, keys % days
+        shift = codes[rows, columns]
+        holiday = holidays[columns]
+        on_shift = (shift >= 0) & ~holiday & (count > 0)
+
+        frame = pd.DataFrame({
+            'user_id': everyone.to_numpy()[rows],
+            'day': (first_day + columns).astype('datetime64[D]'),
+            'shift': self.shift_names[shift],
+            'status': np.where(count > 0, np.where(shift >= 0, 'present', 'unscheduled'), 'absent'),
+            'is_holiday': holiday,
+            'first_second': first,
+            'last_second': last,
+            'punch_count': count,
+            'is_late_arrival': on_shift & (first > self.shift_start[shift] + self.shift_grace[shift]),
+            'is_early_departure': on_shift & (last < self.shift_end[shift])
+        }, columns=SHIFT_COLUMNS)
+        return frame.sort_values(['day', 'user_id'], kind='stable').reset_index(drop=True)
+
+
+class RosterFile:
+    """The roster file, compiled once and recompiled when it changes on disk."""
+
+    def __init__(self):
+        self._compiled = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def get(self) -> CompiledRoster:
+        """Return the compiled roster of ``settings.roster_file``.
+
+        Raises LookupError if no roster file is configured, ValueError if it
+        is invalid.
+        """
+        if not settings.roster_file:
+            raise LookupError("No roster given and no roster file configured (ZKTECO_ROSTER_FILE)")
+        stat = os.stat(settings.roster_file)
+        key = (settings.roster_file, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key != self._key:
+                with open(settings.roster_file) as f:
+                    self._compiled = CompiledRoster(Roster(**json.load(f)))
+                self._key = key
+            return self._compiled
+
+
+roster_file = RosterFile()
@@ -1,9 +1,20 @@
+import math
+import time
+from contextlib import contextmanager
 from zk import ZK
 from zk.exception import ZKNetworkError
+from app.zkteko.connection_pool import connection_pool
+from app.zkteko.executor import remaining_time
+from app.core.metrics import (DEVICE_CONNECT_SECONDS, DEVICE_CONNECT_FAILURES,
+                              instrument_connection)
 
 
 class ZktekoBase:
     def __init__(self, ip: str, port: int = 4370, password: int = 0, force_udp: bool = False, ommit_ping: bool = False, timeout: int = 5):
+        remaining = remaining_time()
+        if remaining is not None:
+            # Sockets opened under a deadline time out by then
+            timeout = max(1, min(timeout, math.ceil(remaining)))
         self.ip = ip
         self.port = port
         self.password = password
@@ -14,32 +25,92 @@ class ZktekoBase:
                      ommit_ping=self.ommit_ping, timeout=self.timeout)
         self.conn = None
 
-    def connect(self) -> None:
-        """Connect to the device and disable it for operations."""
-        if self.conn is not None:
-            return  # Already connected
+    @property
+    def device_key(self) -> str:
+        """Identifier used to group work per physical device."""
+        return f"{self.ip}:{self.port}"
 
+    @property
+    def pool_key(self) -> tuple:
+        """Key of the pooled session; sessions are only shared with identical credentials."""
+        return (self.ip, self.port, self.password, 'udp' if self.force_udp else 'tcp')
+
+    def _open_connection(self):
+        """Open and authenticate a new session with the device."""
+        start = time.perf_counter()
         try:
-            self.conn = self.zk.connect()
-            if self.conn:
-                self.conn.disable_device()
+            conn = self.zk.connect()
         except ZKNetworkError as e:
-            self.conn = None
+            DEVICE_CONNECT_FAILURES.labels(self.device_key).inc()
             raise ConnectionError(
                 f"Failed to connect to device at {self.ip}:{self.port} - {str(e)}")
         except Exception as e:
-            self.conn = None
+            DEVICE_CONNECT_FAILURES.labels(self.device_key).inc()
             raise ConnectionError(
                 f"Unexpected error while connecting: {str(e)}")
+        DEVICE_CONNECT_SECONDS.labels(self.device_key).observe(time.perf_counter() - start)
+        return instrument_connection(conn, self.device_key)
+
+    def connect(self) -> None:
+        """Lease a pooled session to the device."""
+        if self.conn is not None:
+            return  # Already connected
+
+        self.conn = connection_pool.acquire(self.pool_key, self._open_connection)
 
-    def disconnect(self) -> None:
-        """Safely disconnect from the device."""
+    def disconnect(self, discard: bool = False) -> None:
+        """Return the session to the pool, closing it if ``discard`` is set."""
         if self.conn:
             try:
-                self.conn.enable_device()
-                self.conn.disconnect()
-            except Exception as e:
-                raise ConnectionError(
-                    f"Failed to disconnect from device: {str(e)}")
+                connection_pool.release(self.pool_key, discard=discard)
             finally:
                 self.conn = None
+
+    @contextmanager
+    def device_disabled(self):
+        """Disable the device for the duration of a write or bulk read."""
+        conn = self.conn
+        if not conn.is_enabled:
+            yield conn  # An outer critical section already disabled it
+            return
+
+        conn.disable_device()
+        try:
+            yield conn
+        finally:
+            conn.enable_device()
+
+    @contextmanager
+    def session(self, disable: bool = False):
+        """Lease a session for one operation, optionally disabling the device.
+
+        The session is discarded instead of pooled if the operation fails, so
+        a broken socket is never handed to the next caller.
+        """
+        if self.conn is not None:
+            # Nested in an outer session of this instance, which owns the lease
+            if disable:
+                with self.device_disabled() as conn:
+                    yield conn
+            else:
+                yield self.conn
+            return
+
+        self.connect()
+        failed = False
+        try:
+            if disable:
+                with self.device_disabled() as conn:
+                    yield conn
+            else:
+                yield self.conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.disconnect(discard=failed)
+
+    def test_connection(self) -> None:
+        """Open and close a session to check the device is reachable."""
+        with self.session():
+            pass
@@ -0,0 +1,207 @@
+import threading
+import time
+
+from app.core.config import settings
+from app.core.metrics import register_pool
+from app.zkteko.device_lock import device_locks
+
+
+class PooledConnection:
+    """An authenticated device session kept open between operations."""
+
+    def __init__(self, conn, ticket=None):
+        self.conn = conn
+        self.ticket = ticket
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+
+
+class ConnectionPool:
+    """Keep one authenticated session per device alive across requests.
+
+    A session is leased exclusively: the per-key lock is held from
+    ``acquire`` to ``release``. The lock is re-entrant so nested managers
+    working on the same device in one thread share the lease.
+
+    With worker coordination enabled, a session also holds the device's
+    cross-process lock from open to close, since terminals accept a single
+    connection. Idle sessions are closed as soon as another worker queues
+    for the device.
+    """
+
+    def __init__(self, idle_timeout: float = 300, health_check_interval: float = 30,
+                 keepalive_interval: float = 60):
+        """Initialize the pool; ``idle_timeout <= 0`` closes sessions on release."""
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.keepalive_interval = keepalive_interval
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keepalive_thread = None
+
+    def _get_key_lock(self, key) -> threading.RLock:
+        """Return the lock guarding the session for ``key``."""
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.RLock()
+            return self._key_locks[key]
+
+    @staticmethod
+    def _close_connection(conn) -> None:
+        """Re-enable and close a session, ignoring errors from a dead socket."""
+        try:
+            if not conn.is_enabled:
+                conn.enable_device()
+            conn.disconnect()
+        except Exception as e:
+            print(f"Error closing pooled connection: {e}")
+
+    def _is_healthy(self, entry: PooledConnection) -> bool:
+        """Check a session with a cheap command if it has not been used recently."""
+        if not entry.conn.is_connect:
+            return False
+        now = time.monotonic()
+        if now - max(entry.last_used, entry.last_checked) < self.health_check_interval:
+            return True
+        try:
+            entry.conn.get_time()
+            entry.last_checked = now
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _device(key) -> str:
+        return f"{key[0]}:{key[1]}"
+
+    def _evict(self, key) -> None:
+        """Close and forget the session for ``key``; caller holds the key lock."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            try:
+                self._close_connection(entry.conn)
+            finally:
+                device_locks.release(entry.ticket)
+
+    def _open(self, key, factory) -> PooledConnection:
+        """Wait for the device's cross-process lock, then open a session."""
+        ticket = device_locks.acquire(self._device(key))
+        try:
+            return PooledConnection(factory(), ticket)
+        except BaseException:
+            device_locks.release(ticket)
+            raise
+
+    def acquire(self, key, factory):
+        """Lease the session for ``key``, opening one with ``factory`` if needed."""
+        key_lock = self._get_key_lock(key)
+        key_lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is not None and entry.leases == 0 and not self._is_healthy(entry):
+                self._evict(key)
+                entry = None
+            if entry is None:
+                entry = self._open(key, factory)
+                self._entries[key] = entry
+            entry.leases += 1
+            return entry.conn
+        except BaseException:
+            key_lock.release()
+            raise
+
+    def release(self, key, discard: bool = False) -> None:
+        """Return a leased session, closing it if it failed or pooling is off."""
+        key_lock = self._get_key_lock(key)
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if discard or (entry.leases == 0 and (
+                    self.idle_timeout <= 0 or device_locks.is_contended(self._device(key)))):
+                self._evict(key)
+        finally:
+            key_lock.release()
+
+    def stats(self) -> list:
+        """Return ``(device, leases)`` for every open session."""
+        with self._lock:
+            entries = list(self._entries.items())
+        return [(self._device(key), entry.leases) for key, entry in entries]
+
+    def release_idle(self, device: str) -> None:
+        """Close idle sessions to ``device`` so another worker can connect."""
+        with self._lock:
+            keys = [key for key in self._entries if self._device(key) == device]
+        for key in keys:
+            key_lock = self._get_key_lock(key)
+            if not key_lock.acquire(blocking=False):
+                continue  # In use; released to the next worker when done
+            try:
+                entry = self._entries.get(key)
+                if entry is not None and entry.leases == 0:
+                    self._evict(key)
+            finally:
+                key_lock.release()
+
+    def _keepalive_pass(self) -> None:
+        """Evict idle sessions and ping the rest so the device keeps them open."""
+        with self._lock:
+            keys = list(self._entries)
+        now = time.monotonic()
+        for key in keys:
+            key_lock = self._get_key_lock(key)
+            if not key_lock.acquire(blocking=False):
+                continue  # In use, so it is alive
+            try:
+                entry = self._entries.get(key)
+                if entry is None or entry.leases:
+                    continue
+                if now - entry.last_used > self.idle_timeout:
+                    self._evict(key)
+                elif not self._is_healthy(entry):
+                    self._evict(key)
+            finally:
+                key_lock.release()
+
+    def _keepalive_loop(self) -> None:
+        while not self._stop.wait(self.keepalive_interval):
+            try:
+                self._keepalive_pass()
+            except Exception as e:
+                print(f"Error in connection pool keepalive: {e}")
+
+    def start(self) -> None:
+        """Start the background keepalive and idle eviction thread."""
+        if self._keepalive_thread is not None:
+            return
+        self._stop.clear()
+        self._keepalive_thread = threading.Thread(
+            target=self._keepalive_loop, name="zk-pool-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+    def close_all(self) -> None:
+        """Stop the keepalive thread and close every pooled session."""
+        self._stop.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join()
+            self._keepalive_thread = None
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            key_lock = self._get_key_lock(key)
+            with key_lock:
+                self._evict(key)
+
+
+connection_pool = ConnectionPool(
+    idle_timeout=settings.pool_idle_timeout,
+    health_check_interval=settings.pool_health_check_interval,
+    keepalive_interval=settings.pool_keepalive_interval)
+register_pool(connection_pool)
+device_locks.on_contended(connection_pool.release_idle)
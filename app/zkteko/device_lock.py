@@ -0,0 +1,228 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from app.core.config import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_queue (
+    ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+    device TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    held INTEGER NOT NULL DEFAULT 0,
+    heartbeat REAL NOT NULL,
+    capture INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS device_queue_device ON device_queue (device, ticket);
+"""
+
+
+class DeviceLockManager:
+    """Cross-process, first-come first-served locks on devices, kept in SQLite.
+
+    Every worker sharing the database queues a ticket per device; the
+    oldest ticket holds the lock. Holders and waiters refresh a heartbeat,
+    and tickets of dead processes are dropped, so a crashed worker cannot
+    block a device for longer than ``lease`` seconds. Live captures mark
+    their tickets, so other workers can tell a device is being captured.
+    When disabled, every call is a no-op.
+    """
+
+    def __init__(self, path: str, enabled: bool = False, timeout: float = 60,
+                 lease: float = 60, check_interval: float = 0.2):
+        self.path = path
+        self.enabled = enabled
+        self.timeout = timeout
+        self.lease = lease
+        self.check_interval = check_interval
+        self._held = {}
+        self._callbacks = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def owner(self) -> str:
+        """This process, as recorded on its tickets."""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection; transactions are managed explicitly."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """Add the capture marker to lock databases created before it existed."""
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(device_queue)')}
+        if 'capture' not in columns:
+            try:
+                conn.execute('ALTER TABLE device_queue ADD COLUMN capture INTEGER NOT NULL DEFAULT 0')
+            except sqlite3.OperationalError as e:
+                if 'duplicate column' not in str(e):
+                    raise  # Otherwise another worker added it first
+
+    def _purge(self, conn: sqlite3.Connection, device: str, now: float) -> None:
+        """Drop tickets of ``device`` whose process stopped heartbeating or exited."""
+        conn.execute('DELETE FROM device_queue WHERE device = ? AND heartbeat < ?',
+                     (device, now - self.lease))
+        host = socket.gethostname()
+        for (owner,) in conn.execute(
+                'SELECT DISTINCT owner FROM device_queue WHERE device = ?', (device,)).fetchall():
+            owner_host, _, pid = owner.rpartition(':')
+            if owner_host != host:
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                conn.execute('DELETE FROM device_queue WHERE owner = ?', (owner,))
+            except PermissionError:
+                pass  # Alive, but owned by another user
+
+    def _try_take(self, conn: sqlite3.Connection, device: str, ticket: int) -> bool:
+        """Heartbeat ``ticket`` and take the lock if it is first in line."""
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('UPDATE device_queue SET heartbeat = ? WHERE ticket = ?', (now, ticket))
+            self._purge(conn, device, now)
+            head = conn.execute(
+                'SELECT ticket FROM device_queue WHERE device = ? ORDER BY ticket LIMIT 1',
+                (device,)).fetchone()
+            taken = head is not None and head[0] == ticket
+            if taken:
+                conn.execute('UPDATE device_queue SET held = 1 WHERE ticket = ?', (ticket,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return taken
+
+    def acquire(self, device: str, timeout: float = None, capture: bool = False):
+        """Wait in line for ``device`` and return the ticket that holds it.
+
+        Raises ConnectionError if the lock is not granted within ``timeout``
+        seconds (default: the manager's). ``capture`` marks the ticket of a
+        live capture session. Returns None when disabled.
+        """
+        if not self.enabled:
+            return None
+        timeout = self.timeout if timeout is None else timeout
+        conn = self._connect()
+        ticket = conn.execute(
+            'INSERT INTO device_queue (device, owner, heartbeat, capture) VALUES (?, ?, ?, ?)',
+            (device, self.owner, time.time(), int(capture))).lastrowid
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        try:
+            while not self._try_take(conn, device, ticket):
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(
+                        f"Timed out after {timeout}s waiting for device {device} "
+                        f"held by another worker")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+        except BaseException:
+            conn.execute('DELETE FROM device_queue WHERE ticket = ?', (ticket,))
+            raise
+
+        with self._lock:
+            self._held[ticket] = device
+        self._start()
+        return ticket
+
+    def release(self, ticket) -> None:
+        """Give up a lock returned by ``acquire``; None is ignored."""
+        if ticket is None:
+            return
+        with self._lock:
+            self._held.pop(ticket, None)
+        self._connect().execute('DELETE FROM device_queue WHERE ticket = ?', (ticket,))
+
+    def is_contended(self, device: str) -> bool:
+        """Whether another ticket is waiting for ``device``."""
+        if not self.enabled:
+            return False
+        row = self._connect().execute(
+            'SELECT COUNT(*) FROM device_queue WHERE device = ? AND heartbeat >= ?',
+            (device, time.time() - self.lease)).fetchone()
+        return row[0] > 1
+
+    def is_captured(self, device: str) -> bool:
+        """Whether a live capture session, of any worker, holds ``device``."""
+        if not self.enabled:
+            return False
+        row = self._connect().execute(
+            'SELECT 1 FROM device_queue WHERE device = ? AND capture = 1 AND held = 1 '
+            'AND heartbeat >= ?', (device, time.time() - self.lease)).fetchone()
+        return row is not None
+
+    def on_contended(self, callback) -> None:
+        """Call ``callback(device)`` when a device this process holds is waited for."""
+        self._callbacks.append(callback)
+
+    def _check(self) -> None:
+        """Heartbeat held tickets and notify callbacks of contended devices."""
+        with self._lock:
+            held = dict(self._held)
+        if not held:
+            return
+        conn = self._connect()
+        tickets = ', '.join('?' * len(held))
+        conn.execute(f'UPDATE device_queue SET heartbeat = ? WHERE ticket IN ({tickets})',
+                     [time.time(), *held])
+        contended = conn.execute(
+            'SELECT DISTINCT h.device FROM device_queue h JOIN device_queue w '
+            f'ON w.device = h.device AND w.ticket > h.ticket WHERE h.ticket IN ({tickets})',
+            list(held)).fetchall()
+        for (device,) in contended:
+            for callback in self._callbacks:
+                callback(device)
+
+    def _check_loop(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            try:
+                self._check()
+            except Exception as e:
+                print(f"Error in device lock heartbeat: {e}")
+
+    def _start(self) -> None:
+        """Start the heartbeat thread on first use."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._check_loop, name="zk-device-locks", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """Stop the heartbeat thread and give up every lock still held."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            tickets = list(self._held)
+        for ticket in tickets:
+            self.release(ticket)
+
+
+device_locks = DeviceLockManager(
+    str(Path(settings.data_dir) / 'locks.sqlite3'),
+    enabled=settings.coordinate_workers,
+    timeout=settings.device_lock_timeout,
+    lease=settings.device_lock_lease)
@@ -0,0 +1,101 @@
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings
+
+# time.monotonic() by which the current device call must finish, if any
+device_deadline = contextvars.ContextVar('device_deadline', default=None)
+
+
+def remaining_time():
+    """Seconds left before ``device_deadline``, or None without one."""
+    deadline = device_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class DeviceExecutor:
+    """Run blocking pyzk calls off the event loop with per-device limits."""
+
+    def __init__(self, max_workers: int = 8, per_device_limit: int = 1):
+        """Initialize the executor; the thread pool is created on first use."""
+        self.max_workers = max_workers
+        self.per_device_limit = per_device_limit
+        self._executor = None
+        self._lock = threading.Lock()
+        # Semaphores are bound to the loop that uses them, so keep one set per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return the shared thread pool, creating it if needed."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="zk-device-io")
+            return self._executor
+
+    def _get_semaphore(self, loop, device_key: str) -> asyncio.Semaphore:
+        """Return the semaphore limiting concurrent calls to one device."""
+        semaphores = self._semaphores.setdefault(loop, {})
+        if device_key not in semaphores:
+            semaphores[device_key] = asyncio.Semaphore(self.per_device_limit)
+        return semaphores[device_key]
+
+    async def run(self, device_key: str, func, *args, **kwargs):
+        """Run ``func`` in the device I/O pool once the device has a free slot.
+
+        Callers waiting on a slow device only hold a semaphore slot, not a
+        worker thread, so other devices and routes keep being served. The
+        caller's context (e.g. the route used to label metrics) is carried over.
+        The slot is released when the worker returns, not when the caller
+        stops waiting, so a call abandoned on timeout still counts against
+        the device. Under a ``device_deadline``, raises TimeoutError instead
+        of waiting for a slot or starting ``func`` past the deadline.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        semaphore = self._get_semaphore(loop, device_key)
+        remaining = remaining_time()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), remaining)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Device {device_key} stayed busy past the deadline")
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                pass  # Loop already closed
+
+        try:
+            future = self._get_executor().submit(
+                context.run, self._call, device_key, func, *args, **kwargs)
+        except BaseException:
+            semaphore.release()
+            raise
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    @staticmethod
+    def _call(device_key: str, func, *args, **kwargs):
+        """Run ``func`` in a worker unless its deadline passed while it was queued."""
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError(f"Deadline passed before a worker was free for {device_key}")
+        return func(*args, **kwargs)
+
+    def shutdown(self) -> None:
+        """Stop the worker threads, waiting for running calls to finish."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+device_executor = DeviceExecutor(
+    max_workers=settings.device_io_workers,
+    per_device_limit=settings.device_concurrency)
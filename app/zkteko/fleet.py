@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from app.core.config import settings
+from app.models.device import DeviceSettings
+from app.zkteko.executor import device_deadline
+
+
+def load_device_group(name: str) -> list:
+    """Return the devices of a named group from the device groups file.
+
+    Raises LookupError if no groups file is configured or the group is unknown.
+    """
+    if not settings.device_groups_file:
+        raise LookupError("No device groups file configured (ZKTECO_DEVICE_GROUPS_FILE)")
+    with open(settings.device_groups_file) as f:
+        groups = json.load(f)
+    if name not in groups:
+        raise LookupError(f"Unknown device group: {name}")
+    return [DeviceSettings(**device) for device in groups[name]]
+
+
+def resolve_devices(batch_settings) -> list:
+    """Return the devices listed in a batch request, expanding its group."""
+    devices = list(batch_settings.devices or [])
+    if batch_settings.group:
+        devices.extend(load_device_group(batch_settings.group))
+    return devices
+
+
+async def run_on_devices(devices: list, func, max_parallel: int, timeout: float,
+                         on_result=None) -> list:
+    """Await ``func(device)`` for every device concurrently.
+
+    At most ``max_parallel`` devices run at once and each gets ``timeout``
+    seconds, enforced as the ``device_deadline`` of its device calls so
+    connects and queued work give up too. A device whose call is still
+    running at the deadline is reported as busy. Failures are captured per device, so one dead terminal does not
+    fail the batch. ``on_result`` is called with each device's result as
+    soon as it finishes. Returns one result dict per device, in input order.
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def run_one(device):
+        async with semaphore:
+            start = time.perf_counter()
+            result, error = None, None
+            device_deadline.set(time.monotonic() + timeout)
+            try:
+                result = await asyncio.wait_for(func(device), timeout)
+            except asyncio.TimeoutError as e:
+                error = str(e) or f"Timed out after {timeout}s; device still busy with the request"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            outcome = {
+                'device': device.label,
+                'ok': error is None,
+                'result': result,
+                'error': error,
+                'elapsed': time.perf_counter() - start
+            }
+            if on_result is not None:
+                on_result(outcome)
+            return outcome
+
+    return await asyncio.gather(*(run_one(device) for device in devices))
+
+
+def merge_attendance(results: list) -> dict:
+    """Merge per-device attendance data into one response tagged by device."""
+    summary, detailed, devices = [], [], []
+    employees = set()
+    start = end = None
+
+    for result in results:
+        data = result['result']
+        records = 0
+        if data is not None:
+            for row in data['summary']:
+                summary.append({**row, 'device': result['device']})
+            for row in data['detailed']:
+                detailed.append({**row, 'device': result['device']})
+                employees.add(row['name'])
+            records = len(data['detailed'])
+            date_range = data['metadata']['date_range']
+            if date_range['start'] is not None:
+                start = date_range['start'] if start is None else min(start, date_range['start'])
+                end = date_range['end'] if end is None else max(end, date_range['end'])
+        devices.append({
+            'device': result['device'],
+            'ok': result['ok'],
+            'records': records,
+            'error': result['error'],
+            'elapsed': result['elapsed']
+        })
+
+    return {
+        'summary': summary,
+        'detailed': detailed,
+        'metadata': {
+            'total_records': len(detailed),
+            'total_employees': len(employees),
+            'date_range': {'start': start, 'end': end},
+            'generated_at': datetime.now().isoformat(),
+            'next_cursor': None
+        },
+        'devices': devices
+    }
@@ -0,0 +1,231 @@
+import asyncio
+import fcntl
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app.core.config import settings
+from app.models.poll import PolledDevice
+from app.zkteko.device_lock import device_locks
+from app.zkteko.executor import device_executor
+from app.zkteko.user.user_cache import user_cache
+
+
+def load_polled_devices() -> list:
+    """Return the devices listed in the poll devices file, or none if unset."""
+    if not settings.poll_devices_file:
+        return []
+    with open(settings.poll_devices_file) as f:
+        return [PolledDevice(**device) for device in json.load(f)]
+
+
+class PollState:
+    """Schedule and health of the background poll of one device."""
+
+    def __init__(self, device: PolledDevice, interval: float):
+        self.device = device
+        self.interval = interval
+        self.last_attempt = None
+        self.last_success = None
+        self.error_count = 0
+        self.total_errors = 0
+        self.last_error = None
+        self.last_new_punches = 0
+        self.next_poll = None
+
+    @property
+    def device_key(self) -> str:
+        return f"{self.device.ip}:{self.device.port}"
+
+    def next_delay(self, jitter: float, max_backoff: float) -> float:
+        """Seconds until the next poll: the interval with jitter, backed off after failures."""
+        delay = self.interval
+        if self.error_count:
+            delay = min(self.interval * 2 ** self.error_count, max(max_backoff, self.interval))
+        return max(0.0, delay * (1 + random.uniform(-jitter, jitter)))
+
+    def to_dict(self) -> dict:
+        return with_lag({
+            'device': self.device.label,
+            'device_key': self.device_key,
+            'interval': self.interval,
+            'last_attempt': self.last_attempt,
+            'last_success': self.last_success,
+            'error_count': self.error_count,
+            'total_errors': self.total_errors,
+            'last_error': self.last_error,
+            'last_new_punches': self.last_new_punches,
+            'next_poll': self.next_poll
+        })
+
+
+def with_lag(status: dict) -> dict:
+    """Add the current lag and staleness to a poll status."""
+    last_success = status['last_success']
+    lag = (datetime.now() - last_success).total_seconds() if last_success else None
+    return {**status, 'lag': lag, 'stale': lag is None or lag > 2 * status['interval']}
+
+
+class DevicePoller:
+    """Background scheduler that keeps local state of configured devices current.
+
+    Each device is polled on its own interval with random jitter, and backs
+    off exponentially while it fails. Once a device has been polled, reads
+    of it are answered from the punch store and user cache alone.
+
+    With worker coordination, only the worker holding the poller file lock
+    polls; it publishes its status to a file that the other workers read.
+    A standby worker takes over if the polling worker exits.
+    """
+
+    def __init__(self, jitter: float = 0.1, max_backoff: float = 900):
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._states = {}
+        self._tasks = []
+        self._polling = False
+        self._lock_file = None
+        self.status_path = Path(settings.data_dir) / 'poll_status.json'
+
+    def _read_status(self) -> dict:
+        """Return the status published by the polling worker, by device key."""
+        try:
+            with open(self.status_path) as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        for status in published:
+            for field in ('last_attempt', 'last_success', 'next_poll'):
+                if status[field] is not None:
+                    status[field] = datetime.fromisoformat(status[field])
+        return {status['device_key']: with_lag(status) for status in published}
+
+    def _publish_status(self) -> None:
+        """Write the status for workers that do not poll; replaced atomically."""
+        if not settings.coordinate_workers:
+            return
+        self.status_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.status_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(temporary, 'w') as f:
+            json.dump([state.to_dict() for state in self._states.values()], f, default=str)
+        os.replace(temporary, self.status_path)
+
+    def serves(self, device_key: str) -> bool:
+        """Whether local state of ``device_key`` is kept current by the poller."""
+        if device_key not in self._states:
+            return False
+        if not self._polling:
+            status = self._read_status().get(device_key)
+            return status is not None and not status['stale']
+        return self._states[device_key].last_success is not None
+
+    def get_status(self) -> list:
+        """Return the poll status of every configured device."""
+        if not self._polling and self._states:
+            published = self._read_status()
+            return [published.get(key, state.to_dict()) for key, state in self._states.items()]
+        return [state.to_dict() for state in self._states.values()]
+
+    def _claim(self) -> bool:
+        """Take the poller file lock; always succeeds without worker coordination."""
+        if not settings.coordinate_workers:
+            return True
+        path = Path(settings.data_dir) / 'poller.lock'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(path, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    @staticmethod
+    def poll_device(device: PolledDevice) -> int:
+        """Pull the user table and new punches of one device; returns new punches."""
+        # Imported here because the processor consults the poller
+        from app.zkteko.attendance.attendance_processor import AttendanceProcessor
+
+        processor = AttendanceProcessor(
+            ip=device.ip,
+            port=device.port,
+            password=device.password,
+            force_udp=device.force_udp,
+            ommit_ping=device.ommit_ping,
+            timeout=device.timeout)
+        return processor.poll()
+
+    async def _run(self, state: PollState) -> None:
+        # Spread the first polls so devices are not all hit at startup
+        await asyncio.sleep(random.uniform(0, state.interval * self.jitter))
+        while True:
+            if device_locks.is_captured(state.device_key):
+                # A live capture is storing the punches as they happen
+                await asyncio.sleep(state.next_delay(self.jitter, self.max_backoff))
+                continue
+            state.last_attempt = datetime.now()
+            try:
+                state.last_new_punches = await device_executor.run(
+                    state.device_key, self.poll_device, state.device)
+                state.last_success = datetime.now()
+                state.error_count = 0
+                state.last_error = None
+            except Exception as e:
+                state.error_count += 1
+                state.total_errors += 1
+                state.last_error = str(e) or type(e).__name__
+                print(f"Error polling device {state.device.label}: {state.last_error}")
+
+            delay = state.next_delay(self.jitter, self.max_backoff)
+            state.next_poll = datetime.now() + timedelta(seconds=delay)
+            try:
+                self._publish_status()
+            except OSError as e:
+                print(f"Error publishing poll status: {e}")
+            await asyncio.sleep(delay)
+
+    def _start_polling(self) -> None:
+        self._polling = True
+        for state in list(self._states.values()):
+            self._tasks.append(asyncio.create_task(self._run(state)))
+
+    async def _standby(self) -> None:
+        """Retry the poller lock until the polling worker goes away."""
+        while not self._claim():
+            await asyncio.sleep(settings.poll_interval)
+        self._start_polling()
+
+    def start(self, devices: list) -> None:
+        """Start polling ``devices`` on the running event loop."""
+        for device in devices:
+            state = PollState(device, device.poll_interval or settings.poll_interval)
+            self._states[state.device_key] = state
+            # Pinned before the first poll, so its user table is kept even with ttl <= 0
+            user_cache.pin(state.device_key)
+        if not self._states:
+            return
+        if self._claim():
+            self._start_polling()
+        else:
+            self._tasks.append(asyncio.create_task(self._standby()))
+
+    async def stop(self) -> None:
+        """Cancel all polls and forget their state."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for device_key in self._states:
+            user_cache.unpin(device_key)
+        self._tasks = []
+        self._states = {}
+        self._polling = False
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+device_poller = DevicePoller(jitter=settings.poll_jitter,
+                             max_backoff=settings.poll_max_backoff)
@@ -0,0 +1,454 @@
+"""In-process stand-in for a ZKTeco terminal, speaking the pyzk TCP/UDP protocol.
+
+Serves synthetic users, templates and punch logs on localhost so the API and
+the attendance pipeline can be exercised and benchmarked without hardware::
+
+    python -m app.zkteko.simulator --port 4370 --users 300 --punches 100000
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+from struct import pack, unpack
+
+from zk import const
+from zk.attendance import Attendance
+from zk.base import make_commkey
+from zk.finger import Finger
+from zk.user import User
+
+TCP_MAGIC = (const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2)
+UDP_CHUNK = 1024
+CMD_SAVE_USERTEMPS = 110
+CMD_READ_BUFFER_PREPARE = 1503
+CMD_READ_BUFFER_CHUNK = 1504
+
+
+def generate_users(count: int) -> list:
+    """Return ``count`` synthetic users with uids and user_ids 1..count."""
+    return [User(uid, f"Employee {uid}", const.USER_DEFAULT, '', '', str(uid), 0)
+            for uid in range(1, count + 1)]
+
+
+def generate_punches(count: int, users: list, start: datetime = datetime(2024, 1, 1),
+                     per_day: int = 2, seed: int = 0) -> list:
+    """Return ``count`` punches spread over working days, oldest first.
+
+    Each user punches ``per_day`` times a day around office hours, so the
+    log covers ``count / (len(users) * per_day)`` days.
+    """
+    rng = random.Random(seed)
+    punches = []
+    day = 0
+    while len(punches) < count:
+        base = start + timedelta(days=day)
+        for user in users:
+            for i in range(per_day):
+                hour = 8 if i == 0 else 17
+                timestamp = base + timedelta(hours=hour, minutes=rng.randint(0, 59),
+                                             seconds=rng.randint(0, 59))
+                punches.append(Attendance(user.user_id, timestamp, 1, 0, user.uid))
+                if len(punches) == count:
+                    break
+            if len(punches) == count:
+                break
+        day += 1
+    punches.sort(key=lambda punch: punch.timestamp)
+    return punches
+
+
+def generate_templates(users: list, fingers: int = 1, size: int = 512, seed: int = 0) -> list:
+    """Return ``fingers`` random fingerprint templates per user."""
+    rng = random.Random(seed)
+    return [Finger(user.uid, fid, 1, bytes(rng.getrandbits(8) for _ in range(size)))
+            for user in users for fid in range(fingers)]
+
+
+def checksum(packet: bytes) -> int:
+    """ZKTeco packet checksum, as computed by pyzk."""
+    total = 0
+    if len(packet) % 2:
+        packet += b'\x00'
+    for (word,) in (unpack('<H', packet[i:i + 2]) for i in range(0, len(packet), 2)):
+        total += word
+        if total > const.USHRT_MAX:
+            total -= const.USHRT_MAX
+    total = ~total
+    while total < 0:
+        total += const.USHRT_MAX
+    return total
+
+
+def make_packet(command: int, session_id: int, reply_id: int, data: bytes = b'') -> bytes:
+    """Build a response packet (without the TCP top header)."""
+    header = pack('<4H', command, 0, session_id, reply_id)
+    return pack('<4H', command, checksum(header + data), session_id, reply_id) + data
+
+
+def encode_time(t: datetime) -> int:
+    """Encode a timestamp the way the terminal stores it."""
+    return (((t.year % 100) * 12 * 31 + ((t.month - 1) * 31) + t.day - 1) *
+            (24 * 60 * 60) + (t.hour * 60 + t.minute) * 60 + t.second)
+
+
+class SimulatedDevice:
+    """State and command handling of one simulated terminal.
+
+    ``latency`` is added before every response, ``bandwidth`` (bytes per
+    second, 0 for unlimited) throttles data transfers and ``loss`` is the
+    probability of losing a response: UDP datagrams are dropped, TCP
+    responses are delayed by ``retransmit_delay`` as a retransmission would.
+    With ``max_sessions``, connects beyond that many open sessions are
+    refused, as on terminals that accept a single connection.
+    """
+
+    def __init__(self, users: list = None, punches: list = None, templates: list = None,
+                 password: int = 0, latency: float = 0.0, bandwidth: float = 0,
+                 loss: float = 0.0, retransmit_delay: float = 0.2, seed: int = 0,
+                 max_sessions: int = 0):
+        self.users = {user.uid: user for user in (users or [])}
+        self.punches = list(punches or [])
+        self.templates = {(t.uid, t.fid): t for t in (templates or [])}
+        self.password = password
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.loss = loss
+        self.retransmit_delay = retransmit_delay
+        self.max_sessions = max_sessions
+        self.enabled = True
+        self.commands = 0
+        self.bytes_sent = 0
+        self.rejected = 0
+        self.peak_sessions = 0
+        self._open_sessions = set()
+        self.lock = threading.RLock()
+        self._rng = random.Random(seed)
+        self._servers = []
+        self._next_session = 1
+        self._listeners = []
+
+    # -- Data encoding -----------------------------------------------------
+
+    def _encode_users(self, packet_size: int) -> bytes:
+        records = []
+        for user in self.users.values():
+            if packet_size == 28:
+                records.append(pack('<HB5s8sIxBhI', user.uid, user.privilege,
+                                    user.password.encode(), user.name.encode(), user.card,
+                                    int(user.group_id or 0), 0, int(user.user_id or 0)))
+            else:
+                records.append(pack('<HB8s24sIx7sx24s', user.uid, user.privilege,
+                                    user.password.encode(), user.name.encode(), user.card,
+                                    user.group_id.encode(), user.user_id.encode()))
+        body = b''.join(records)
+        return pack('<I', len(body)) + body
+
+    def _encode_punches(self) -> bytes:
+        body = b''.join(
+            pack('<H24sB4sB8s', int(punch.uid or 0), str(punch.user_id).encode(), punch.status,
+                 pack('<I', encode_time(punch.timestamp)), punch.punch, b'')
+            for punch in self.punches)
+        return pack('<I', len(body)) + body
+
+    def _encode_templates(self) -> bytes:
+        body = b''.join(pack('<HHbb', len(t.template) + 6, t.uid, t.fid, t.valid) + t.template
+                        for t in self.templates.values())
+        return pack('<i', len(body)) + body
+
+    def _encode_sizes(self) -> bytes:
+        fields = [0] * 20
+        fields[4] = len(self.users)
+        fields[6] = len(self.templates)
+        fields[8] = len(self.punches)
+        fields[14] = 3000
+        fields[15] = 10000
+        fields[16] = 1000000
+        fields[17] = fields[14] - fields[6]
+        fields[18] = fields[15] - fields[4]
+        fields[19] = fields[16] - fields[8]
+        return pack('<20i', *fields) + pack('<3i', 0, 0, 0)
+
+    def _save_user_templates(self, buffer: bytes) -> None:
+        """Apply a save_user_template upload (user record, table, templates)."""
+        user_size, table_size, _ = unpack('<III', buffer[:12])
+        user_data = buffer[12:12 + user_size]
+        table = buffer[12 + user_size:12 + user_size + table_size]
+        fingers = buffer[12 + user_size + table_size:]
+        if user_size == 29:
+            uid, privilege, password, name, card, group_id, _, user_id = unpack(
+                '<xHB5s8sIxBhI', user_data)
+            group_id, user_id = str(group_id), str(user_id)
+        else:
+            uid, privilege, password, name, card, _, group_id, user_id = unpack(
+                '<xHB8s24sIB7sx24s', user_data)
+            group_id = group_id.split(b'\x00')[0].decode()
+            user_id = user_id.split(b'\x00')[0].decode()
+        self.users[uid] = User(uid, name.split(b'\x00')[0].decode(), privilege,
+                               password.split(b'\x00')[0].decode(), group_id, user_id, card)
+        for offset in range(0, len(table), 8):
+            _, _, fid, start = unpack('<bHbI', table[offset:offset + 8])
+            size = unpack('<H', fingers[start:start + 2])[0]
+            template = fingers[start + 2:start + 2 + size]
+            self.templates[(uid, fid - 0x10)] = Finger(uid, fid - 0x10, 1, template)
+
+    # -- Command handling --------------------------------------------------
+
+    def handle(self, session: dict, command: int, data: bytes) -> list:
+        """Handle one command; returns ``(command, data)`` response packets."""
+        with self.lock:
+            self.commands += 1
+            if command == const.CMD_CONNECT:
+                if self.max_sessions and len(self._open_sessions) >= self.max_sessions:
+                    self.rejected += 1
+                    return [(const.CMD_ACK_ERROR, b'')]
+                session['id'] = self._next_session
+                self._next_session += 1
+                self._open_sessions.add(session['id'])
+                self.peak_sessions = max(self.peak_sessions, len(self._open_sessions))
+                session['authenticated'] = not self.password
+                return [(const.CMD_ACK_UNAUTH if self.password else const.CMD_ACK_OK, b'')]
+            if command == const.CMD_AUTH:
+                expected = make_commkey(self.password, session['id'])
+                session['authenticated'] = data == expected
+                return [(const.CMD_ACK_OK if session['authenticated'] else const.CMD_ACK_UNAUTH, b'')]
+            if not session.get('authenticated'):
+                return [(const.CMD_ACK_UNAUTH, b'')]
+
+            if command == const.CMD_EXIT:
+                self.close_session(session)
+                return [(const.CMD_ACK_OK, b'')]
+            if command == const.CMD_ENABLEDEVICE:
+                self.enabled = True
+            elif command == const.CMD_DISABLEDEVICE:
+                self.enabled = False
+            elif command == const.CMD_GET_FREE_SIZES:
+                return [(const.CMD_ACK_OK, self._encode_sizes())]
+            elif command == const.CMD_GET_TIME:
+                return [(const.CMD_ACK_OK, pack('<I', encode_time(datetime.now())))]
+            elif command == const.CMD_USER_WRQ:
+                if len(data) == 28:
+                    uid, privilege, password, name, card, group_id, _, user_id = unpack(
+                        '<HB5s8sIxBHI', data)
+                    group_id, user_id = str(group_id), str(user_id)
+                else:
+                    uid, privilege, password, name, card, group_id, user_id = unpack(
+                        '<HB8s24s4sx7sx24s', data)
+                    card = unpack('<I', card)[0]
+                    group_id = group_id.split(b'\x00')[0].decode()
+                    user_id = user_id.split(b'\x00')[0].decode()
+                self.users[uid] = User(uid, name.split(b'\x00')[0].decode(), privilege,
+                                       password.split(b'\x00')[0].decode(), group_id,
+                                       user_id, card)
+            elif command == const.CMD_DELETE_USER:
+                uid = unpack('<h', data[:2])[0]
+                self.users.pop(uid, None)
+                for key in [key for key in self.templates if key[0] == uid]:
+                    del self.templates[key]
+            elif command == const.CMD_DELETE_USERTEMP:
+                uid, fid = unpack('<hb', data[:3])
+                if self.templates.pop((uid, fid), None) is None:
+                    return [(const.CMD_ACK_ERROR, b'')]
+            elif command == const.CMD_CLEAR_ATTLOG:
+                self.punches = []
+            elif command == CMD_READ_BUFFER_PREPARE:
+                _, read_command, fct, _ = unpack('<bhii', data[:11])
+                if read_command == const.CMD_ATTLOG_RRQ:
+                    session['buffer'] = self._encode_punches()
+                elif read_command == const.CMD_DB_RRQ and fct == const.FCT_FINGERTMP:
+                    session['buffer'] = self._encode_templates()
+                elif read_command == const.CMD_USERTEMP_RRQ:
+                    session['buffer'] = self._encode_users(28 if session['udp'] else 72)
+                else:
+                    return [(const.CMD_ACK_ERROR, b'')]
+                return [(const.CMD_ACK_OK, b'\x00' + pack('<I', len(session['buffer'])) + b'\x00' * 4)]
+            elif command == CMD_READ_BUFFER_CHUNK:
+                start, size = unpack('<ii', data[:8])
+                chunk = session.get('buffer', b'')[start:start + size]
+                if not session['udp']:
+                    return [(const.CMD_DATA, chunk)]
+                packets = [(const.CMD_PREPARE_DATA, pack('<II', len(chunk), 0))]
+                packets += [(const.CMD_DATA, chunk[i:i + UDP_CHUNK])
+                            for i in range(0, len(chunk), UDP_CHUNK)]
+                return packets + [(const.CMD_ACK_OK, b'')]
+            elif command == const.CMD_FREE_DATA:
+                session.pop('buffer', None)
+                session.pop('upload', None)
+            elif command == const.CMD_PREPARE_DATA:
+                session['upload'] = bytearray()
+            elif command == const.CMD_DATA:
+                session.setdefault('upload', bytearray()).extend(data)
+            elif command == CMD_SAVE_USERTEMPS:
+                self._save_user_templates(bytes(session.pop('upload', b'')))
+            elif command == const.CMD_REG_EVENT:
+                if session in self._listeners:
+                    self._listeners.remove(session)
+                if unpack('<I', data[:4])[0]:
+                    self._listeners.append(session)
+            elif command == const.CMD_ACK_OK:
+                return []  # Client acknowledging a pushed event
+            elif command not in (const.CMD_REFRESHDATA, const.CMD_TESTVOICE,
+                                 const.CMD_CANCELCAPTURE, const.CMD_STARTVERIFY):
+                return [(const.CMD_ACK_ERROR, b'')]
+            return [(const.CMD_ACK_OK, b'')]
+
+    def close_session(self, session: dict) -> None:
+        """Forget a session ended by the client or by a dropped connection."""
+        with self.lock:
+            session['closed'] = True
+            self._open_sessions.discard(session.get('id'))
+            if session in self._listeners:
+                self._listeners.remove(session)
+
+    def punch(self, user_id: str, timestamp: datetime = None, status: int = 1,
+              punch: int = 0) -> Attendance:
+        """Record a punch and push it to sessions capturing live events."""
+        timestamp = (timestamp or datetime.now()).replace(microsecond=0)
+        user = next((u for u in self.users.values() if u.user_id == str(user_id)), None)
+        attendance = Attendance(str(user_id), timestamp, status, punch,
+                                user.uid if user else int(user_id))
+        event = pack('<24sBB6s', str(user_id).encode(), status, punch,
+                     bytes([timestamp.year - 2000, timestamp.month, timestamp.day,
+                            timestamp.hour, timestamp.minute, timestamp.second]))
+        with self.lock:
+            self.punches.append(attendance)
+            listeners = list(self._listeners)
+        for session in listeners:
+            try:
+                session['push'](make_packet(const.CMD_REG_EVENT, session['id'], 0, event))
+            except OSError:
+                with self.lock:
+                    if session in self._listeners:
+                        self._listeners.remove(session)
+        return attendance
+
+    def _delay(self, size: int) -> bool:
+        """Sleep for latency and bandwidth; returns False if the response is lost."""
+        delay = self.latency
+        if self.bandwidth:
+            delay += size / self.bandwidth
+        lost = self.loss and self._rng.random() < self.loss
+        if delay:
+            time.sleep(delay)
+        return not lost
+
+    # -- Servers -----------------------------------------------------------
+
+    def serve(self, host: str = '127.0.0.1', port: int = 0, udp: bool = True) -> int:
+        """Start TCP (and UDP) servers in background threads; returns the port."""
+        device = self
+
+        class TCPHandler(socketserver.BaseRequestHandler):
+            def _recv(self, size):
+                data = b''
+                while len(data) < size:
+                    chunk = self.request.recv(size - len(data))
+                    if not chunk:
+                        raise ConnectionError("client closed")
+                    data += chunk
+                return data
+
+            def handle(self):
+                send_lock = threading.Lock()
+
+                def push(packet):
+                    with send_lock:
+                        self.request.sendall(pack('<HHI', *TCP_MAGIC, len(packet)) + packet)
+
+                session = {'udp': False, 'push': push}
+                try:
+                    while not session.get('closed'):
+                        magic1, magic2, length = unpack('<HHI', self._recv(8))
+                        if (magic1, magic2) != TCP_MAGIC:
+                            return
+                        packet = self._recv(length)
+                        command, _, _, reply_id = unpack('<4H', packet[:8])
+                        responses = device.handle(session, command, packet[8:])
+                        out = b''.join(
+                            pack('<HHI', *TCP_MAGIC, len(p)) + p
+                            for p in (make_packet(code, session.get('id', 0), reply_id, data)
+                                      for code, data in responses))
+                        if not out:
+                            continue
+                        if not device._delay(len(out)):
+                            time.sleep(device.retransmit_delay)
+                        device.bytes_sent += len(out)
+                        with send_lock:
+                            self.request.sendall(out)
+                except (ConnectionError, OSError):
+                    return
+                finally:
+                    device.close_session(session)
+
+        class UDPHandler(socketserver.BaseRequestHandler):
+            sessions = {}
+
+            def handle(self):
+                packet, sock = self.request
+                address = self.client_address
+                session = self.sessions.setdefault(address, {
+                    'udp': True, 'push': lambda packet: sock.sendto(packet, address)})
+                command, _, _, reply_id = unpack('<4H', packet[:8])
+                for code, data in device.handle(session, command, packet[8:]):
+                    out = make_packet(code, session.get('id', 0), reply_id, data)
+                    if device._delay(len(out)):
+                        device.bytes_sent += len(out)
+                        sock.sendto(out, self.client_address)
+                if session.get('closed'):
+                    self.sessions.pop(self.client_address, None)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        tcp_server = socketserver.ThreadingTCPServer((host, port), TCPHandler)
+        tcp_server.daemon_threads = True
+        port = tcp_server.server_address[1]
+        self._servers.append(tcp_server)
+        if udp:
+            udp_server = socketserver.ThreadingUDPServer((host, port), UDPHandler)
+            udp_server.daemon_threads = True
+            self._servers.append(udp_server)
+        for server in self._servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return port
+
+    def stop(self) -> None:
+        """Stop the servers started by ``serve``."""
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated ZKTeco terminal")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4370)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--punches', type=int, default=10000)
+    parser.add_argument('--fingers', type=int, default=0, help="Templates per user")
+    parser.add_argument('--password', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds per response")
+    parser.add_argument('--bandwidth', type=float, default=0, help="Bytes per second")
+    parser.add_argument('--loss', type=float, default=0.0, help="Response loss probability")
+    parser.add_argument('--max-sessions', type=int, default=0,
+                        help="Refuse connects beyond this many open sessions (0: unlimited)")
+    args = parser.parse_args()
+
+    users = generate_users(args.users)
+    device = SimulatedDevice(
+        users=users, punches=generate_punches(args.punches, users),
+        templates=generate_templates(users, args.fingers) if args.fingers else None,
+        password=args.password, latency=args.latency, bandwidth=args.bandwidth,
+        loss=args.loss, max_sessions=args.max_sessions)
+    port = device.serve(args.host, args.port)
+    print(f"Simulated device on {args.host}:{port} "
+          f"({args.users} users, {args.punches} punches)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        device.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import asyncio
+
+from app.core.config import settings
+from app.zkteko.executor import device_executor
+
+
+class UserMutation:
+    """A pending create/update (``set``) or ``delete`` of one user."""
+
+    def __init__(self, kind: str, uid: int, fields: dict = None):
+        self.kind = kind
+        self.uid = uid
+        self.fields = fields or {}
+
+
+class DeviceMutationQueue:
+    """Collects user mutations for one device and applies them in batches.
+
+    The first mutation opens a batch window; everything submitted before it
+    closes (or until ``max_batch`` is reached) is applied in one session
+    and one disabled window on the device.
+    """
+
+    def __init__(self, user_manager, window: float, max_batch: int):
+        self.user_manager = user_manager
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._full = None
+        self._flush_task = None
+
+    @property
+    def idle(self) -> bool:
+        return not self._pending and self._flush_task is None
+
+    def submit(self, mutation: UserMutation) -> asyncio.Future:
+        """Queue ``mutation``; the returned future resolves to whether it was applied."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((mutation, future))
+        if self._flush_task is None:
+            self._full = asyncio.Event()
+            self._flush_task = loop.create_task(self._flush())
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return future
+
+    @staticmethod
+    def coalesce(batch: list) -> list:
+        """Drop mutations that a later one of the same uid makes redundant.
+
+        A later mutation replaces an earlier one, except that a ``set`` after
+        a ``delete`` is kept separately: the delete also wipes fingerprints.
+        Returns ``(mutation, future, superseded)`` triples, where
+        ``superseded`` holds the futures of the mutations it replaced.
+        """
+        coalesced, index = [], {}
+        for mutation, future in batch:
+            i = index.get(mutation.uid)
+            if i is None or (coalesced[i][0].kind == 'delete' and mutation.kind == 'set'):
+                index[mutation.uid] = len(coalesced)
+                coalesced.append((mutation, future, []))
+            else:
+                _, replaced, superseded = coalesced[i]
+                coalesced[i] = (mutation, future, superseded + [replaced])
+        return coalesced
+
+    async def _flush(self) -> None:
+        try:
+            await asyncio.wait_for(self._full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        batch, self._pending = self._pending, []
+        self._flush_task = None
+
+        coalesced = self.coalesce(batch)
+        try:
+            results = await device_executor.run(
+                self.user_manager.device_key, self.user_manager.apply_mutations,
+                [mutation for mutation, _, _ in coalesced])
+            applied = True
+        except Exception as e:
+            print(f"Error applying user changes: {e}")
+            results = [False] * len(coalesced)
+            applied = False
+        for (_, future, superseded), result in zip(coalesced, results):
+            if not future.done():
+                future.set_result(result)
+            # A superseded change counts as done once its batch reached the device
+            for replaced in superseded:
+                if not replaced.done():
+                    replaced.set_result(applied)
+
+
+class UserMutationQueues:
+    """Per-device mutation queues, so bursts of user edits share a session."""
+
+    def __init__(self, window: float = 0.05, max_batch: int = 500):
+        self.window = window
+        self.max_batch = max_batch
+        self._queues = {}
+
+    async def submit(self, user_manager, kind: str, uid: int, fields: dict = None) -> bool:
+        """Queue a user change on ``user_manager``'s device and wait for it to be applied.
+
+        Only changes made with the same connection settings share a batch, so
+        each runs with the settings it was submitted with.
+        """
+        key = (*user_manager.pool_key, user_manager.ommit_ping, user_manager.timeout)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = DeviceMutationQueue(
+                user_manager, self.window, self.max_batch)
+        try:
+            return await queue.submit(UserMutation(kind, uid, fields))
+        finally:
+            if queue.idle and self._queues.get(key) is queue:
+                del self._queues[key]
+
+
+user_mutations = UserMutationQueues(window=settings.user_mutation_window,
+                                    max_batch=settings.user_mutation_max_batch)
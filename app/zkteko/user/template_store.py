@@ -0,0 +1,155 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from zk.finger import Finger
+
+from app.core.config import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS template_blobs (
+    hash TEXT PRIMARY KEY,
+    template BLOB NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS device_templates (
+    device TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    fid INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (device, uid, fid)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS template_snapshots (
+    device TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def template_hash(template: bytes) -> str:
+    """Content hash identifying a fingerprint template across devices."""
+    return hashlib.sha256(template).hexdigest()
+
+
+class TemplateStore:
+    """Fingerprint templates last seen on each device, kept in SQLite.
+
+    Template bytes are stored once per content hash; each device only lists
+    the hash held in each (uid, finger) slot. A device's listing is replaced
+    by a full download and kept current by the pushes made through it, so
+    deltas can be computed without reading every template back.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _save_blobs(self, conn: sqlite3.Connection, fingers: list) -> list:
+        """Store the templates of ``fingers`` by hash; returns the hashes in order."""
+        hashes = [template_hash(finger.template) for finger in fingers]
+        conn.executemany('INSERT OR IGNORE INTO template_blobs (hash, template) VALUES (?, ?)',
+                         [(h, finger.template) for h, finger in zip(hashes, fingers)])
+        return hashes
+
+    def save_snapshot(self, device: str, fingers: list) -> None:
+        """Replace the listing of ``device`` with the templates just downloaded from it."""
+        conn = self._connect()
+        with conn:
+            hashes = self._save_blobs(conn, fingers)
+            conn.execute('DELETE FROM device_templates WHERE device = ?', (device,))
+            conn.executemany(
+                'INSERT OR REPLACE INTO device_templates (device, uid, fid, valid, hash) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(device, finger.uid, finger.fid, finger.valid, h)
+                 for finger, h in zip(fingers, hashes)])
+            conn.execute('INSERT OR REPLACE INTO template_snapshots (device, synced_at) '
+                         'VALUES (?, ?)', (device, time.time()))
+
+    def record(self, device: str, fingers: list) -> None:
+        """Note templates pushed to ``device``."""
+        conn = self._connect()
+        with conn:
+            hashes = self._save_blobs(conn, fingers)
+            conn.executemany(
+                'INSERT OR REPLACE INTO device_templates (device, uid, fid, valid, hash) '
+                'VALUES (?, ?, ?, 1, ?)',
+                [(device, finger.uid, finger.fid, h) for finger, h in zip(fingers, hashes)])
+
+    def forget(self, device: str, uid: int, fid: int = None) -> None:
+        """Note a template (or, without ``fid``, every template of a user) removed from ``device``."""
+        conn = self._connect()
+        with conn:
+            if fid is None:
+                conn.execute('DELETE FROM device_templates WHERE device = ? AND uid = ?',
+                             (device, uid))
+            else:
+                conn.execute('DELETE FROM device_templates WHERE device = ? AND uid = ? '
+                             'AND fid = ?', (device, uid, fid))
+
+    def listing(self, device: str):
+        """Return ``{(uid, fid): hash}`` of ``device``, or None if it was never downloaded."""
+        conn = self._connect()
+        if conn.execute('SELECT 1 FROM template_snapshots WHERE device = ?',
+                        (device,)).fetchone() is None:
+            return None
+        return {(uid, fid): h for uid, fid, h in conn.execute(
+            'SELECT uid, fid, hash FROM device_templates WHERE device = ?', (device,))}
+
+
+def diff_templates(image: dict, target_users: list, listing: dict, prune: bool = False):
+    """Plan the pushes that make a device hold the templates of ``image``.
+
+    ``image`` maps user IDs to ``(user, fingers)``; users are matched with
+    ``target_users`` by user ID and keep their uid on the target. Users
+    missing there are created under their source uid unless another user
+    holds it. ``listing`` is the target's ``{(uid, fid): hash}``. Returns
+    ``(pushes, prunes, unchanged, conflicts)``: ``(user, fingers)`` pairs to
+    save, ``(uid, fid)`` slots to delete (only with ``prune``), the number
+    of users already up to date and the user IDs that could not be placed.
+    """
+    by_user_id = {str(user.user_id): user for user in target_users}
+    taken = {int(user.uid) for user in target_users}
+    slots = {}
+    for (uid, fid), h in listing.items():
+        slots.setdefault(uid, {})[fid] = h
+    pushes, prunes, conflicts = [], [], []
+    unchanged = 0
+    for user_id, (user, fingers) in image.items():
+        target = by_user_id.get(user_id)
+        if target is None:
+            if int(user.uid) in taken:
+                conflicts.append(user_id)
+                continue
+            target = user
+        uid = int(target.uid)
+        held = slots.get(uid, {})
+        wanted = {finger.fid: finger for finger in fingers}
+        changed = [Finger(uid, fid, finger.valid, finger.template)
+                   for fid, finger in sorted(wanted.items())
+                   if held.get(fid) != template_hash(finger.template)]
+        stale = [(uid, fid) for fid in held if fid not in wanted] if prune else []
+        if changed:
+            pushes.append((target, changed))
+        prunes.extend(stale)
+        if not changed and not stale:
+            unchanged += 1
+    return pushes, prunes, unchanged, conflicts
+
+
+template_store = TemplateStore(str(Path(settings.data_dir) / 'templates.sqlite3'))
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from zk.finger import Finger
+from zk.user import User
+
+from app.models.device import DeviceSettings
+from app.models.template import DeviceTemplateResult
+from app.zkteko.executor import device_executor, device_deadline
+from app.zkteko.fleet import run_on_devices
+from app.zkteko.user.template_store import template_hash
+from app.zkteko.user.user_io import user_to_dict
+from app.zkteko.user.user_manager import UserManager
+
+# Least seconds between two ``progress`` events of one device
+PROGRESS_INTERVAL = 0.5
+# Device socket timeouts allowed after the deadline to finish the user in flight and re-enable
+STOP_GRACE_TIMEOUTS = 3
+
+
+def build_image(users: list, fingers: list, user_ids: list = None) -> dict:
+    """Group downloaded templates by user ID, keeping users that have any.
+
+    Returns ``{user_id: (user, fingers)}``, optionally limited to ``user_ids``.
+    """
+    wanted = set(map(str, user_ids)) if user_ids else None
+    by_uid = {int(user.uid): user for user in users}
+    image = {}
+    for finger in fingers:
+        user = by_uid.get(finger.uid)
+        if user is None or (wanted is not None and str(user.user_id) not in wanted):
+            continue
+        image.setdefault(str(user.user_id), (user, []))[1].append(finger)
+    return image
+
+
+def image_from_models(users: list) -> dict:
+    """Build an image from ``UserTemplates`` models; raises ValueError on bad hex."""
+    image = {}
+    for entry in users:
+        user = User(**entry.user.model_dump())
+        fingers = []
+        for finger in entry.fingers:
+            try:
+                template = bytes.fromhex(finger.template)
+            except ValueError:
+                raise ValueError(f"User {user.user_id}: finger {finger.fid} is not valid hex")
+            fingers.append(Finger(user.uid, finger.fid, finger.valid, template))
+        image[str(user.user_id)] = (user, fingers)
+    return image
+
+
+def image_to_dicts(image: dict) -> list:
+    """Serialize an image in the ``UserTemplates`` shape."""
+    return [{
+        'user': user_to_dict(user),
+        'fingers': [{'fid': finger.fid, 'valid': finger.valid,
+                     'template': finger.template.hex(),
+                     'hash': template_hash(finger.template)} for finger in fingers]
+    } for user, fingers in image.values()]
+
+
+def device_result(result: dict) -> dict:
+    """Flatten a ``run_on_devices`` result of ``import_templates`` into a ``DeviceTemplateResult``."""
+    counts = result['result'] or {}
+    return DeviceTemplateResult(**counts, device=result['device'], ok=result['ok'],
+                                error=result['error'], elapsed=result['elapsed']).model_dump()
+
+
+async def replicate_templates(image: dict, targets: list, max_parallel: int,
+                              device_timeout: float, prune: bool = False,
+                              refresh: bool = False, progress=None) -> list:
+    """Push ``image`` to every target device concurrently.
+
+    Each device only receives the templates it lacks (see
+    ``UserManager.import_templates``). A push stops between users at
+    ``device_timeout`` and reports what it applied; the device is given a
+    few socket timeouts more to finish the user in flight before it is
+    reported busy. ``progress(event)`` is called on the
+    event loop with the device's ``planned`` and throttled ``progress``
+    events, then a ``done`` event carrying its result. Returns one
+    ``DeviceTemplateResult`` dict per device, in input order.
+    """
+    if not targets:
+        return []
+    loop = asyncio.get_running_loop()
+    progress = progress or (lambda event: None)
+
+    grace = STOP_GRACE_TIMEOUTS * max(device.timeout for device in targets)
+
+    async def push(device_settings: DeviceSettings):
+        # run_on_devices allows the grace on top; the push itself stops at device_timeout
+        device_deadline.set(device_deadline.get() - grace)
+        user_manager = UserManager(
+            ip=device_settings.ip,
+            port=device_settings.port,
+            password=device_settings.password,
+            force_udp=device_settings.force_udp,
+            ommit_ping=device_settings.ommit_ping,
+            timeout=device_settings.timeout)
+        last = 0.0
+
+        def report(event):
+            nonlocal last
+            now = time.monotonic()
+            if event['event'] == 'progress' and event['done'] < event['total'] \
+                    and now - last < PROGRESS_INTERVAL:
+                return
+            last = now
+            loop.call_soon_threadsafe(progress, {'device': device_settings.label, **event})
+
+        return await device_executor.run(
+            user_manager.device_key, user_manager.import_templates,
+            image, prune=prune, refresh=refresh, progress=report)
+
+    def on_result(result: dict):
+        progress({'event': 'done', **device_result(result)})
+
+    results = await run_on_devices(targets, push, max_parallel, device_timeout + grace, on_result)
+    return [device_result(result) for result in results]
@@ -0,0 +1,259 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from zk.user import User
+
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+
+
+USER_FIELDS = ('uid', 'name', 'privilege', 'password', 'group_id', 'user_id', 'card')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_tables (
+    device TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    fetched_at REAL,
+    users TEXT
+);
+"""
+
+
+class CachedUsers:
+    """A device's user table and its uid to name lookup."""
+
+    def __init__(self, users: list, fetched_at: float = None, version: int = None):
+        self.users = {int(user.uid): user for user in users}
+        self.names = {uid: user.name for uid, user in self.users.items()}
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.version = version
+
+
+class SharedUserTables:
+    """User tables in SQLite, shared by the worker processes of one data directory.
+
+    Rows are never deleted: invalidating a table clears it and bumps its
+    version, so versions only grow and keys derived from them stay unique.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get_version(self, device: str):
+        """Return the version of the table of ``device`` and whether it holds users."""
+        row = self._connect().execute(
+            'SELECT version, users IS NOT NULL FROM user_tables WHERE device = ?',
+            (device,)).fetchone()
+        return (row[0], bool(row[1])) if row else (0, False)
+
+    def load(self, device: str):
+        """Return the cached users of ``device`` as ``CachedUsers``, or None."""
+        row = self._connect().execute(
+            'SELECT version, fetched_at, users FROM user_tables WHERE device = ?',
+            (device,)).fetchone()
+        if row is None or row[2] is None:
+            return None
+        users = [User(*fields) for fields in json.loads(row[2])]
+        return CachedUsers(users, fetched_at=row[1], version=row[0])
+
+    def _write(self, conn: sqlite3.Connection, device: str, users, fetched_at) -> int:
+        """Replace the table of ``device`` and bump its version; returns the version."""
+        encoded = None if users is None else json.dumps(
+            [[getattr(user, field) for field in USER_FIELDS] for user in users])
+        conn.execute(
+            'INSERT INTO user_tables (device, version, fetched_at, users) VALUES (?, 1, ?, ?) '
+            'ON CONFLICT(device) DO UPDATE SET version = version + 1, '
+            'fetched_at = excluded.fetched_at, users = excluded.users',
+            (device, fetched_at, encoded))
+        return conn.execute('SELECT version FROM user_tables WHERE device = ?',
+                            (device,)).fetchone()[0]
+
+    def store(self, device: str, users: list) -> int:
+        """Save a freshly downloaded table; returns its version."""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            return self._write(conn, device, users, time.time())
+
+    def update(self, device: str, user=None, remove_uid: int = None) -> int:
+        """Write one created, updated or deleted user through; returns the new version."""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            entry = self.load(device)
+            if entry is None:
+                return self._write(conn, device, None, None)
+            if user is not None:
+                entry.users[int(user.uid)] = user
+            if remove_uid is not None:
+                entry.users.pop(remove_uid, None)
+            return self._write(conn, device, list(entry.users.values()), entry.fetched_at)
+
+    def clear(self, device: str = None) -> None:
+        """Drop the table of ``device``, or of every device, bumping versions."""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if device is None:
+                conn.execute('UPDATE user_tables SET version = version + 1, users = NULL')
+            else:
+                self._write(conn, device, None, None)
+
+
+class UserCache:
+    """Shared per-device user table cache with TTL and LRU eviction.
+
+    With a ``shared`` store, tables and versions are written through to it
+    and re-read whenever another worker changed them, so every worker
+    serves the same table without downloading it again.
+    """
+
+    def __init__(self, ttl: float = 300, max_devices: int = 256,
+                 shared: SharedUserTables = None):
+        """Initialize the cache; ``ttl <= 0`` disables caching."""
+        self.ttl = ttl
+        self.max_devices = max_devices
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._pinned = set()
+        self._lock = threading.Lock()
+
+    def _bump(self, device: str) -> None:
+        """Record that the user table of ``device`` changed."""
+        self._versions[device] = self._versions.get(device, 0) + 1
+
+    def get_version(self, device: str) -> int:
+        """Return a counter that changes whenever the cached table of ``device`` does."""
+        with self._lock:
+            if self.shared is not None:
+                return self.shared.get_version(device)[0]
+            return self._versions.get(device, 0)
+
+    def _remember(self, device: str, entry: CachedUsers) -> None:
+        """Store ``entry`` as most recently used, evicting the least recent."""
+        self._entries[device] = entry
+        self._entries.move_to_end(device)
+        evictable = [key for key in self._entries if key not in self._pinned]
+        for key in evictable[:max(0, len(self._entries) - self.max_devices)]:
+            del self._entries[key]
+
+    def _get_entry(self, device: str):
+        """Return the live entry for ``device``, dropping it if expired."""
+        entry = self._entries.get(device)
+        if self.shared is not None:
+            version, has_users = self.shared.get_version(device)
+            if entry is not None and entry.version != version:
+                del self._entries[device]
+                entry = None
+            if entry is None and has_users and (self.ttl > 0 or device in self._pinned):
+                entry = self.shared.load(device)
+                if entry is not None:
+                    self._remember(device, entry)
+        if entry is not None and device not in self._pinned and \
+                time.time() - entry.fetched_at > self.ttl:
+            del self._entries[device]
+            entry = None
+        CACHE_REQUESTS.labels('users', 'miss' if entry is None else 'hit').inc()
+        if entry is not None:
+            self._entries.move_to_end(device)
+        return entry
+
+    def pin(self, device: str) -> None:
+        """Keep the table of ``device`` regardless of TTL and LRU; its owner refreshes it."""
+        with self._lock:
+            self._pinned.add(device)
+
+    def unpin(self, device: str) -> None:
+        """Let the table of ``device`` expire and be evicted again."""
+        with self._lock:
+            self._pinned.discard(device)
+
+    def get_users(self, device: str):
+        """Return the cached users of ``device``, or None on a miss."""
+        with self._lock:
+            entry = self._get_entry(device)
+            return list(entry.users.values()) if entry else None
+
+    def get_names(self, device: str):
+        """Return a uid to name dict for ``device``, or None on a miss."""
+        with self._lock:
+            entry = self._get_entry(device)
+            return dict(entry.names) if entry else None
+
+    def set_users(self, device: str, users: list) -> None:
+        """Cache a freshly downloaded user table."""
+        with self._lock:
+            self._bump(device)
+            if self.ttl <= 0 and device not in self._pinned:
+                if self.shared is not None:
+                    self.shared.clear(device)
+                return
+            version = self.shared.store(device, users) if self.shared is not None else None
+            self._remember(device, CachedUsers(users, version=version))
+
+    def _written_through(self, device: str, entry, version: int) -> None:
+        """Keep a locally updated entry only if no other worker changed the table meanwhile."""
+        if entry is None:
+            return
+        if entry.version == version - 1:
+            entry.version = version
+        else:
+            self._entries.pop(device, None)
+
+    def upsert_user(self, device: str, user) -> None:
+        """Write a created or updated user through to the cached table."""
+        with self._lock:
+            entry = self._entries.get(device)
+            if entry is not None:
+                entry.users[int(user.uid)] = user
+                entry.names[int(user.uid)] = user.name
+            self._bump(device)
+            if self.shared is not None:
+                self._written_through(device, entry, self.shared.update(device, user=user))
+
+    def remove_user(self, device: str, uid: int) -> None:
+        """Drop a deleted user from the cached table."""
+        with self._lock:
+            entry = self._entries.get(device)
+            if entry is not None:
+                entry.users.pop(uid, None)
+                entry.names.pop(uid, None)
+            self._bump(device)
+            if self.shared is not None:
+                self._written_through(device, entry, self.shared.update(device, remove_uid=uid))
+
+    def invalidate(self, device: str = None) -> None:
+        """Forget the cached table of ``device``, or of every device."""
+        with self._lock:
+            if device is None:
+                self._entries.clear()
+                for key in self._versions:
+                    self._bump(key)
+            else:
+                self._entries.pop(device, None)
+                self._bump(device)
+            if self.shared is not None:
+                self.shared.clear(device)
+
+
+user_cache = UserCache(
+    ttl=settings.user_cache_ttl,
+    max_devices=settings.user_cache_max_devices,
+    shared=SharedUserTables(str(Path(settings.data_dir) / 'users.sqlite3'))
+    if settings.coordinate_workers else None)
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+USER_FIELDS = ['uid', 'name', 'privilege', 'password', 'group_id', 'user_id', 'card']
+
+
+def user_to_dict(user) -> dict:
+    """Convert a pyzk user to a plain dict with the UserSettings fields."""
+    return {field: getattr(user, field) for field in USER_FIELDS}
+
+
+def parse_users_csv(text: str):
+    """Parse CSV text with the UserSettings columns.
+
+    Yields ``(line, user, error)`` per data row; ``user`` is a dict when the
+    row is valid, otherwise ``error`` says why it was rejected.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    missing = set(USER_FIELDS) - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+
+    for row in reader:
+        try:
+            user = {field: (row[field] or '').strip() for field in USER_FIELDS}
+            for field in ('uid', 'privilege', 'card'):
+                user[field] = int(user[field] or 0)
+            if not user['uid']:
+                raise ValueError("uid is required")
+            yield reader.line_num, user, None
+        except ValueError as e:
+            yield reader.line_num, None, str(e)
+
+
+def iter_users_csv(users):
+    """Yield the users as CSV text, one chunk per row, header first."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=USER_FIELDS)
+    writer.writeheader()
+    for user in users:
+        writer.writerow(user_to_dict(user))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_users_json(users):
+    """Yield the users as a JSON array, one chunk per user."""
+    yield '['
+    for i, user in enumerate(users):
+        yield (',' if i else '') + json.dumps(user_to_dict(user))
+    yield ']'
@@ -1,4 +1,10 @@
+from zk.user import User
 from app.zkteko.base import ZktekoBase
+from app.zkteko.user.user_cache import user_cache
+from app.zkteko.user.user_io import USER_FIELDS, user_to_dict
+from app.zkteko.user.template_store import template_store, diff_templates
+from app.core.metrics import timed, record_download
+from app.zkteko.executor import remaining_time
 
 
 class UserManager(ZktekoBase):
@@ -12,89 +18,225 @@ class UserManager(ZktekoBase):
         self.user_dict = {}
 
     def setup_user_dictionary(self):
-        """Create a user lookup dictionary with integer keys."""
-        try:
-            self.connect()
-            users = self.conn.get_users()
-            self.user_dict = {int(user.uid): user.name for user in users}
-            return self.user_dict
-        finally:
-            self.disconnect()
+        """Create a user lookup dictionary with integer keys, served from the user cache."""
+        names = user_cache.get_names(self.device_key)
+        if names is None:
+            users = self.get_all_users(refresh=True)
+            names = {int(user.uid): user.name for user in users}
+        self.user_dict = names
+        return self.user_dict
 
     def get_user_name(self, user_id: int) -> str:
         """Get user name by ID, returns 'Unknown' if not found."""
         return self.user_dict.get(user_id, 'Unknown')
 
-    def get_all_users(self):
-        """Get all users from the device."""
-        try:
-            self.connect()
-            return self.conn.get_users()
-        finally:
-            self.disconnect()
+    def get_all_users(self, refresh: bool = False):
+        """Get all users, from the user cache unless ``refresh`` is set or it has expired."""
+        if not refresh:
+            users = user_cache.get_users(self.device_key)
+            if users is not None:
+                return users
+
+        with timed('download_users', self.device_key), self.session(disable=True) as conn:
+            users = conn.get_users()
+        record_download(self.device_key, 'users', len(users))
+        user_cache.set_users(self.device_key, users)
+        return users
 
     def add_user(self, uid: int, name: str, privilege: int = 0, password: str = '',
                  group_id: str = '', user_id: str = '', card: int = 0):
         """Add a new user to the device."""
         try:
-            self.connect()
-            self.conn.set_user(uid=uid, name=name, privilege=privilege,
-                               password=password, group_id=group_id,
-                               user_id=user_id, card=card)
-            # Update local dictionary
+            with self.session(disable=True) as conn:
+                conn.set_user(uid=uid, name=name, privilege=privilege,
+                              password=password, group_id=group_id,
+                              user_id=user_id, card=card)
+            # Update local dictionary and the shared cache
             self.user_dict[uid] = name
+            user_cache.upsert_user(self.device_key, User(
+                uid, name, privilege, password, group_id, user_id, card))
             return True
         except Exception as e:
             print(f"Error adding user: {e}")
             return False
-        finally:
-            self.disconnect()
 
     def delete_user(self, uid: int):
         """Delete a user from the device."""
         try:
-            self.connect()
-            self.conn.delete_user(uid=uid)
-            # Update local dictionary
+            with self.session(disable=True) as conn:
+                conn.delete_user(uid=uid)
+            # Update local dictionary and the shared cache
             if uid in self.user_dict:
                 del self.user_dict[uid]
+            user_cache.remove_user(self.device_key, uid)
+            template_store.forget(self.device_key, uid)
             return True
         except Exception as e:
             print(f"Error deleting user: {e}")
             return False
-        finally:
-            self.disconnect()
 
-    def update_user(self, uid: int, name: str = "", privilege: int = 0,
-                    password: str = "", group_id: str = "", user_id: str = "", card: int = 0):
-        """Update user information."""
-        try:
-            self.connect()
-            # Get current user info
-            users = self.conn.get_users()
-            user = next((u for u in users if int(u.uid) == uid), None)
-
-            if user:
-
-                # Update only provided fields
-                new_name = name if name is not None else user.name
-                new_privilege = privilege if privilege is not None else user.privilege
-                new_password = password if password is not None else user.password
-
-                # Apply updates
-                self.conn.set_user(uid=uid, name=new_name,
-                                   privilege=new_privilege,
-                                   password=new_password,
-                                   group_id=group_id,
-                                   user_id=user_id,
-                                   card=card)
-
-                # Update local dictionary
-                self.user_dict[uid] = new_name
-                return True
-            return False
-        except Exception as e:
-            print(f"Error updating user: {e}")
-            return False
-        finally:
-            self.disconnect()
+    def apply_mutations(self, mutations: list) -> list:
+        """Apply queued user changes in one session and one disabled window.
+
+        Each ``set`` creates or updates a user in place and each ``delete``
+        removes one; failures are reported per mutation. Returns whether each
+        mutation was applied. Raises ConnectionError if the device is unreachable.
+        """
+        results = []
+        with self.session(disable=True) as conn:
+            for mutation in mutations:
+                try:
+                    if mutation.kind == 'delete':
+                        conn.delete_user(uid=mutation.uid)
+                        self.user_dict.pop(mutation.uid, None)
+                        user_cache.remove_user(self.device_key, mutation.uid)
+                        template_store.forget(self.device_key, mutation.uid)
+                    else:
+                        conn.set_user(uid=mutation.uid, **mutation.fields)
+                        self.user_dict[mutation.uid] = mutation.fields['name']
+                        user_cache.upsert_user(self.device_key, User(
+                            uid=mutation.uid, **mutation.fields))
+                    results.append(True)
+                except Exception as e:
+                    print(f"Error applying {mutation.kind} of user {mutation.uid}: {e}")
+                    results.append(False)
+        return results
+
+    def bulk_apply(self, upserts: list, deletes: list, dry_run: bool = False) -> list:
+        """Apply many user changes in one session and one disabled window.
+
+        ``upserts`` holds ``(row, user_dict)`` pairs that are created or
+        updated by uid, ``deletes`` holds ``(row, uid)`` pairs. The current
+        users are downloaded once to diff against; with ``dry_run`` only the
+        diff is reported. Returns one result dict per row.
+        """
+        results = []
+        with self.session(disable=not dry_run) as conn:
+            current = {int(user.uid): user for user in self.get_all_users(refresh=True)}
+
+            for row, user in upserts:
+                existing = current.get(user['uid'])
+                if existing is None:
+                    action = 'create'
+                    changes = {field: [None, user[field]] for field in USER_FIELDS}
+                else:
+                    old = user_to_dict(existing)
+                    changes = {field: [old[field], user[field]] for field in USER_FIELDS
+                               if str(old[field]) != str(user[field])}
+                    action = 'update' if changes else 'unchanged'
+                result = {'row': row, 'uid': user['uid'], 'action': action,
+                          'ok': True, 'changes': changes, 'error': None}
+
+                if not dry_run and action != 'unchanged':
+                    try:
+                        conn.set_user(**user)
+                        new_user = User(**user)
+                        current[user['uid']] = new_user
+                        user_cache.upsert_user(self.device_key, new_user)
+                    except Exception as e:
+                        result.update(ok=False, error=str(e))
+                results.append(result)
+
+            for row, uid in deletes:
+                if uid not in current:
+                    results.append({'row': row, 'uid': uid, 'action': 'missing',
+                                    'ok': False, 'changes': {}, 'error': 'User not found'})
+                    continue
+                result = {'row': row, 'uid': uid, 'action': 'delete', 'ok': True,
+                          'changes': {}, 'error': None}
+                if not dry_run:
+                    try:
+                        conn.delete_user(uid=uid)
+                        del current[uid]
+                        user_cache.remove_user(self.device_key, uid)
+                        template_store.forget(self.device_key, uid)
+                    except Exception as e:
+                        result.update(ok=False, error=str(e))
+                results.append(result)
+
+        return results
+
+    def export_templates(self):
+        """Download the users and fingerprint templates of the device.
+
+        The templates replace the device's listing in the template store.
+        Returns ``(users, fingers)``.
+        """
+        with self.session(disable=True) as conn:
+            users = self.get_all_users(refresh=True)
+            with timed('download_templates', self.device_key):
+                fingers = conn.get_templates()
+        record_download(self.device_key, 'templates', len(fingers))
+        template_store.save_snapshot(self.device_key, fingers)
+        return users, fingers
+
+    def import_templates(self, image: dict, prune: bool = False, refresh: bool = False,
+                         progress=None) -> dict:
+        """Push the templates of ``image`` that the device does not hold yet.
+
+        ``image`` maps user IDs to ``(user, fingers)`` (see ``diff_templates``).
+        The device's templates are compared with its listing in the template
+        store, which is downloaded first if missing or if ``refresh`` is set.
+        With ``prune``, templates of these users absent from ``image`` are
+        deleted. ``progress(event)`` is called with a ``planned`` event and a
+        ``progress`` event per user pushed or template deleted. Under a
+        ``device_deadline`` the push stops between users once it passes, and
+        the device is re-enabled. Returns the counts for a
+        ``DeviceTemplateResult``. Raises ConnectionError if the device is
+        unreachable.
+        """
+        progress = progress or (lambda event: None)
+        with self.session(disable=True) as conn:
+            target_users = self.get_all_users(refresh=True)
+            listing = None if refresh else template_store.listing(self.device_key)
+            if listing is None:
+                with timed('download_templates', self.device_key):
+                    fingers = conn.get_templates()
+                record_download(self.device_key, 'templates', len(fingers))
+                template_store.save_snapshot(self.device_key, fingers)
+                listing = template_store.listing(self.device_key)
+
+            pushes, prunes, unchanged, conflicts = diff_templates(
+                image, target_users, listing, prune=prune)
+            existing = {int(user.uid) for user in target_users}
+            result = {'users': len(image), 'pushed': 0, 'templates': 0,
+                      'unchanged': unchanged, 'pruned': 0, 'failed': len(conflicts),
+                      'stopped': False,
+                      'errors': [f"User {user_id}: uid taken by another user on the device"
+                                 for user_id in conflicts]}
+            total = len(pushes) + len(prunes)
+            progress({'event': 'planned', 'total': total, 'unchanged': unchanged,
+                      'conflicts': len(conflicts)})
+
+            steps = [('push', step) for step in pushes] + [('prune', step) for step in prunes]
+            for done, (kind, step) in enumerate(steps, start=1):
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 0:
+                    result['stopped'] = True
+                    result['errors'].append(
+                        f"Deadline reached; {total - done + 1} of {total} changes not applied")
+                    break
+                if kind == 'push':
+                    user, fingers = step
+                    try:
+                        conn.save_user_template(user, fingers)
+                        template_store.record(self.device_key, fingers)
+                        if int(user.uid) not in existing:
+                            self.user_dict[int(user.uid)] = user.name
+                            user_cache.upsert_user(self.device_key, user)
+                        result['pushed'] += 1
+                        result['templates'] += len(fingers)
+                    except Exception as e:
+                        result['failed'] += 1
+                        result['errors'].append(f"User {user.user_id}: {e}")
+                else:
+                    uid, fid = step
+                    if conn.delete_user_template(uid=uid, temp_id=fid):
+                        template_store.forget(self.device_key, uid, fid)
+                        result['pruned'] += 1
+                    else:
+                        result['failed'] += 1
+                        result['errors'].append(f"uid {uid}: could not delete finger {fid}")
+                progress({'event': 'progress', 'done': done, 'total': total,
+                          'failed': result['failed']})
+        return result
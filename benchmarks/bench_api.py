@@ -0,0 +1,161 @@
+"""End-to-end API benchmarks against the simulated device.
+
+Starts a simulated terminal and the API server in-process, then measures
+/get_attendance, /get_users and /bulk_users::
+
+    python -m benchmarks.bench_api --punches 1000 100000 --output report.json
+
+The report lists, per scenario and endpoint, request throughput, p50/p99
+latency and the peak RSS of the process after the run.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# The punch store lives under the data directory, which is read at import time
+os.environ.setdefault('ZKTECO_DATA_DIR', tempfile.mkdtemp(prefix='zk-bench-'))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.zkteko.simulator import SimulatedDevice, generate_punches, generate_users  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(name: str, send, iterations: int) -> dict:
+    """Call ``send(i)`` ``iterations`` times and summarise the latencies."""
+    latencies = []
+    response_bytes = 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        response = send(i)
+        latencies.append(time.perf_counter() - t0)
+        response.raise_for_status()
+        response_bytes += len(response.content)
+    elapsed = time.perf_counter() - start
+    return {
+        'endpoint': name,
+        'requests': iterations,
+        'throughput_rps': iterations / elapsed if elapsed else None,
+        'latency_ms': {
+            'first': latencies[0] * 1000,
+            'p50': percentile(latencies, 50) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'mean': statistics.fmean(latencies) * 1000
+        },
+        'response_bytes': response_bytes // iterations,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def start_server(port: int) -> uvicorn.Server:
+    """Run the API with uvicorn in a background thread."""
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def run_scenario(client: httpx.Client, punches: int, args) -> dict:
+    """Benchmark every endpoint against a fresh device holding ``punches`` punches."""
+    users = generate_users(args.users)
+    device = SimulatedDevice(users=users, punches=generate_punches(punches, users),
+                             latency=args.latency, loss=args.loss)
+    port = device.serve(udp=args.udp)
+    device_settings = {'ip': '127.0.0.1', 'port': port, 'force_udp': args.udp,
+                       'ommit_ping': True, 'timeout': 30}
+    results = []
+    try:
+        # The first request downloads from the device; the rest hit the local store
+        results.append(measure('/get_attendance', lambda i: client.post(
+            '/get_attendance', json={'device_settings': device_settings}), args.iterations))
+        results.append(measure('/get_users', lambda i: client.post(
+            '/get_users', json=device_settings), args.iterations))
+
+        def bulk_write(i):
+            rows = [{'uid': uid, 'name': f"Bulk {i} {uid}", 'privilege': 0, 'password': '',
+                     'group_id': '', 'user_id': str(uid), 'card': 0}
+                    for uid in range(1, args.bulk_users + 1)]
+            return client.post('/bulk_users', json={'device_settings': device_settings,
+                                                    'bulk_settings': {'users': rows}})
+
+        results.append(measure('/bulk_users', bulk_write, args.iterations))
+    finally:
+        device.stop()
+
+    return {
+        'punches': punches,
+        'users': args.users,
+        'device_commands': device.commands,
+        'device_bytes_sent': device.bytes_sent,
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against a simulated device")
+    parser.add_argument('--punches', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--bulk-users', type=int, default=50,
+                        help="Users written per /bulk_users request")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Simulated device latency per response, in seconds")
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help="Simulated response loss probability")
+    parser.add_argument('--udp', action='store_true', help="Talk to the device over UDP")
+    parser.add_argument('--api-port', type=int, default=8765)
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    server = start_server(args.api_port)
+    scenarios = []
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.api_port}", timeout=600) as client:
+            for punches in args.punches:
+                print(f"Benchmarking {punches} punches...", file=sys.stderr)
+                scenarios.append(run_scenario(client, punches, args))
+    finally:
+        server.should_exit = True
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+        'scenarios': scenarios
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
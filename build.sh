@@ -3,4 +3,6 @@
 cd frontend
 bun i
 bun run build
-cp -av static ../static
\ No newline at end of file
+cp -av static ../static
+cd ..
+python -m app.api.frontend static
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep the local stores of imported singletons out of the working directory
+os.environ.setdefault("ZKTECO_DATA_DIR", tempfile.mkdtemp(prefix="zkteco-tests-"))
@@ -0,0 +1,121 @@
+import random
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+import pytest
+from zk.attendance import Attendance
+
+from app.zkteko.attendance.attendance_processor import AttendanceProcessor
+
+
+NAMES = {1: 'Alice', 2: 'Bob', 3: 'Carol', 4: 'Dave'}
+
+
+def reference_records(processor, attendances):
+    """The per-person-day mask and ``iterrows`` implementation the bucketed pass replaced."""
+    allAttendances = []
+    daily_punches = {}
+    for attendance in attendances:
+        user_id = int(attendance.user_id)
+        name = processor.user_manager.get_user_name(user_id)
+        date = attendance.timestamp.strftime('%Y-%m-%d')
+        human_readable_date = processor.format_date_human_readable(date)
+        time_str = attendance.timestamp.strftime('%I:%M %p')
+        punch_time = attendance.timestamp.time()
+        person_day_key = (name, date)
+        if person_day_key not in daily_punches:
+            daily_punches[person_day_key] = {
+                'first_punch': punch_time,
+                'last_punch': punch_time,
+                'human_readable_date': human_readable_date
+            }
+        else:
+            if punch_time < daily_punches[person_day_key]['first_punch']:
+                daily_punches[person_day_key]['first_punch'] = punch_time
+            if punch_time > daily_punches[person_day_key]['last_punch']:
+                daily_punches[person_day_key]['last_punch'] = punch_time
+        allAttendances.append({
+            'uid': attendance.user_id,
+            'name': name,
+            'date': date,
+            'human_readable_date': human_readable_date,
+            'time': time_str,
+            'punch_time': punch_time
+        })
+
+    df = pd.DataFrame(allAttendances)
+    processed_records = []
+    for (name, date), punches in daily_punches.items():
+        first_punch = punches['first_punch']
+        last_punch = punches['last_punch']
+        is_late = first_punch > processor.grace_start
+        left_early = last_punch < processor.grace_end
+        day_records = df[(df['name'] == name) & (
+            df['date'] == date)].sort_values('punch_time')
+        for _, record in day_records.iterrows():
+            processed_records.append({
+                'uid': record['uid'],
+                'name': name,
+                'date': punches['human_readable_date'],
+                'time': record['time'],
+                'is_late_arrival': is_late,
+                'is_early_departure': left_early,
+                'first_punch': first_punch.strftime('%I:%M %p'),
+                'last_punch': last_punch.strftime('%I:%M %p')
+            })
+    return pd.DataFrame(processed_records)
+
+
+def make_punches(seed: int, days: int = 6, per_day: int = 4) -> list:
+    """Several punches per user and day with distinct times, shuffled."""
+    rng = random.Random(seed)
+    punches = []
+    for day in range(days):
+        start = datetime(2024, 3, 1) + timedelta(days=day)
+        for user_id in NAMES:
+            seconds = rng.sample(range(6 * 3600, 20 * 3600), per_day)
+            punches.extend(Attendance(str(user_id), start + timedelta(seconds=s), 1, 0, user_id)
+                           for s in seconds)
+    # An unknown user and a user punching once on a day
+    punches.append(Attendance('9', datetime(2024, 3, 2, 9, 45), 1, 0, 9))
+    punches.append(Attendance('1', datetime(2024, 3, 9, 8, 59), 1, 0, 1))
+    rng.shuffle(punches)
+    return punches
+
+
+def make_processor(**kwargs) -> AttendanceProcessor:
+    processor = AttendanceProcessor(ip='127.0.0.1', **kwargs)
+    processor.user_manager.user_dict = dict(NAMES)
+    return processor
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('rules', [
+    {},
+    {'office_start': time(8, 30), 'office_end': time(18, 0), 'grace_period': 10},
+])
+def test_records_match_reference(seed, rules):
+    processor = make_processor(**rules)
+    punches = make_punches(seed)
+
+    expected = reference_records(processor, punches)
+    actual = processor.create_attendance_records(processor.collect_punches(punches))
+
+    assert actual.to_dict('records') == expected.to_dict('records')
+
+
+def test_summary_matches_reference():
+    processor = make_processor()
+    punches = make_punches(3)
+
+    expected = processor.create_daily_summary(reference_records(processor, punches))
+    actual = processor.create_daily_summary(
+        processor.create_attendance_records(processor.collect_punches(punches)))
+
+    assert actual.to_dict('records') == expected.to_dict('records')
+
+
+def test_empty_log():
+    processor = make_processor()
+    records = processor.create_attendance_records(processor.collect_punches([]))
+    assert records.empty